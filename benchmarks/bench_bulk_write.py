@@ -0,0 +1,106 @@
+"""Benchmark of the Lufthansa flights writers.
+
+Compares the former one `replace_one` per flight loop with the
+`bulk_upsert_flights` pipeline, in documents per second.
+
+Usage: $ python benchmarks/bench_bulk_write.py [--mongo-uri URI]
+
+Without `--mongo-uri` the benchmark runs against mongomock
+(`pip install mongomock`), which has no network round trip : use a local
+mongod to measure the real gain.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import utils  # noqa: E402
+
+
+def make_flights(n: int) -> list:
+    """returns n fake flights shaped like the Lufthansa CFI response"""
+
+    return [
+        {
+            "OperatingCarrier": {
+                "AirlineID": "LH",
+                "FlightNumber": str(1000 + i),
+            },
+            "Departure": {
+                "AirportCode": "FRA",
+                "Scheduled": {"Date": "2023-01-01", "Time": "08:00"},
+                "Terminal": {"Name": "1", "Gate": "A01"},
+            },
+            "Arrival": {
+                "AirportCode": "CDG",
+                "Scheduled": {"Date": "2023-01-01", "Time": "09:15"},
+            },
+            "Status": {"Code": "OT", "Description": "Flight On Time"},
+        }
+        for i in range(n)
+    ]
+
+
+def replace_one_loop(col, flights: list) -> None:
+    """former writer : one round trip per flight"""
+
+    for flight in flights:
+        col.replace_one(utils.flight_filter(flight), flight, upsert=True)
+
+
+def get_collection(mongo_uri: str):
+    """returns an empty benchmark collection"""
+
+    if mongo_uri:
+        from pymongo import MongoClient
+
+        client = MongoClient(mongo_uri)
+    else:
+        import mongomock
+
+        client = mongomock.MongoClient()
+
+    col = client.flightTrackerBenchmark.flights
+    col.drop()
+    return col
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-uri", default="")
+    parser.add_argument("--flights", type=int, default=100)
+    parser.add_argument("--airports", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    # one payload per airport, flights of several airports overlap
+    payloads = [make_flights(args.flights) for _ in range(args.airports)]
+    n_docs = args.flights * args.airports
+
+    print(f"{'writer':<25}{'documents':>12}{'seconds':>12}{'docs/s':>12}")
+    for name, writer in [
+        ("replace_one loop", replace_one_loop),
+        (
+            "bulk_upsert_flights",
+            lambda col, flights: utils.bulk_upsert_flights(
+                col, flights, args.batch_size
+            ),
+        ),
+    ]:
+        col = get_collection(args.mongo_uri)
+        start = time.perf_counter()
+        for flights in payloads:
+            writer(col, flights)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<25}{n_docs:>12}{elapsed:>12.3f}"
+            f"{n_docs / elapsed:>12.0f}"
+        )
+        col.drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Benchmark of the board, route and flights reads.
+
+Compares the former reads, which fetch whole Lufthansa documents and
+reshape them in Python with per-row reference lookups, with the
+aggregation pipelines returning flat rows. Reports the BSON bytes
+returned by the server and the time to get the DataFrame.
+
+Usage: $ python benchmarks/bench_flight_reads.py [--mongo-uri URI]
+
+Without `--mongo-uri` the benchmark runs against mongomock, which has
+no network transfer : the bytes are the same, the times are not.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import bson
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import mongo  # noqa: E402
+import utils  # noqa: E402
+from bench_bulk_write import make_flights  # noqa: E402
+
+AIRPORTS = ["FRA", "MUC", "CDG", "JFK", "LHR", "VIE", "ZRH", "BRU"]
+
+
+def make_documents(n: int) -> list:
+    """returns n flights with the nested fields of the CFI documents"""
+
+    flights = make_flights(n)
+    for i, flight in enumerate(flights):
+        flight["Departure"]["AirportCode"] = AIRPORTS[i % 2]
+        flight["Arrival"]["AirportCode"] = AIRPORTS[2 + i % 6]
+        flight["Departure"]["Actual"] = {"Date": "2023-01-01", "Time": "08:05"}
+        flight["Departure"]["Status"] = {
+            "Code": "DP",
+            "Description": "Departed",
+        }
+        flight["Arrival"]["Estimated"] = {
+            "Date": "2023-01-01",
+            "Time": "09:10",
+        }
+        flight["Arrival"]["Terminal"] = {"Name": "2", "Gate": "E12"}
+        flight["MarketingCarrierList"] = {
+            "MarketingCarrier": [
+                {"AirlineID": "UA", "FlightNumber": str(9000 + i)},
+                {"AirlineID": "AC", "FlightNumber": str(7000 + i)},
+            ]
+        }
+        flight["Equipment"] = {"AircraftCode": "32N", "AircraftRegistration": "DAINA"}  # fmt: skip
+    return flights
+
+
+def legacy_arrivals(db, airport: str) -> tuple:
+    """former get_arrivals : whole documents"""
+
+    docs = list(
+        db.flights.find(
+            filter={"Arrival.AirportCode": airport},
+            sort=[("Arrival.Scheduled.Time", 1)],
+        )
+    )
+    data = []
+    for x in docs:
+        try:
+            actual = x["Arrival"]["Actual"]["Time"]
+        except KeyError:
+            actual = ""
+        data.append(
+            [
+                x["Arrival"]["Scheduled"]["Time"],
+                actual,
+                x["OperatingCarrier"]["AirlineID"],
+                x["OperatingCarrier"]["AirlineID"] + x["OperatingCarrier"]["FlightNumber"],  # fmt: skip
+                x["Status"]["Description"],
+                x["Departure"]["AirportCode"],
+            ]
+        )
+    columns = ["Scheduled", "Actual", "Carrier", "Flight", "Status", "Origin"]
+    return docs, pd.DataFrame(data, columns=columns)
+
+
+def legacy_routes(db, dep: str, arr: str) -> tuple:
+    """former get_routes : whole documents and per-row name lookups"""
+
+    docs = list(
+        db.flights.find(
+            {"Departure.AirportCode": dep, "Arrival.AirportCode": arr}
+        )
+    )
+    data = []
+    for x in docs:
+        airline_iata = x["OperatingCarrier"]["AirlineID"]
+        dep_infos = utils.get_airport_infos(x["Departure"]["AirportCode"])
+        arr_infos = utils.get_airport_infos(x["Arrival"]["AirportCode"])
+        data.append(
+            [
+                utils.get_airline_from_iata(airline_iata),
+                airline_iata + x["OperatingCarrier"]["FlightNumber"],
+                dep_infos[0],
+                arr_infos[0],
+                x["Status"]["Description"],
+            ]
+        )
+    columns = [
+        "airline_name",
+        "flight",
+        "dep_airport",
+        "arr_airport",
+        "status",
+    ]
+    return docs, pd.DataFrame(data, columns=columns)
+
+
+def legacy_all_flights(db) -> tuple:
+    """former get_all_flights : whole documents and per-row name lookups"""
+
+    docs = list(db.flights.find({}))
+    data = []
+    for x in docs:
+        data.append(
+            [
+                utils.get_airport_infos(x["Departure"]["AirportCode"])[0],
+                x["Departure"]["AirportCode"],
+                utils.get_airport_infos(x["Arrival"]["AirportCode"])[0],
+                x["Arrival"]["AirportCode"],
+                utils.get_airline_from_iata(
+                    x["OperatingCarrier"]["AirlineID"]
+                ),
+                x["Status"]["Description"],
+            ]
+        )
+    columns = ["departure", "dep_iata", "arrival", "arr_iata", "carrier", "status"]  # fmt: skip
+    return docs, pd.DataFrame(data, columns=columns)
+
+
+def pipeline_read(read):
+    """returns a read of the pipelines, with the rows sent by the server"""
+
+    def run(db, *args):
+        df = read(*args)
+        return df.to_dict("records"), df
+
+    return run
+
+
+def get_db(mongo_uri: str):
+    """returns an empty benchmark database"""
+
+    if mongo_uri:
+        from pymongo import MongoClient
+
+        client = MongoClient(mongo_uri)
+    else:
+        import mongomock
+
+        client = mongomock.MongoClient()
+
+    client.drop_database("flightTrackerBenchmark")
+    return client.flightTrackerBenchmark
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-uri", default="")
+    parser.add_argument("--flights", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db = get_db(args.mongo_uri)
+    # the reads of utils use the benchmark database
+    mongo.get_db = lambda: db
+
+    utils.bulk_upsert_flights(
+        db.flights, make_documents(args.flights), view_col=db.flights_view
+    )
+
+    reads = [
+        ("arrivals", "legacy", legacy_arrivals, ["CDG"]),
+        ("arrivals", "pipeline", pipeline_read(utils.get_arrivals), ["CDG"]),
+        (
+            "page",
+            "pipeline",
+            pipeline_read(
+                lambda airport: utils.get_airport_board(
+                    "arrivals", airport, page_size=10
+                )[0]
+            ),
+            ["CDG"],
+        ),
+        ("routes", "legacy", legacy_routes, ["FRA", "CDG"]),
+        ("routes", "pipeline", pipeline_read(utils.get_routes), ["FRA", "CDG"]),  # fmt: skip
+        ("all flights", "legacy", legacy_all_flights, []),
+        ("all flights", "pipeline", pipeline_read(utils.get_all_flights), []),  # fmt: skip
+    ]
+
+    print(f"{'read':<14}{'version':<10}{'rows':>8}{'bytes':>12}{'ms':>10}")
+    for name, version, read, read_args in reads:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            docs, df = read(db, *read_args)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        size = sum(len(bson.encode(doc)) for doc in docs)
+        print(
+            f"{name:<14}{version:<10}{len(df):>8}{size:>12}"
+            f"{elapsed * 1000:>10.1f}"
+        )
+
+    db.client.drop_database("flightTrackerBenchmark")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Micro-benchmark of the airplane lookup of the hover callback.
+
+Compares the former boolean scan of the snapshot dataframe with the
+callsign index of the snapshot, per hover event.
+
+Usage: $ python benchmarks/bench_hover.py [--airplanes N] [--hovers N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import utils  # noqa: E402
+from snapshot_store import Snapshot  # noqa: E402
+
+
+def make_response(n: int) -> dict:
+    """returns a fake opensky response with n airplanes"""
+
+    rng = random.Random(0)
+    now = int(time.time())
+    states = [
+        [
+            f"{i:06x}",
+            f"CS{i:05d}  ",
+            rng.choice(["France", "Germany", "United States"]),
+            now - 5,
+            now,
+            rng.uniform(-180, 180),
+            rng.uniform(-85, 85),
+            rng.uniform(0, 12000),
+            False,
+            rng.uniform(0, 250),
+            rng.uniform(0, 360),
+            rng.uniform(-10, 10),
+            None,
+            rng.uniform(0, 12000),
+            "1000",
+            False,
+            0,
+        ]
+        for i in range(n)
+    ]
+    return {"time": now, "states": states}
+
+
+def hover_scan(df, callsign: str) -> tuple:
+    """former hover lookup"""
+
+    row = df.loc[(df.callsign == callsign), :]
+    return row.lat, row.long, row.origin_country, row.baro_altitude, row.velocity  # fmt: skip
+
+
+def hover_index(snapshot: Snapshot, callsign: str) -> tuple:
+    """hover lookup with the callsign index"""
+
+    row = snapshot.lookup(callsign)
+    return row["lat"], row["long"], row["origin_country"], row["baro_altitude"], row["velocity"]  # fmt: skip
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--airplanes", type=int, default=10000)
+    parser.add_argument("--hovers", type=int, default=1000)
+    args = parser.parse_args()
+
+    df = utils.get_opensky_df(make_response(args.airplanes))
+
+    start = time.perf_counter()
+    snapshot = Snapshot.build(1, df)
+    build = time.perf_counter() - start
+    print(
+        f"index build for {args.airplanes} airplanes : {build * 1000:.2f} ms"
+    )
+
+    callsigns = random.Random(1).choices(df.callsign.tolist(), k=args.hovers)
+
+    print(f"{'lookup':<20}{'hovers':>10}{'us/hover':>12}")
+    for name, lookup, data in [
+        ("dataframe scan", hover_scan, df),
+        ("callsign index", hover_index, snapshot),
+    ]:
+        start = time.perf_counter()
+        for callsign in callsigns:
+            lookup(data, callsign)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<20}{args.hovers:>10}{elapsed / args.hovers * 1e6:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark of the map payload sent on each refresh.
+
+Compares the full figure rebuilt by `add_flights_on_map` with the patch
+of the airplanes trace, with plain and compact (typed arrays) encoding.
+Reports the raw, gzip and brotli sizes in bytes and the encoding time.
+
+Usage: $ python benchmarks/bench_map_payload.py [--airplanes N]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import brotli
+
+import plotly.graph_objs as go
+from dash import Patch
+from plotly.utils import PlotlyJSONEncoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import utils  # noqa: E402
+from bench_hover import make_response  # noqa: E402
+
+
+def full_figure(df):
+    """former payload : the whole figure"""
+
+    return utils.add_flights_on_map(go.Figure(), df)
+
+
+def flights_patch(df):
+    """payload of a refresh : the arrays of the airplanes trace"""
+
+    patch = Patch()
+    patch["data"][0].update(utils.flights_marker_data(df))
+    return patch
+
+
+def compact_patch(df):
+    """payload of a refresh with MAP_COMPACT_ENCODING"""
+
+    patch = Patch()
+    patch["data"][0].update(utils.flights_marker_data(df, compact=True))
+    return patch
+
+
+def encode(payload):
+    """serialize a payload the way dash does"""
+
+    if isinstance(payload, Patch):
+        payload = payload.to_plotly_json()
+    return json.dumps(payload, cls=PlotlyJSONEncoder).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--airplanes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    df = utils.get_opensky_df(make_response(args.airplanes))
+
+    print(
+        f"{'payload':<16}{'airplanes':>10}{'bytes':>10}{'gzip':>10}"
+        f"{'brotli':>10}{'ms':>8}"
+    )
+    for name, build in [
+        ("full figure", full_figure),
+        ("patch", flights_patch),
+        ("patch compact", compact_patch),
+    ]:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            body = encode(build(df))
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(
+            f"{name:<16}{args.airplanes:>10}{len(body):>10}"
+            f"{len(gzip.compress(body)):>10}"
+            f"{len(brotli.compress(body, quality=4)):>10}"
+            f"{elapsed * 1000:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark of the decoding of a full-world OpenSky snapshot.
+
+Compares, per snapshot, the former decoding (the whole body parsed into
+a list of lists, then copied into an object matrix) with the decoding of
+the states into column arrays by opensky_states, from a json parse or
+streamed by ijson. Reports the wall time to get the dataframe and the
+peak memory allocated meanwhile (tracemalloc, the body excluded).
+
+Usage: $ python benchmarks/bench_opensky_decode.py [--airplanes N [N ...]]
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import opensky_states  # noqa: E402
+import utils  # noqa: E402
+from bench_hover import make_response  # noqa: E402
+
+
+def legacy_decode(body: bytes) -> pd.DataFrame:
+    """former requests `.json()` and get_opensky_df"""
+
+    states = json.loads(body.decode("utf-8"))["states"] or []
+    matrix = np.empty((len(states), len(opensky_states.OPENSKY_DTYPES)), dtype=object)  # fmt: skip
+    if states:
+        matrix[:] = states
+
+    data = {}
+    for i, (name, dtype) in enumerate(opensky_states.OPENSKY_DTYPES.items()):
+        values = matrix[:, i]
+        if dtype == "str":
+            data[name] = np.where(pd.isna(values), "", values)
+        elif dtype == "object":
+            data[name] = values
+        elif dtype == "category":
+            data[name] = pd.Categorical(values)
+        elif dtype in ("Int64", "Int8"):
+            data[name] = pd.array(values.astype("float64"), dtype=dtype)
+        elif dtype == "bool":
+            data[name] = values.astype(bool)
+        else:
+            data[name] = values.astype("float64").astype(dtype)
+
+    return pd.DataFrame(data)
+
+
+def json_decode(body: bytes) -> pd.DataFrame:
+    """column decoding without ijson"""
+
+    ijson = opensky_states.ijson
+    opensky_states.ijson = None
+    try:
+        states = opensky_states.from_stream(io.BytesIO(body))
+    finally:
+        opensky_states.ijson = ijson
+    return utils.get_opensky_df(states)
+
+
+def stream_decode(body: bytes) -> pd.DataFrame:
+    """column decoding streamed by ijson"""
+
+    states = opensky_states.from_stream(io.BytesIO(body))
+    return utils.get_opensky_df(states)
+
+
+def measure(decoder, body: bytes, repeat: int) -> tuple:
+    """returns the average time in ms and the peak memory in MB"""
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decoder(body)
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+
+    gc.collect()
+    tracemalloc.start()
+    decoder(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak / 1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--airplanes", type=int, nargs="+", default=[1000, 10000, 20000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    decoders = [("legacy", legacy_decode), ("json columns", json_decode)]
+    if opensky_states.ijson is not None:
+        decoders.append(("ijson stream", stream_decode))
+    else:
+        print("ijson is not installed, the stream decoding is skipped")
+
+    print(f"{'decoder':<16}{'airplanes':>10}{'body MB':>10}{'ms':>10}{'peak MB':>10}")  # fmt: skip
+    for n in args.airplanes:
+        body = json.dumps(make_response(n)).encode()
+        for name, decoder in decoders:
+            elapsed, peak = measure(decoder, body, args.repeat)
+            print(
+                f"{name:<16}{n:>10}{len(body) / 1024**2:>10.1f}"
+                f"{elapsed:>10.1f}{peak:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
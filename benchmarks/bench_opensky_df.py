@@ -0,0 +1,66 @@
+"""Benchmark of the OpenSky dataframe decoding.
+
+Compares the former `get_opensky_df` (object columns filled with "NaN"
+strings) with the typed columnar decoder, in decode time and memory.
+
+Usage: $ python benchmarks/bench_opensky_df.py [--snapshot FILE] [--airplanes N]
+
+FILE is a recorded response of the OpenSky `states/all` endpoint. Without
+it, a synthetic full-world snapshot of N airplanes is used.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import opensky_states  # noqa: E402
+import utils  # noqa: E402
+from bench_hover import make_response  # noqa: E402
+
+
+def legacy_opensky_df(response: dict) -> pd.DataFrame:
+    """former get_opensky_df"""
+
+    df = pd.DataFrame(
+        response["states"], columns=list(opensky_states.OPENSKY_DTYPES)
+    )
+    df.true_track = df.true_track.fillna(0)
+    df = df.fillna("NaN")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", default="")
+    parser.add_argument("--airplanes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        with open(args.snapshot) as f:
+            response = json.load(f)
+    else:
+        response = make_response(args.airplanes)
+    n = len(response["states"])
+
+    print(f"{'decoder':<20}{'airplanes':>10}{'ms':>10}{'memory (kB)':>14}")
+    for name, decoder in [
+        ("legacy", legacy_opensky_df),
+        ("typed columns", utils.get_opensky_df),
+    ]:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            df = decoder(response)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        memory = df.memory_usage(deep=True).sum() / 1024
+        print(f"{name:<20}{n:>10}{elapsed * 1000:>10.1f}{memory:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
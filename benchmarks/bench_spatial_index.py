@@ -0,0 +1,108 @@
+"""Benchmark of the spatial index of the airplanes.
+
+Compares the grid index queries with a full scan of the positions, for
+a viewport bounding box, a 200 km radius and the 10 nearest airplanes.
+
+Usage: $ python benchmarks/bench_spatial_index.py [--airplanes N [N ...]]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from spatial_index import GridIndex, haversine  # noqa: E402
+
+BOX = (-5.0, 42.0, 10.0, 52.0)
+POINT = (2.35, 48.85)
+
+
+def make_positions(n: int, rng) -> tuple:
+    """returns n positions, denser over Europe and North America"""
+
+    lon = np.concatenate(
+        [
+            rng.normal(5, 12, n // 3),
+            rng.normal(-90, 15, n // 3),
+            rng.uniform(-180, 180, n - 2 * (n // 3)),
+        ]
+    )
+    lat = np.concatenate(
+        [
+            rng.normal(48, 6, n // 3),
+            rng.normal(38, 8, n // 3),
+            rng.uniform(-60, 70, n - 2 * (n // 3)),
+        ]
+    )
+    return (lon + 180) % 360 - 180, np.clip(lat, -90, 90)
+
+
+def scan_bbox(lon, lat):
+    lon_min, lat_min, lon_max, lat_max = BOX
+    return np.flatnonzero(
+        (lon >= lon_min)
+        & (lon <= lon_max)
+        & (lat >= lat_min)
+        & (lat <= lat_max)
+    )
+
+
+def scan_radius(lon, lat):
+    return np.flatnonzero(haversine(lon, lat, *POINT) <= 200)
+
+
+def scan_nearest(lon, lat):
+    return np.argsort(haversine(lon, lat, *POINT))[:10]
+
+
+def timed(func, repeat: int) -> float:
+    """returns the average time of func in ms"""
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--airplanes", type=int, nargs="+", default=[10000, 50000, 100000]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    print(f"{'query':<12}{'airplanes':>10}{'scan ms':>10}{'grid ms':>10}")
+    for n in args.airplanes:
+        lon, lat = make_positions(n, rng)
+        grid = GridIndex(lon, lat)
+
+        results = [
+            (
+                "bbox",
+                timed(lambda: scan_bbox(lon, lat), args.repeat),
+                timed(lambda: grid.bbox(*BOX), args.repeat),
+            ),
+            (
+                "radius",
+                timed(lambda: scan_radius(lon, lat), args.repeat),
+                timed(lambda: grid.radius(*POINT, 200), args.repeat),
+            ),
+            (
+                "nearest",
+                timed(lambda: scan_nearest(lon, lat), args.repeat),
+                timed(lambda: grid.nearest(*POINT, k=10), args.repeat),
+            ),
+        ]
+        for name, scan, indexed in results:
+            print(f"{name:<12}{n:>10}{scan:>10.3f}{indexed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
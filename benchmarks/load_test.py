@@ -0,0 +1,454 @@
+"""Load test of the Dash callbacks with many concurrent sessions.
+
+Runs the app in a server process fed by the replay server, and simulates
+dashboard sessions sending their callbacks to `/_dash-update-component`
+as the browser does :
+- interval : every map interval, the last update, map and nearby
+  airplanes callbacks
+- hover : the hover callback on a random airplane
+- click : the click callback on a random airplane
+- submit : the airport and route panels, then the boards of the airport
+
+Hovers, clicks and submits are sent at random times at their rate per
+session, and the events are not delayed by slow responses, so that an
+overloaded server gets late instead of receiving less requests.
+
+Reports for each number of sessions the p50, p95 and p99 latency of each
+event (its callbacks being sent as by the browser), the throughput, the
+share of the interval events taking longer than the map interval, and the
+CPU and maximum resident memory of the server process.
+
+Usage: $ python benchmarks/load_test.py [--sessions N [N ...]] [--duration S]
+                                        [--airplanes N] [--url URL --pid PID]
+                                        [--output FILE]
+
+Without `--url`, the server process uses mongomock unless `--mongo-uri`
+is set, and doesn't write the positions of the airplanes. With `--url`,
+the app must already run against the replay server (see
+replay_server.py), and its CPU and memory are only sampled with `--pid`.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import constants as c  # noqa: E402
+from bench_flight_reads import AIRPORTS, make_documents  # noqa: E402
+from bench_hover import make_response  # noqa: E402
+from replay import callback_payload, find_dependency  # noqa: E402
+from replay_server import ReplayServer, load_opensky  # noqa: E402
+
+EVENTS = ["interval", "hover", "click", "submit"]
+
+
+class ProcessSampler:
+    """
+    CPU time and resident memory of a process, read from /proc
+
+    Parameters:
+    -----------
+        pid         : process id
+    """
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.max_rss = 0.0
+        self._start = (self.cpu_time(), time.perf_counter())
+
+    def cpu_time(self) -> float:
+        """returns the user and system CPU time of the process, in s"""
+
+        with open(f"/proc/{self.pid}/stat") as f:
+            # the command name may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss(self) -> float:
+        """returns the resident memory of the process, in MB"""
+
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    def sample(self) -> None:
+        self.max_rss = max(self.max_rss, self.rss())
+
+    def cpu_percent(self) -> float:
+        """returns the CPU used since the creation of the sampler, in %"""
+
+        cpu, start = self._start
+        return 100 * (self.cpu_time() - cpu) / (time.perf_counter() - start)
+
+
+def serve(port: int, replay_url: str, mongo_uri: str, flights: int) -> None:
+    """Run the app on port, fed by the replay server (server process)"""
+
+    import cfi_fetcher
+    import mongo
+    import utils
+    from bench_flight_reads import get_db
+    from werkzeug.serving import make_server
+
+    c.OPENSKY_BASE_URL = f"{replay_url}opensky/"
+    c.BASE_URL_CFI = f"{replay_url}cfi/"
+    db = get_db(mongo_uri)
+    mongo.get_db = lambda: db
+    if not mongo_uri:
+        # mongomock upserts scan the collection
+        utils.submit_position_update = lambda states: None
+
+    airports = AIRPORTS if flights else []
+    asyncio.run(
+        cfi_fetcher.update_airports(
+            airports, "2023-01-01T08:00", rate=1000, burst=100, concurrency=10
+        )
+    )
+
+    sys.argv = sys.argv[:1]
+    import app
+
+    make_server("127.0.0.1", port, app.server, threaded=True).serve_forever()
+
+
+def start_server(args, replay_url: str) -> multiprocessing.Process:
+    """returns the server process, once the app answers"""
+
+    process = multiprocessing.Process(
+        target=serve,
+        args=(args.port, replay_url, args.mongo_uri, args.flights),
+        daemon=True,
+    )
+    process.start()
+
+    url = f"http://127.0.0.1:{args.port}/"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline and process.is_alive():
+        try:
+            httpx.get(f"{url}_dash-dependencies", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("The app server didn't start")
+
+
+class Session:
+    """
+    Dashboard of a user, keeping the stores updated by the callbacks
+
+    Parameters:
+    -----------
+        client      : HTTP client of the app
+        dependencies: callbacks of the app, from `/_dash-dependencies`
+        callsigns   : callsigns of the airplanes to hover and click
+        record      : function(event, latency in ms, error)
+    """
+
+    def __init__(self, client, dependencies, callsigns, record) -> None:
+        self.client = client
+        self.dependencies = dependencies
+        self.callsigns = callsigns
+        self.record = record
+        self.n_intervals = 0
+        self.n_clicks = 0
+        self.values = {
+            "selected_callsign.data": "",
+            "map_version.data": 0,
+            "viewport.data": None,
+            "selected_airport.data": "",
+            "arrivals_board.page_current": 0,
+            "arrivals_board.page_size": 10,
+            "departures_board.page_current": 0,
+            "departures_board.page_size": 10,
+        }
+
+    async def post(self, output: str, values: dict, changed: list) -> None:
+        """Send a callback and update the stores with its outputs"""
+
+        body = callback_payload(
+            find_dependency(self.dependencies, output),
+            {**self.values, **values},
+            changed,
+        )
+        response = await self.client.post("/_dash-update-component", json=body)
+        if response.status_code == 204:
+            return
+        response.raise_for_status()
+
+        for component, props in response.json()["response"].items():
+            for name, value in props.items():
+                key = f"{component}.{name}"
+                if key in self.values:
+                    self.values[key] = value
+
+    async def event(self, name: str, *groups) -> None:
+        """
+        Send the groups of callbacks of an event one after the other, the
+        callbacks of a group concurrently, and record the event
+        """
+
+        start = time.perf_counter()
+        try:
+            for callbacks in groups:
+                await asyncio.gather(*(self.post(*x) for x in callbacks))
+            error = False
+        except (httpx.HTTPError, ValueError, KeyError):
+            error = True
+        self.record(name, (time.perf_counter() - start) * 1000, error)
+
+    def interval(self):
+        self.n_intervals += 1
+        tick = {"map-interval.n_intervals": self.n_intervals}
+        changed = ["map-interval.n_intervals"]
+        return self.event(
+            "interval",
+            [
+                ("live-update-text.children", tick, changed),
+                ("click_callsign.children", tick, changed),
+                ("nearby_table.children", tick, changed),
+            ],
+        )
+
+    def point(self) -> dict:
+        callsign = random.choice(self.callsigns)
+        return {"points": [{"bbox": {"x0": 10, "y0": 10}, "text": callsign}]}
+
+    def hover(self):
+        return self.event(
+            "hover",
+            [("hover_callsign.children", {"map.hoverData": self.point()}, ["map.hoverData"])],  # fmt: skip
+        )
+
+    def click(self):
+        return self.event(
+            "click",
+            [("click_callsign.children", {"map.clickData": self.point()}, ["map.clickData"])],  # fmt: skip
+        )
+
+    def submit(self):
+        self.n_clicks += 1
+        departure, arrival = AIRPORTS[0], AIRPORTS[2]
+        values = {
+            "submit_val.n_clicks": self.n_clicks,
+            "input_airport.value": random.choice(AIRPORTS),
+            "input_departure.value": departure,
+            "input_arrival.value": arrival,
+        }
+        changed = ["submit_val.n_clicks"]
+        selected = ["selected_airport.data"]
+        return self.event(
+            "submit",
+            [
+                ("airport_infos.children", values, changed),
+                ("airline_route.children", values, changed),
+            ],
+            # the new airport triggers its boards and nearby airplanes
+            [
+                ("arrivals_board.data", {}, selected),
+                ("departures_board.data", {}, selected),
+                ("nearby_table.children", {}, selected),
+            ],
+        )
+
+    async def run(self, duration: float, interval: float, rates: dict) -> None:
+        """
+        Send the events of the session during duration seconds
+
+        Parameters:
+        -----------
+            duration    : length of the session, in s
+            interval    : time between two interval events, in s
+            rates       : events per second of a session, by event
+        """
+
+        loop = asyncio.get_running_loop()
+        end = loop.time() + duration
+        # the sessions don't open at the same time
+        due = {"interval": loop.time() + random.uniform(0, interval)}
+        for name, rate in rates.items():
+            if rate > 0:
+                due[name] = loop.time() + random.expovariate(rate)
+
+        tasks = set()
+        while True:
+            name, at = min(due.items(), key=lambda x: x[1])
+            if at >= end:
+                break
+            await asyncio.sleep(max(at - loop.time(), 0))
+
+            task = asyncio.ensure_future(getattr(self, name)())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            due[name] += (
+                interval if name == "interval" else random.expovariate(rates[name])  # fmt: skip
+            )
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+async def run_sessions(url: str, sessions: int, args, callsigns) -> tuple:
+    """returns the latencies (ms) and errors of each event"""
+
+    latencies = {name: [] for name in EVENTS}
+    errors = {name: 0 for name in EVENTS}
+
+    def record(name, latency, error):
+        latencies[name].append(latency)
+        errors[name] += error
+
+    limits = httpx.Limits(max_connections=sessions * 3)
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=args.timeout
+    ) as client:
+        dependencies = (await client.get("/_dash-dependencies")).json()
+        rates = {"hover": args.hover, "click": args.click, "submit": args.submit}  # fmt: skip
+        await asyncio.gather(
+            *(
+                Session(client, dependencies, callsigns, record).run(
+                    args.duration, args.interval, rates
+                )
+                for _ in range(sessions)
+            )
+        )
+
+    return latencies, errors
+
+
+async def sample(sampler, stop: asyncio.Event) -> None:
+    """Sample the memory of the server every second until stopped"""
+
+    while not stop.is_set():
+        sampler.sample()
+        try:
+            await asyncio.wait_for(stop.wait(), 1)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def load(url: str, sessions: int, args, callsigns, pid) -> tuple:
+    """returns the latencies, errors, CPU and memory of a load level"""
+
+    sampler = ProcessSampler(pid) if pid else None
+    stop = asyncio.Event()
+    sampling = asyncio.ensure_future(sample(sampler, stop)) if pid else None
+
+    start = time.perf_counter()
+    latencies, errors = await run_sessions(url, sessions, args, callsigns)
+    elapsed = time.perf_counter() - start
+
+    if sampling:
+        stop.set()
+        await sampling
+        return latencies, errors, elapsed, sampler.cpu_percent(), sampler.max_rss  # fmt: skip
+    return latencies, errors, elapsed, float("nan"), float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50, 100])  # fmt: skip
+    parser.add_argument("--duration", type=float, default=30, help="seconds per number of sessions")  # fmt: skip
+    parser.add_argument("--interval", type=float, default=c.MAP_UPDATE_INTERVAL / 1000, help="map interval, in s")  # fmt: skip
+    parser.add_argument("--hover", type=float, default=1.0, help="hovers per second of a session")  # fmt: skip
+    parser.add_argument("--click", type=float, default=0.1, help="clicks per second of a session")  # fmt: skip
+    parser.add_argument("--submit", type=float, default=0.02, help="airport and route searches per second of a session")  # fmt: skip
+    parser.add_argument("--airplanes", type=int, default=10000)
+    parser.add_argument("--opensky", default="", help="recorded OpenSky responses, replayed instead of --airplanes")  # fmt: skip
+    parser.add_argument("--flights", type=int, default=2000)
+    parser.add_argument("--mongo-uri", default="")
+    parser.add_argument("--port", type=int, default=8051)
+    parser.add_argument("--url", default="", help="app already running, instead of a server process")  # fmt: skip
+    parser.add_argument("--pid", type=int, default=0, help="process of the app of --url")  # fmt: skip
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", default="", help="CSV file of the results")  # fmt: skip
+    args = parser.parse_args()
+
+    if args.opensky:
+        snapshots = load_opensky(args.opensky)
+    else:
+        snapshots = [json.dumps(make_response(args.airplanes)).encode()]
+    callsigns = [
+        state[1]
+        for snapshot in snapshots
+        for state in json.loads(snapshot)["states"] or []
+        if state[1]
+    ] or [""]
+
+    process = None
+    if args.url:
+        url, pid = args.url, args.pid
+    else:
+        replay = ReplayServer(snapshots, make_documents(args.flights)).start()
+        process = start_server(args, replay.url)
+        url, pid = f"http://127.0.0.1:{args.port}/", process.pid
+
+    columns = ["sessions", "event", "count", "req/s", "p50 ms", "p95 ms", "p99 ms", "late %", "errors", "cpu %", "rss MB"]  # fmt: skip
+    print("".join(f"{x:>10}" for x in columns))
+    rows = []
+
+    try:
+        for sessions in args.sessions:
+            latencies, errors, elapsed, cpu, rss = asyncio.run(
+                load(url, sessions, args, callsigns, pid)
+            )
+            latencies["all"] = [x for name in EVENTS for x in latencies[name]]
+            errors["all"] = sum(errors.values())
+
+            for name in EVENTS + ["all"]:
+                values = np.array(latencies[name] or [np.nan])
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                late = (
+                    100 * np.mean(values > args.interval * 1000)
+                    if name == "interval"
+                    else np.nan
+                )
+                last = name == "all"
+                row = [
+                    sessions,
+                    name,
+                    len(latencies[name]),
+                    len(latencies[name]) / elapsed,
+                    p50,
+                    p95,
+                    p99,
+                    late,
+                    errors[name],
+                    cpu if last else np.nan,
+                    rss if last else np.nan,
+                ]
+                rows.append(row)
+                print(
+                    f"{sessions:>10}{name:>10}{row[2]:>10}"
+                    + "".join(f"{x:>10.1f}" for x in row[3:8])
+                    + f"{row[8]:>10}{row[9]:>10.1f}{row[10]:>10.1f}",
+                    flush=True,
+                )
+    finally:
+        if process is not None:
+            process.terminate()
+            replay.stop()
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["sessions", "event", "count", "throughput", "p50_ms", "p95_ms", "p99_ms", "late_pct", "errors", "cpu_pct", "rss_mb"])  # fmt: skip
+            for row in rows:
+                writer.writerow(row[:3] + [f"{x:.2f}" for x in row[3:8]] + row[8:9] + [f"{x:.2f}" for x in row[9:]])  # fmt: skip
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Replay benchmark of the whole pipeline, without the real APIs.
+
+Serves recorded or synthetic OpenSky snapshots and Lufthansa CFI flights
+with the replay server, and measures each stage of the app and cron job
+fed by them :
+- cron job : concurrent CFI ingestion, airport board, routes and airports
+- per snapshot : OpenSky fetch and decoding, dataframe, snapshot indexes,
+  positions write, map figure, and the hover, click, interval and
+  viewport callbacks through the Dash server
+
+Reports per stage the average and maximum latency, and the peak memory
+allocated by one run (tracemalloc), as a table and optionally as a CSV
+file to compare between releases.
+
+Usage: $ python benchmarks/replay.py [--airplanes N [N ...]] [--opensky FILE]
+                                     [--cfi FILE] [--mongo-uri URI]
+                                     [--output FILE]
+
+Without `--mongo-uri` the database is mongomock : the times of the
+stages reading or writing MongoDB are not those of a mongod, and the
+positions of the snapshots of more than MOCK_WRITE_LIMIT airplanes are
+not written.
+"""
+
+import argparse
+import asyncio
+import csv
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import cfi_fetcher  # noqa: E402
+import constants as c  # noqa: E402
+import mongo  # noqa: E402
+import utils  # noqa: E402
+from bench_flight_reads import AIRPORTS, get_db, make_documents  # noqa: E402
+from bench_hover import make_response  # noqa: E402
+from replay_server import ReplayServer, load_cfi, load_opensky  # noqa: E402
+from snapshot_store import Snapshot  # noqa: E402
+
+# mongomock upserts scan the collection : the positions of larger
+# snapshots are only written to a mongod
+MOCK_WRITE_LIMIT = 5000
+
+VIEWPORT = {
+    "mapbox.center": {"lon": 5.0, "lat": 48.0},
+    "mapbox.zoom": 4,
+    "mapbox._derived": {
+        "coordinates": [[-10.0, 55.0], [20.0, 55.0], [20.0, 40.0], [-10.0, 40.0]]  # fmt: skip
+    },
+}
+
+
+def callback_payload(dependency: dict, values: dict, changed: list) -> dict:
+    """
+    returns the body of a `/_dash-update-component` request
+
+    Parameters:
+    -----------
+        dependency  : callback from `/_dash-dependencies`
+        values      : values of the inputs and states, by "id.property"
+        changed     : "id.property" of the inputs triggering the callback
+    """
+
+    def props(items):
+        return [
+            {
+                "id": item["id"],
+                "property": item["property"],
+                "value": values.get(f"{item['id']}.{item['property']}"),
+            }
+            for item in items
+        ]
+
+    output = dependency["output"]
+    outputs = [
+        dict(zip(["id", "property"], name.split(".", 1)))
+        for name in output.strip(".").split("...")
+    ]
+    return {
+        "output": output,
+        "outputs": outputs if output.startswith("..") else outputs[0],
+        "inputs": props(dependency["inputs"]),
+        "state": props(dependency["state"]),
+        "changedPropIds": changed,
+    }
+
+
+def find_dependency(dependencies: list, output: str) -> dict:
+    """returns the callback of an output ("id.property")"""
+
+    return next(d for d in dependencies if output in d["output"])
+
+
+def write_positions(states) -> None:
+    """Write every position of states, even those written already"""
+
+    utils._position_times.clear()
+    utils.update_position(states)
+
+
+def measure(func, repeat: int) -> tuple:
+    """
+    returns the average and maximum time of func in ms, and the peak
+    memory allocated by one call in MB
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return sum(times) / len(times), max(times), peak / 1024**2
+
+
+def load_app():
+    """returns the Dash app, with its poller stopped"""
+
+    argv = sys.argv
+    sys.argv = argv[:1]
+    try:
+        import app
+        import poller
+    finally:
+        sys.argv = argv
+
+    # the snapshots are published by the benchmark
+    poller.stop_poller()
+    logging.getLogger().setLevel(logging.WARNING)
+    return app, poller
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--airplanes", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--opensky", default="", help="recorded OpenSky responses, replayed instead of --airplanes")  # fmt: skip
+    parser.add_argument("--flights", type=int, default=2000)
+    parser.add_argument("--cfi", default="", help="recorded CFI response, replayed instead of --flights")  # fmt: skip
+    parser.add_argument("--mongo-uri", default="")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="", help="CSV file of the results")  # fmt: skip
+    args = parser.parse_args()
+
+    if args.opensky:
+        snapshots = load_opensky(args.opensky)
+    else:
+        snapshots = [
+            json.dumps(make_response(n)).encode() for n in args.airplanes
+        ]
+    flights = load_cfi(args.cfi) if args.cfi else make_documents(args.flights)
+
+    server = ReplayServer(snapshots, flights).start()
+    c.OPENSKY_BASE_URL = f"{server.url}opensky/"
+    c.BASE_URL_CFI = f"{server.url}cfi/"
+
+    db = get_db(args.mongo_uri)
+    mongo.get_db = lambda: db
+
+    # positions are written by their own stage
+    utils.submit_position_update = lambda states: None
+
+    app, poller = load_app()
+    client = app.server.test_client()
+    dependencies = client.get("/_dash-dependencies").get_json()
+    airports = sorted({airport for _, airport in server.flights})
+
+    def post(output, values, changed):
+        body = callback_payload(
+            find_dependency(dependencies, output), values, changed
+        )
+        response = client.post("/_dash-update-component", json=body)
+        assert response.status_code in (200, 204), response.status_code
+
+    results = []
+
+    def run(stage, size, func, repeat=args.repeat):
+        mean, worst, peak = measure(func, repeat)
+        results.append((stage, size, mean, worst, peak))
+        print(f"{stage:<22}{size:>10}{mean:>10.1f}{worst:>10.1f}{peak:>10.1f}", flush=True)  # fmt: skip
+
+    print(f"{'stage':<22}{'size':>10}{'mean ms':>10}{'max ms':>10}{'peak MB':>10}")  # fmt: skip
+
+    # cron job and flights queries
+    date_time = "2023-01-01T08:00"
+    # without the API quota, which would be measured instead of the code
+    run(
+        "cfi ingestion",
+        len(flights),
+        lambda: asyncio.run(
+            cfi_fetcher.update_airports(
+                airports, date_time, rate=1000, burst=100, concurrency=10
+            )
+        ),
+        repeat=1,
+    )
+    run("airport board", len(flights), lambda: utils.get_airport_board("arrivals", AIRPORTS[2], page_size=10))  # fmt: skip
+    run("routes", len(flights), lambda: utils.get_routes(AIRPORTS[0], AIRPORTS[2]))  # fmt: skip
+    run("airports list", len(flights), utils.list_available_airports)
+
+    # app, for each snapshot
+    for index in range(len(snapshots)):
+        server.select(index)
+        states = utils.get_opensky_flights()
+        n = len(states)
+        previous = poller.get_snapshot()
+        df = utils.get_opensky_df(states)
+        snapshot = Snapshot.build(previous.version + 1, df)
+        poller.store.publish(snapshot)
+        callsign = next((x for x in states.columns["callsign"] if x), "")
+
+        run("opensky decoding", n, utils.get_opensky_flights)
+        run("dataframe", n, lambda: utils.get_opensky_df(states))
+        run("snapshot indexes", n, lambda: Snapshot.build(snapshot.version, df))  # fmt: skip
+        if args.mongo_uri or n <= MOCK_WRITE_LIMIT:
+            run("positions write", n, lambda: write_positions(states), repeat=1)  # fmt: skip
+        else:
+            print(f"{'positions write':<22}{n:>10}  skipped with mongomock")
+        run(
+            "map figure",
+            n,
+            lambda: utils.add_flights_on_map(
+                None, df.take(utils.get_viewport_rows(snapshot.grid, None))
+            ),
+        )
+
+        point = {"points": [{"bbox": {"x0": 10, "y0": 10}, "text": callsign}]}
+        run("hover callback", n, lambda: post("hover_callsign.children", {"map.hoverData": point}, ["map.hoverData"]))  # fmt: skip
+        run(
+            "click callback",
+            n,
+            lambda: post(
+                "click_callsign.children",
+                {"map.clickData": point, "map_version.data": previous.version},
+                ["map.clickData"],
+            ),
+        )
+        run(
+            "interval callback",
+            n,
+            lambda: post(
+                "click_callsign.children",
+                {
+                    "map-interval.n_intervals": 1,
+                    "selected_callsign.data": callsign,
+                    "map_version.data": previous.version,
+                },
+                ["map-interval.n_intervals"],
+            ),
+        )
+        run("viewport callback", n, lambda: post("viewport.data", {"map.relayoutData": VIEWPORT}, ["map.relayoutData"]))  # fmt: skip
+
+    server.stop()
+    db.client.drop_database(db.name)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["stage", "size", "mean_ms", "max_ms", "peak_mb"])
+            for stage, size, mean, worst, peak in results:
+                writer.writerow([stage, size, f"{mean:.2f}", f"{worst:.2f}", f"{peak:.2f}"])  # fmt: skip
+
+
+if __name__ == "__main__":
+    main()
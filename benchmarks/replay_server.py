@@ -0,0 +1,167 @@
+"""Replay server of the OpenSky and Lufthansa APIs for the benchmarks.
+
+Serves recorded or synthetic responses on a local port, so that the
+whole pipeline runs without access to the real APIs :
+- `/opensky/...` : the current OpenSky snapshot, set by `select`
+- `/cfi/{direction}/{airport}/{date}?offset=&limit=` : the pages of the
+  arrivals or departures of an airport, with their Meta TotalCount
+
+Usage: $ python benchmarks/replay_server.py [--port PORT] [--airplanes N]
+                                            [--opensky FILE] [--cfi FILE]
+
+Then set OPENSKY_BASE_URL=http://127.0.0.1:PORT/opensky/ and
+BASE_URL_CFI=http://127.0.0.1:PORT/cfi/ to run the app or the cron job
+against it.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from bench_flight_reads import make_documents  # noqa: E402
+from bench_hover import make_response  # noqa: E402
+
+
+def load_opensky(path: str) -> list:
+    """
+    returns the bodies of recorded OpenSky responses : a `states/all`
+    response, or {"responses": [...]} as in tests/opensky_responses.json
+    """
+
+    with open(path, encoding="utf-8") as f:
+        recorded = json.load(f)
+    responses = recorded.get("responses", [recorded])
+    return [json.dumps(response).encode() for response in responses]
+
+
+def load_cfi(path: str) -> list:
+    """returns the flights of a recorded CFI arrivals or departures response"""
+
+    with open(path, encoding="utf-8") as f:
+        recorded = json.load(f)
+    flights = recorded["FlightInformation"]["Flights"]["Flight"]
+    return [flights] if isinstance(flights, dict) else flights
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Answers the OpenSky and CFI requests from the replay server data"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+
+        if parts[0] == "opensky":
+            self._send(self.server.snapshot)
+        elif parts[0] == "cfi" and len(parts) == 4:
+            _, direction, airport, _ = parts
+            self._send(self.server.cfi_page(direction, airport, url.query))
+        else:
+            self.send_error(404)
+
+    def _send(self, body: bytes) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    HTTP server replaying OpenSky snapshots and CFI flights
+
+    Parameters:
+    -----------
+        snapshots   : bodies of OpenSky responses
+        flights     : flights of the CFI API
+    """
+
+    daemon_threads = True
+
+    def __init__(self, snapshots: list, flights: list, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), ReplayHandler)
+        self.snapshots = snapshots
+        self.snapshot = snapshots[0] if snapshots else b'{"states": []}'
+        self.flights = {}
+        for flight in flights:
+            for direction, field in [
+                ("departures", "Departure"),
+                ("arrivals", "Arrival"),
+            ]:
+                airport = flight[field]["AirportCode"]
+                self.flights.setdefault((direction, airport), []).append(flight)  # fmt: skip
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def select(self, index: int) -> None:
+        """Serve the OpenSky snapshot of index"""
+
+        self.snapshot = self.snapshots[index]
+
+    def cfi_page(self, direction: str, airport: str, query: str) -> bytes:
+        """returns a page of the CFI flights of an airport"""
+
+        params = parse_qs(query)
+        offset = int(params.get("offset", ["0"])[0])
+        limit = int(params.get("limit", ["100"])[0])
+        flights = self.flights.get((direction, airport), [])
+        end = offset + limit
+
+        return json.dumps(
+            {
+                "FlightInformation": {
+                    "Flights": {"Flight": flights[offset:end]},
+                    "Meta": {"TotalCount": len(flights)},
+                }
+            }
+        ).encode()
+
+    def start(self) -> "ReplayServer":
+        """Serve in a background thread"""
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--airplanes", type=int, default=10000)
+    parser.add_argument("--flights", type=int, default=2000)
+    parser.add_argument("--opensky", default="", help="recorded OpenSky response")  # fmt: skip
+    parser.add_argument("--cfi", default="", help="recorded CFI response")
+    args = parser.parse_args()
+
+    snapshots = (
+        load_opensky(args.opensky)
+        if args.opensky
+        else [json.dumps(make_response(args.airplanes)).encode()]
+    )
+    flights = load_cfi(args.cfi) if args.cfi else make_documents(args.flights)
+
+    server = ReplayServer(snapshots, flights, args.port)
+    print(f"OPENSKY_BASE_URL={server.url}opensky/")
+    print(f"BASE_URL_CFI={server.url}cfi/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
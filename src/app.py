@@ -12,12 +12,17 @@ import os
 from datetime import datetime
 
 import pandas as pd
-from dash import Dash, dcc, html, dash_table
+from dash import Dash, Patch, ctx, dcc, html, dash_table, no_update
 from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
 
 import constants as c
+import http_client
+import indexes
+import metrics
+import mongo
+import poller
 import utils
 
 
@@ -27,8 +32,8 @@ try:
 except Exception:
     DEBUG = True
 
-# create app and server
-app = Dash(__name__)
+# create app and server. Responses are gzip or brotli compressed
+app = Dash(__name__, compress=True)
 server = app.server
 
 # Parse commandline arguments
@@ -37,35 +42,75 @@ args = utils.init_args()
 # Logging config
 utils.init_log_conf(args.loglevel, c.DASH_LOG_PATH)
 
+# MongoDB indexes
+indexes.ensure_indexes()
+
+# latency and size metrics of the callbacks, served on METRICS_PATH
+metrics.init_app(
+    server,
+    collectors={
+        "mongo_pool": mongo.pool_stats,
+        "http_cache": http_client.cache_stats,
+        "snapshot": lambda: {
+            "version": poller.get_snapshot().version,
+            "airplanes": len(poller.get_snapshot().df),
+        },
+    },
+)
+
 # GLOBAL VARIABLES
 
-# global dataframe of flying airplanes
-response = utils.get_opensky_flights()
-df = utils.get_opensky_df(response)
-# global map figure
+# background polling of the flying airplanes. With debug, app.run starts
+# the reloader of the debug server, which imports this module twice
+poller.start_poller(reloader=__name__ == "__main__" and bool(DEBUG))
+# global map figure, with an empty trace for the selected airplane.
+# It is then updated by patches.
+initial = poller.get_snapshot()
 map_fig = go.Figure()
-map_fig = utils.add_flights_on_map(map_fig, df)
-# number of interval triggered
-n_intervals = 0
-
-# submit button of the airplane selection panel
-submit_clicks = 0
-# clicks on the map
-map_n_clicks = 0
-# close button of the airplane selection panel
-x_close_selection_clicks = 0
-# close button of the airport panel
-x_close_airport_clicks = 0
-# close button of the route panel
-x_close_route_clicks = 0
-# previous clickData
-clickData_previous = None
-# memorized callsign when click on airplane
-callsign = ""
+map_fig = utils.add_flights_on_map(
+    map_fig, initial.df.take(utils.get_viewport_rows(initial.grid, None))
+)
+map_fig = utils.add_flight_trace_on_map(
+    map_fig, pd.DataFrame(columns=["time", "lat", "lon"])
+)
 
 
 # LAYOUT
 
+
+def board_table(board_id, direction):
+    """
+    returns an airport board : only the displayed page is queried, with
+    its sort and filter, by the update_board callbacks
+    """
+
+    return dash_table.DataTable(
+        id=board_id,
+        columns=[{"name": i, "id": i} for i in utils.BOARD_FIELDS[direction]],
+        page_action="custom",
+        page_current=0,
+        page_size=10,
+        sort_action="custom",
+        sort_mode="single",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
+        style_as_list_view=True,
+        style_header={
+            "backgroundColor": "cornflowerblue",
+            "color": "white",
+            "fontWeight": "bold",
+        },
+        style_cell={"textAlign": "center"},
+        style_data_conditional=[
+            {
+                "if": {"row_index": "odd"},
+                "backgroundColor": "rgb(220, 220, 220)",
+            }
+        ],
+    )
+
+
 # filters
 filters_layout = html.Div(
     [
@@ -390,6 +435,7 @@ filtered_airport_layout = html.Div(
                     },
                 ),
                 html.Div(
+                    board_table("departures_board", "departures"),
                     id="departures_table",
                     className="airport_table",
                     style={"display": "block"},
@@ -409,6 +455,7 @@ filtered_airport_layout = html.Div(
                     },
                 ),
                 html.Div(
+                    board_table("arrivals_board", "arrivals"),
                     id="arrivals_table",
                     className="airport_table",
                     style={"display": "block"},
@@ -417,6 +464,25 @@ filtered_airport_layout = html.Div(
             id="arrivals_panel",
             style={"display": "inline-block"},
         ),
+        html.Div(
+            [
+                html.H3(
+                    "Airplanes nearby",
+                    style={
+                        "display": "inline-block",
+                        "textAlign": "center",
+                        "width": "100%",
+                    },
+                ),
+                html.Div(
+                    id="nearby_table",
+                    className="airport_table",
+                    style={"display": "block"},
+                ),
+            ],
+            id="nearby_panel",
+            style={"display": "none"},
+        ),
         html.Span("X", id="x_close_airport"),
     ],
     id="airport_panel",
@@ -492,6 +558,11 @@ app.layout = html.Div(
                     interval=c.MAP_UPDATE_INTERVAL,
                     n_intervals=0,
                 ),
+                # UI state of the browser session
+                dcc.Store(id="selected_callsign", storage_type="memory"),
+                dcc.Store(id="map_version", storage_type="memory"),
+                dcc.Store(id="viewport", storage_type="memory"),
+                dcc.Store(id="selected_airport", storage_type="memory"),
             ],
             id="map_container",
             style={"display": "flex"},
@@ -514,6 +585,7 @@ app.layout = html.Div(
     Output("live-update-text", "children"),
     Input("map-interval", "n_intervals"),
 )
+@metrics.callback
 def last_update(n):
     """displays the last update time on the titel layout"""
 
@@ -534,6 +606,7 @@ def last_update(n):
     Output("hover_speed", "children"),
     Input("map", "hoverData"),
 )
+@metrics.callback
 def update_hovered_airplane(hoverData):
     """
     Display moving panel with few position info
@@ -553,17 +626,17 @@ def update_hovered_airplane(hoverData):
         left = hoverData["points"][0]["bbox"]["x0"]
         callsign = hoverData["points"][0]["text"]
 
-        try:
-            # get the row in df of hovered airplane
-            row = df.loc[(df.callsign == callsign), :]
-            lat = row.lat
-            lon = row.long
-            origin = row.origin_country
-            alt = row.baro_altitude
-            speed = row.velocity
-            logging.info(f"HOVER {callsign = }\n{row}\n{hoverData}\n")
-        except IndexError as e:
-            logging.error(f"{e}\n")
+        # get the values of hovered airplane
+        row = poller.get_snapshot().lookup(callsign)
+        if row is not None:
+            lat = utils.format_value(row["lat"])
+            lon = utils.format_value(row["long"])
+            origin = utils.format_value(row["origin_country"])
+            alt = utils.format_value(row["baro_altitude"])
+            speed = utils.format_value(row["velocity"])
+            logging.debug(f"HOVER {callsign = }\n{row}\n{hoverData}\n")
+        else:
+            logging.error(f"Hovered airplane not found : {callsign = }\n")
 
         # display panel shifted from the airplane
         style = {
@@ -591,22 +664,36 @@ def update_hovered_airplane(hoverData):
     Output("click_pos_source", "children"),
     Output("alt_graph", "figure"),
     Output("map", "figure"),
+    Output("selected_callsign", "data"),
+    Output("map_version", "data"),
     Input("map", "clickData"),
     Input("map-interval", "n_intervals"),
     Input("x_close_selection", "n_clicks"),
+    State("selected_callsign", "data"),
+    State("map_version", "data"),
+    State("viewport", "data"),
 )
-def update_clicked_airplane(clickData, n, n_clicks):
+@metrics.callback
+def update_clicked_airplane(
+    clickData, n, n_clicks, s_callsign, s_version, s_viewport
+):
     """
     Open right side panel with full airplane info
     when airplane is clicked and close with the top-right X
     """
-    global x_close_selection_clicks
-    global clickData_previous
-    global callsign
-    global df
-    global n_intervals
 
-    callsign = ""
+    # latest airplanes published by the poller
+    snapshot = poller.get_snapshot()
+
+    # airplane selected in this session : set by a click, cleared by the
+    # close button and kept on interval refresh
+    if ctx.triggered_id == "map":
+        callsign = clickData["points"][0]["text"] if clickData else ""
+    elif ctx.triggered_id == "x_close_selection":
+        callsign = ""
+    else:
+        callsign = s_callsign or ""
+
     lat = ""
     lon = ""
     origin = ""
@@ -622,25 +709,29 @@ def update_clicked_airplane(clickData, n, n_clicks):
     df_altitude = pd.DataFrame(columns=["time", "altitude"])
 
     # values to display when clicked
-    if clickData is not None:
-        callsign = clickData["points"][0]["text"]
-        try:
-            row = df.loc[(df.callsign == callsign), :]
-            lat = row.lat
-            lon = row.long
-            origin = row.origin_country
-            alt = row.baro_altitude
-            speed = row.velocity
-            icao = row.icao24
-            time = datetime.utcfromtimestamp(int(row.iloc[0, 3]))
-            last_contact = datetime.utcfromtimestamp(int(row.iloc[0, 4]))
-            true_track = row.true_track
-            vertical = row.vertical_rate
-            pos = row.position_source
-
-            logging.info(f"CLICKED {callsign = }\n{row}\n{clickData}\n")
-        except IndexError as e:
-            logging.error(f"{callsign = }\n{e}\n")
+    if callsign:
+        row = snapshot.lookup(callsign)
+        if row is not None:
+            lat = utils.format_value(row["lat"])
+            lon = utils.format_value(row["long"])
+            origin = utils.format_value(row["origin_country"])
+            alt = utils.format_value(row["baro_altitude"])
+            speed = utils.format_value(row["velocity"])
+            icao = utils.format_value(row["icao24"])
+            true_track = utils.format_value(row["true_track"])
+            vertical = utils.format_value(row["vertical_rate"])
+            pos = utils.format_value(row["position_source"])
+            try:
+                time = datetime.utcfromtimestamp(int(row["time_position"]))
+                last_contact = datetime.utcfromtimestamp(
+                    int(row["last_contact"])
+                )
+            except (TypeError, ValueError) as e:
+                logging.error(f"{callsign = }\n{e}\n")
+
+            logging.debug(f"CLICKED {callsign = }\n{row}\n{clickData}\n")
+        else:
+            logging.error(f"Clicked airplane not found : {callsign = }\n")
 
         # get altitude data
         df_altitude = utils.get_altitudes(callsign)
@@ -657,33 +748,32 @@ def update_clicked_airplane(clickData, n, n_clicks):
         hover_name="altitude",
     )
 
-    # close panel
-    if n_clicks != x_close_selection_clicks:
-        style = {"display": "none"}
-        x_close_selection_clicks = n_clicks
-
-    # update flight position
-    if n_intervals != n:
-        response = utils.get_opensky_flights()
-        df = utils.get_opensky_df(response)
-        n_intervals = n
-        logging.info(f"Updated positions. Number of flights : {len(df)}")
-
-    # add flights on the map
-    map_fig = go.Figure()
-    map_fig = utils.add_flights_on_map(map_fig, df)
-
-    # add trace of the selected airplane on the map
-    if clickData is not None:
+    # update the airplanes of the viewport on the map if this session
+    # doesn't have the latest snapshot yet
+    map_patch = Patch()
+    map_changed = False
+    if snapshot.version != s_version:
+        rows = utils.get_viewport_rows(snapshot.grid, s_viewport)
+        utils.patch_flights_on_map(map_patch, snapshot.df.take(rows))
+        map_changed = True
+
+    # update trace of the selected airplane on the map, or remove it
+    if callsign or s_callsign:
         try:
-            if callsign:
-                df_position = utils.get_trace(callsign)
-                map_fig = utils.add_flight_trace_on_map(map_fig, df_position)
-                logging.debug(f"trace {callsign}: {df_position}")
-                logging.debug(f"Added trace to map for flight: {callsign}")
+            df_position = (
+                utils.get_trace(callsign)
+                if callsign
+                else pd.DataFrame(columns=["time", "lat", "lon"])
+            )
+            utils.patch_flight_trace_on_map(map_patch, df_position)
+            map_changed = True
+            logging.debug(f"trace {callsign}: {df_position}")
         except IndexError as e:
             logging.error(f"{e}")
 
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Map payload : {utils.payload_size(map_patch)} bytes")
+
     return (
         style,
         callsign,
@@ -699,14 +789,42 @@ def update_clicked_airplane(clickData, n, n_clicks):
         vertical,
         pos,
         alt_fig,
-        map_fig,
+        map_patch if map_changed else no_update,
+        callsign,
+        snapshot.version,
     )
 
 
+@app.callback(
+    Output("map", "figure", allow_duplicate=True),
+    Output("viewport", "data"),
+    Input("map", "relayoutData"),
+    State("viewport", "data"),
+    prevent_initial_call=True,
+)
+@metrics.callback
+def update_map_viewport(relayoutData, s_viewport):
+    """
+    send the airplanes of the new viewport when the map is moved or zoomed
+    """
+
+    viewport = utils.get_viewport(relayoutData, s_viewport)
+    if viewport == s_viewport:
+        return no_update, no_update
+
+    snapshot = poller.get_snapshot()
+    rows = utils.get_viewport_rows(snapshot.grid, viewport)
+    map_patch = utils.patch_flights_on_map(Patch(), snapshot.df.take(rows))
+    logging.debug(f"Viewport {viewport} : {len(rows)} airplanes")
+
+    return map_patch, viewport
+
+
 @app.callback(
     Output("map", "clickData"),
     Input("map_container", "n_clicks"),
 )
+@metrics.callback
 def reset_clickData(n_clicks):
     """
     workaround to clear the clickData field and
@@ -722,6 +840,7 @@ def reset_clickData(n_clicks):
     Input("select_filters_arrow", "n_clicks"),
     State("select_filters_arrow", "title"),
 )
+@metrics.callback
 def toggle_applied_filters(i_arrow_clicks, s_state):
     """toggle filter box"""
 
@@ -745,6 +864,7 @@ def toggle_applied_filters(i_arrow_clicks, s_state):
     Output("input_airport", "style"),
     Input("filters_drop", "value"),
 )
+@metrics.callback
 def toggle_fields(i_dd_value):
     """toggle fields depending on filter selected"""
 
@@ -775,86 +895,33 @@ def toggle_fields(i_dd_value):
 
 @app.callback(
     Output("airport_panel", "style"),
-    Output("arrivals_table", "children"),
-    Output("departures_table", "children"),
+    Output("arrivals_board", "page_current"),
+    Output("departures_board", "page_current"),
     Output("airport_infos", "children"),
     Output("input_airport", "value"),
+    Output("selected_airport", "data"),
     Input("submit_val", "n_clicks"),
     Input("map_container", "n_clicks"),
     Input("x_close_airport", "n_clicks"),
     State("input_airport", "value"),
 )
+@metrics.callback
 def display_airport_panel(i_sub_clicks, i_map_clicks, i_close_clicks, i_value):
     """
     display airport panel based on airport field value
     when submit button is clicked
     """
 
-    global submit_clicks
-    global map_n_clicks
-    global x_close_airport_clicks
-
     o_style = {"display": "none"}
-    df_arr = ""
-    df_dep = ""
-    o_arrivals_tbl = ""
-    o_departures_tbl = ""
     o_airport_name = ""
     o_in_airport = ""
+    o_selected_airport = ""
 
-    if (
-        ((map_n_clicks == i_map_clicks) or i_map_clicks is None)
-        and (i_sub_clicks != submit_clicks)
-        and not (i_value is None or i_value == "")
+    # a click on the map or on the close button hides the panel
+    if ctx.triggered_id == "submit_val" and not (
+        i_value is None or i_value == ""
     ):
         o_style = {"display": "block"}
-        submit_clicks = i_sub_clicks
-
-        df_arr = utils.get_arrivals(i_value)
-        df_dep = utils.get_departures(i_value)
-
-        o_arrivals_tbl = dash_table.DataTable(
-            data=df_arr.to_dict("records"),
-            columns=[{"name": i, "id": i} for i in df_arr.columns],
-            style_as_list_view=True,
-            style_header={
-                "backgroundColor": "cornflowerblue",
-                "color": "white",
-                "fontWeight": "bold",
-            },
-            style_cell_conditional=[
-                {"if": {"column_id": c}, "textAlign": "center"}
-                for c in df_arr.columns
-            ],
-            style_data_conditional=[
-                {
-                    "if": {"row_index": "odd"},
-                    "backgroundColor": "rgb(220, 220, 220)",
-                }
-            ],
-            page_size=10,
-        )
-        o_departures_tbl = dash_table.DataTable(
-            data=df_dep.to_dict("records"),
-            columns=[{"name": i, "id": i} for i in df_dep.columns],
-            style_as_list_view=True,
-            style_header={
-                "backgroundColor": "cornflowerblue",
-                "color": "white",
-                "fontWeight": "bold",
-            },
-            style_cell_conditional=[
-                {"if": {"column_id": c}, "textAlign": "center"}
-                for c in df_dep.columns
-            ],
-            style_data_conditional=[
-                {
-                    "if": {"row_index": "odd"},
-                    "backgroundColor": "rgb(220, 220, 220)",
-                }
-            ],
-            page_size=10,
-        )
 
         try:
             o_airport_name = utils.get_airport_infos(i_value)[0]
@@ -863,24 +930,115 @@ def display_airport_panel(i_sub_clicks, i_map_clicks, i_close_clicks, i_value):
             o_airport_name = ""
 
         o_airport_name = i_value.upper() + " (" + o_airport_name + ")"
+        o_selected_airport = i_value.upper()
 
-    else:
-        map_n_clicks = i_map_clicks
-
-    # close panel
-    if i_close_clicks != x_close_airport_clicks:
-        o_style = {"display": "none"}
-        x_close_airport_clicks = i_close_clicks
-
+    # the boards of a new airport start at their first page
     return (
         o_style,
-        o_arrivals_tbl,
-        o_departures_tbl,
+        0,
+        0,
         o_airport_name,
         o_in_airport,
+        o_selected_airport,
+    )
+
+
+def board_page(direction, airport, page_current, page_size, sort_by, filter_query):  # fmt: skip
+    """returns the rows and page count of a page of an airport board"""
+
+    if not airport:
+        return [], 1
+
+    df, count = utils.get_airport_board(
+        direction, airport, page_current, page_size, sort_by, filter_query
+    )
+    page_count = max(-(-count // page_size), 1)
+
+    return df.to_dict("records"), page_count
+
+
+@app.callback(
+    Output("arrivals_board", "data"),
+    Output("arrivals_board", "page_count"),
+    Input("selected_airport", "data"),
+    Input("arrivals_board", "page_current"),
+    Input("arrivals_board", "page_size"),
+    Input("arrivals_board", "sort_by"),
+    Input("arrivals_board", "filter_query"),
+)
+@metrics.callback
+def update_arrivals_board(s_airport, page_current, page_size, sort_by, filter_query):  # fmt: skip
+    """query the displayed page of the arrivals board"""
+
+    return board_page(
+        "arrivals", s_airport, page_current, page_size, sort_by, filter_query
     )
 
 
+@app.callback(
+    Output("departures_board", "data"),
+    Output("departures_board", "page_count"),
+    Input("selected_airport", "data"),
+    Input("departures_board", "page_current"),
+    Input("departures_board", "page_size"),
+    Input("departures_board", "sort_by"),
+    Input("departures_board", "filter_query"),
+)
+@metrics.callback
+def update_departures_board(s_airport, page_current, page_size, sort_by, filter_query):  # fmt: skip
+    """query the displayed page of the departures board"""
+
+    return board_page(
+        "departures", s_airport, page_current, page_size, sort_by, filter_query
+    )
+
+
+@app.callback(
+    Output("nearby_table", "children"),
+    Output("nearby_panel", "style"),
+    Input("map-interval", "n_intervals"),
+    Input("selected_airport", "data"),
+)
+@metrics.callback
+def update_nearby_airplanes(n, s_airport):
+    """
+    display the airplanes arriving at or departing from the airport of the
+    panel, refreshed with the map. Hidden for an airport without
+    coordinates.
+    """
+
+    if not s_airport or not utils.get_airport_position(s_airport):
+        return "", {"display": "none"}
+
+    df_nearby = utils.get_airplanes_near_airport(
+        poller.get_snapshot(), s_airport
+    )
+
+    table = dash_table.DataTable(
+        data=df_nearby.to_dict("records"),
+        columns=[{"name": i, "id": i} for i in df_nearby.columns],
+        style_as_list_view=True,
+        style_header={
+            "backgroundColor": "cornflowerblue",
+            "color": "white",
+            "fontWeight": "bold",
+        },
+        style_cell_conditional=[
+            {"if": {"column_id": c}, "textAlign": "center"}
+            for c in df_nearby.columns
+        ],
+        style_data_conditional=[
+            {
+                "if": {"row_index": "odd"},
+                "backgroundColor": "rgb(220, 220, 220)",
+            }
+        ],
+        page_size=10,
+    )
+
+    return table, {"display": "block"}
+
+
 @app.callback(
     Output("route_panel", "style"),
     Output("airline_route", "children"),
@@ -900,6 +1058,7 @@ def display_airport_panel(i_sub_clicks, i_map_clicks, i_close_clicks, i_value):
     State("input_departure", "value"),
     State("input_arrival", "value"),
 )
+@metrics.callback
 def display_route_panel(
     i_sub_clicks, i_map_clicks, i_close_clicks, s_dep_value, s_arr_value
 ):
@@ -908,10 +1067,6 @@ def display_route_panel(
     when submit button is clicked
     """
 
-    global submit_clicks
-    global map_n_clicks
-    global x_close_route_clicks
-
     # default style
     o_style = {"display": "none"}
     o_airline = ""
@@ -928,19 +1083,14 @@ def display_route_panel(
     in_dep = ""
     in_arr = ""
 
-    # get routes infos
-    if (
-        ((map_n_clicks == i_map_clicks) or i_map_clicks is None)
-        and (i_sub_clicks != submit_clicks)
-        and not (
-            (s_dep_value is None)
-            or (s_dep_value == "")
-            or (s_arr_value is None)
-            or (s_arr_value == "")
-        )
+    # get routes infos. A click on the map or on the close button hides
+    # the panel
+    if ctx.triggered_id == "submit_val" and not (
+        (s_dep_value is None)
+        or (s_dep_value == "")
+        or (s_arr_value is None)
+        or (s_arr_value == "")
     ):
-        submit_clicks = i_sub_clicks
-
         o_style = {"display": "block"}
 
         try:
@@ -963,14 +1113,6 @@ def display_route_panel(
         except Exception as e:
             logging.error(f"No routes found.\n{e}")
 
-    else:
-        map_n_clicks = i_map_clicks
-
-    # close panel
-    if i_close_clicks != x_close_route_clicks:
-        o_style = {"display": "none"}
-        x_close_route_clicks = i_close_clicks
-
     return (
         o_style,
         o_airline,
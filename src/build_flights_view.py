@@ -0,0 +1,63 @@
+"""Build the denormalized `flights_view` from the `flights` collection.
+
+The cron job keeps the view up to date when it writes the flights. This
+script fills it for the flights written before the view existed, or
+refreshes the airport and airline names after running sqldb_load.py.
+
+Usage: $ python build_flights_view.py [--drop]
+"""
+
+import argparse
+import logging
+
+import constants as c
+import indexes
+import mongo
+import utils
+
+
+def init_args() -> argparse.Namespace:
+    """Parse the command line arguments and returns them"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--drop",
+        action="store_true",
+        help="Drop the view first, removing the flights no longer stored",
+    )
+    return parser.parse_args()
+
+
+def build(drop: bool = False) -> int:
+    """
+    Write the view document of every stored flight
+
+    Returns :
+    ---------
+        written     : number of flights written in the view
+    """
+
+    db = mongo.get_db()
+    if drop:
+        db.flights_view.drop()
+    indexes.ensure_indexes(db)
+
+    operations = []
+    for flight in db.flights.find({}, {"_id": 0}):
+        try:
+            operations.append(utils.flight_view_replace(flight))
+        except (KeyError, TypeError) as e:
+            logging.error(f"Invalid flight, missing {e} : {flight}")
+
+    written = utils.bulk_write_batches(
+        db.flights_view, operations, c.BULK_WRITE_BATCH_SIZE
+    )
+    logging.info(f"Wrote {written} flights in flights_view")
+
+    return written
+
+
+if __name__ == "__main__":
+    args = init_args()
+    logging.basicConfig(level=logging.INFO)
+    build(args.drop)
@@ -0,0 +1,295 @@
+"""Concurrent fetcher of the Lufthansa Customer Flight Information API.
+
+The requests of a run share one keep-alive connection pool and are sent
+concurrently, within the API quota :
+- a token bucket limits the request rate to LUFTHANSA_RATE_LIMIT per
+  second, with bursts of LUFTHANSA_BURST requests
+- at most LUFTHANSA_MAX_CONCURRENCY requests are in flight
+- connection errors, 429 and 5xx responses are retried with an
+  exponential backoff and full jitter, or after the Retry-After delay.
+  A request is given up if Retry-After exceeds HTTP_MAX_DELAY
+
+Usage: called by the cron job, `update_flight_status()` fetches the
+arrivals and departures of all the airports to update.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Optional
+
+import httpx
+import pandas as pd
+
+import constants as c
+import metrics
+import mongo
+import utils
+
+
+class TokenBucket:
+    """Rate limiter allowing `rate` acquisitions per second on average"""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait for a token"""
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate,
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                # the lock is kept : waiting requests are served in order
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CfiFetcher:
+    """
+    Asynchronous client of the Lufthansa API, to use as an async context
+    manager closing its connection pool
+    """
+
+    def __init__(
+        self,
+        rate: float = c.LUFTHANSA_RATE_LIMIT,
+        burst: int = c.LUFTHANSA_BURST,
+        concurrency: int = c.LUFTHANSA_MAX_CONCURRENCY,
+        retries: int = c.HTTP_RETRIES,
+        backoff: float = c.HTTP_BACKOFF,
+        timeout: float = c.HTTP_TIMEOUT,
+        max_delay: float = c.HTTP_MAX_DELAY,
+    ) -> None:
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self._bucket = TokenBucket(rate, burst)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = httpx.AsyncClient(
+            headers=utils.get_headers("lufthansa"),
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=concurrency,
+                max_keepalive_connections=concurrency,
+            ),
+        )
+
+    async def __aenter__(self) -> "CfiFetcher":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._client.aclose()
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> Optional[float]:  # fmt: skip
+        """
+        returns the time to wait before retrying, None if Retry-After
+        exceeds max_delay
+        """
+
+        retry_after = response.headers.get("Retry-After") if response else None
+        if retry_after is not None and retry_after.isdigit():
+            delay = float(retry_after)
+            return delay if delay <= self.max_delay else None
+        delay = random.uniform(0, self.backoff * 2**attempt)  # nosec B311
+        return min(delay, self.max_delay)
+
+    async def get(self, url: str) -> Optional[httpx.Response]:
+        """
+        returns the response of a GET request, None if every attempt
+        failed
+
+        Parameters:
+        -----------
+            url         : requested URL
+        """
+
+        for attempt in range(self.retries + 1):
+            response = None
+            async with self._semaphore:
+                await self._bucket.acquire()
+                try:
+                    response = await self._client.get(url)
+                except httpx.TransportError as e:
+                    logging.warning(f"Request failed : {url}. {e!r}")
+                else:
+                    retry = response.status_code == 429 or response.status_code >= 500  # fmt: skip
+                    if not retry:
+                        return response
+
+            if attempt < self.retries:
+                delay = self._delay(attempt, response)
+                if delay is None:
+                    logging.warning(
+                        f"Request given up, retry after "
+                        f"{response.headers['Retry-After']} s : {url}"
+                    )
+                    return response
+                await asyncio.sleep(delay)
+
+        if response is not None:
+            return response
+
+        logging.error(f"Request failed {self.retries + 1} times : {url}")
+        return None
+
+    @metrics.timed("lufthansa", "cfi_page", size=lambda page: len(page[0]))
+    async def get_page(self, url: str) -> Optional[tuple]:
+        """
+        returns the flights and pagination of a CFI response (utils.cfi_page),
+        None on error
+
+        Parameters:
+        -----------
+            url         : URL of a CFI flights request
+        """
+
+        response = await self.get(url)
+        if response is None:
+            return None
+
+        if response.status_code != httpx.codes.OK:
+            logging.error(
+                f"request status is : {response.status_code}\n"
+                f"URL : {url}\n"
+                f"{response.text}"
+            )
+            return None
+
+        try:
+            return utils.cfi_page(response.json())
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Invalid response for {url}. {e}")
+            return None
+
+
+async def write_flights(flights: list) -> int:
+    """
+    Replace or insert flights in the database, without blocking the event
+    loop, and returns the number of flights written
+    """
+
+    if not flights:
+        return 0
+
+    db = mongo.get_db()
+    return await asyncio.to_thread(
+        utils.bulk_upsert_flights,
+        db.flights,
+        flights,
+        view_col=db.flights_view,
+    )
+
+
+async def update_airport_flights(
+    fetcher: CfiFetcher, direction: str, airport: str, date_time: str
+) -> int:
+    """
+    Insert all arrivals or departures at an airport from API in the database.
+    The first page gives the number of flights, the next pages are then
+    requested concurrently and each page is written once received.
+
+    Parameters:
+    -----------
+        fetcher     : fetcher sending the requests
+        direction   : "arrivals" or "departures"
+        airport     : airport for the flights
+        date_time   : date and time required by the API. format : %Y-%m-%dT%H:%M
+
+    Returns :
+    ---------
+        written     : number of flights inserted or replaced
+    """
+
+    page = await fetcher.get_page(utils.cfi_url(direction, airport, date_time))
+    if page is None:
+        return 0
+    flights, total, next_url = page
+    written = await write_flights(flights)
+
+    if total is not None:
+        offsets = range(c.CFI_PAGE_SIZE, total, c.CFI_PAGE_SIZE)
+        pages = asyncio.as_completed(
+            [
+                fetcher.get_page(
+                    utils.cfi_url(direction, airport, date_time, offset)
+                )
+                for offset in offsets
+            ]
+        )
+        for next_page in pages:
+            page = await next_page
+            if page is not None:
+                written += await write_flights(page[0])
+    else:
+        # no count of the flights : follow the links of the pages, until
+        # a link to a page already fetched
+        fetched = {utils.cfi_url(direction, airport, date_time)}
+        while next_url and next_url not in fetched:
+            fetched.add(next_url)
+            page = await fetcher.get_page(next_url)
+            if page is None:
+                break
+            flights, _, next_url = page
+            written += await write_flights(flights)
+
+    logging.debug(f"{written} {direction} at {airport}")
+
+    return written
+
+
+async def update_airports(airports: Any, date_time: str, **options) -> int:
+    """
+    Insert the arrivals and departures of all airports, fetched
+    concurrently
+
+    Parameters:
+    -----------
+        airports    : IATA codes of the airports
+        date_time   : date and time required by the API. format : %Y-%m-%dT%H:%M
+        options     : CfiFetcher options
+
+    Returns :
+    ---------
+        written     : number of flights inserted or replaced
+    """
+
+    async with CfiFetcher(**options) as fetcher:
+        written = await asyncio.gather(
+            *(
+                update_airport_flights(fetcher, direction, airport, date_time)
+                for airport in airports
+                for direction in ["departures", "arrivals"]
+            )
+        )
+
+    return sum(written)
+
+
+def update_flight_status() -> int:
+    """Update flight status on all airports"""
+
+    airports = pd.read_csv(c.VALID_AIRPORTS_FILE)["airport"].tolist()
+    date_time = time.strftime("%Y-%m-%dT08:00")
+
+    start = time.perf_counter()
+    written = asyncio.run(update_airports(airports, date_time))
+    logging.info(
+        f"Updated {written} flights of {len(airports)} airports "
+        f"in {time.perf_counter() - start:.1f} s"
+    )
+
+    return written
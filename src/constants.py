@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -16,13 +17,29 @@ CRON_LOG_PATH = os.path.join(LOG_DIR, CRON_LOG)
 
 MAP_UPDATE_INTERVAL = int(os.environ["MAP_UPDATE_INTERVAL"])
 
+# send the airplanes of the map as base64 typed arrays, with coordinates
+# rounded to MAP_COORDINATE_DECIMALS (4 decimals is about 10 m)
+MAP_COMPACT_ENCODING = os.getenv("MAP_COMPACT_ENCODING", "False").lower() in ("true", "1")
+MAP_COORDINATE_DECIMALS = int(os.getenv("MAP_COORDINATE_DECIMALS", "4"))
+
+# airplanes sent for the viewport of a session : those inside the view
+# extended by MAP_VIEWPORT_MARGIN (fraction of its size), thinned down to
+# MAP_MAX_MARKERS airplanes when zoomed out
+MAP_VIEWPORT_MARGIN = float(os.getenv("MAP_VIEWPORT_MARGIN", "0.25"))
+MAP_MAX_MARKERS = int(os.getenv("MAP_MAX_MARKERS", "4000"))
+# size in degrees of the cells of the spatial index of the airplanes
+SPATIAL_CELL_SIZE = float(os.getenv("SPATIAL_CELL_SIZE", "1"))
+
+# airplanes arriving at or departing from an airport : within
+# AIRPORT_RADIUS_KM of it and below AIRPORT_MAX_ALTITUDE meters
+AIRPORT_RADIUS_KM = float(os.getenv("AIRPORT_RADIUS_KM", "50"))
+AIRPORT_MAX_ALTITUDE = float(os.getenv("AIRPORT_MAX_ALTITUDE", "3000"))
+
 BASE_URL_CFI = os.environ["BASE_URL_CFI"]
 BASE_URL_SCHEDULES = os.environ["BASE_URL_SCHEDULES"]
 
 DATA_DIR = os.environ["DATA_DIR"]
 VALID_AIRPORTS_FILE = os.path.join(DATA_DIR, "airports_valid_for_update.csv")
-FLIGHTS_IN_DB_FILE = os.path.join(DATA_DIR, "flights_in_collection.csv")
-AIRPORTS_IN_DB_FILE = os.path.join(DATA_DIR, "airports_in_collection.csv")
 
 try:
     aws = os.environ["AWS"]
@@ -34,18 +51,92 @@ except Exception:
     AIRLINES_FILE = os.path.join(DATA_DIR, "load_sqlite", "airlines.csv")
     CITIES_FILE = os.path.join(DATA_DIR, "load_sqlite", "cities.csv")
 
+# airport_iata,latitude,longitude of the airports (from airportsdata, MIT)
+AIRPORT_COORDINATES_FILE = os.path.join(DATA_DIR, "load_sqlite", "airport_coordinates.csv")
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "codes.sqlite")
 SQL_ALCHEMY_ENGINE = "sqlite:///" + DB_PATH
 
 OPENSKY_BASE_URL = os.environ["OPENSKY_BASE_URL"]
+# expected number of airplanes of an OpenSky response
+OPENSKY_STATES_CAPACITY = int(os.getenv("OPENSKY_STATES_CAPACITY", "16384"))
 
 MAPBOX_API_TOKEN = os.environ["MAPBOX_API_TOKEN"]
 
 LUFTHANSA_API_KEY = os.environ["LUFTHANSA_API_KEY"]
 
+# quota of the Lufthansa API : requests per second, burst and requests in flight
+LUFTHANSA_RATE_LIMIT = float(os.getenv("LUFTHANSA_RATE_LIMIT", "5"))
+LUFTHANSA_BURST = int(os.getenv("LUFTHANSA_BURST", "5"))
+LUFTHANSA_MAX_CONCURRENCY = int(os.getenv("LUFTHANSA_MAX_CONCURRENCY", "4"))
+
+# flights per page of the CFI API, 100 at most
+CFI_PAGE_SIZE = int(os.getenv("CFI_PAGE_SIZE", "100"))
+
+# failed requests are retried HTTP_RETRIES times, after a random delay of at
+# most HTTP_BACKOFF * 2 ** attempt seconds, or the Retry-After delay. A
+# request is given up if Retry-After exceeds HTTP_MAX_DELAY seconds (half
+# the period of the cron job)
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_MAX_DELAY = float(os.getenv("HTTP_MAX_DELAY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+# seconds a response of the upstream APIs is reused without any request, by
+# endpoint. Stale responses with an ETag or Last-Modified are revalidated.
+HTTP_CACHE_TTL = {
+    "flightstatus": int(os.getenv("HTTP_CACHE_TTL_FLIGHTSTATUS", "60")),
+    "flightnumber": int(os.getenv("HTTP_CACHE_TTL_FLIGHTNUMBER", "300")),
+    "route": int(os.getenv("HTTP_CACHE_TTL_ROUTE", "300")),
+    "schedules": int(os.getenv("HTTP_CACHE_TTL_SCHEDULES", "3600")),
+}
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", "256"))
+# fresh responses shared by the processes, in a directory private to the
+# user running the app, with at most HTTP_CACHE_FILES files
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(tempfile.gettempdir(), f"flight-tracker-http-cache-{os.getuid()}"))
+HTTP_CACHE_FILES = int(os.getenv("HTTP_CACHE_FILES", "1000"))
+
+# store of the airplanes snapshots : "memory" for a single process server,
+# "shared" to share them between the workers of a host. The file is kept
+# in a directory private to the user running the app.
+SNAPSHOT_STORE = os.getenv("SNAPSHOT_STORE", "memory")
+SNAPSHOT_STORE_PATH = os.getenv(
+    "SNAPSHOT_STORE_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), f"flight-tracker-{os.getuid()}", "snapshot.npz"),
+)
+
 # choose a connection string depending on manual or docker start up
 try:
     MONGO_CONNECTION_STR = os.environ["MONGO_CONNECTION_STR"]
 except Exception:
     MONGO_CONNECTION_STR = "mongodb://127.0.0.1:27017/"
+
+MONGO_DB_NAME = "flightTracker"
+
+# connection pool of the shared MongoDB client
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# maximum number of documents sent in one bulk write
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", "500"))
+POSITION_BATCH_SIZE = int(os.getenv("POSITION_BATCH_SIZE", "5000"))
+
+# airplane positions are stored by buckets of at most POSITION_BUCKET_SIZE
+# samples per callsign and time window, kept POSITION_RETENTION_SECONDS
+POSITION_BUCKET_SIZE = int(os.getenv("POSITION_BUCKET_SIZE", "120"))
+POSITION_BUCKET_SECONDS = int(os.getenv("POSITION_BUCKET_SECONDS", "3600"))
+POSITION_RETENTION_SECONDS = int(os.getenv("POSITION_RETENTION_SECONDS", str(2 * 24 * 3600)))
+# time range of the trace displayed for a selected airplane
+POSITION_TRACE_SECONDS = int(os.getenv("POSITION_TRACE_SECONDS", str(12 * 3600)))
+
+# schedules are removed by a TTL index after this delay
+SCHEDULES_TTL_SECONDS = int(os.getenv("SCHEDULES_TTL_SECONDS", str(24 * 3600)))
+
+# latency histograms and call counts of the callbacks and I/O functions,
+# served in the Prometheus format on METRICS_PATH of the app
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() in ("true", "1")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
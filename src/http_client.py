@@ -0,0 +1,325 @@
+"""Process-wide HTTP client of the upstream APIs (OpenSky, Lufthansa).
+
+The requests share one `requests.Session`, so the connections are kept
+alive between the calls. The successful responses are cached by URL, in
+memory and on disk, for the time to live of their endpoint
+(HTTP_CACHE_TTL) :
+- a fresh response is returned without any request
+- a stale response holding an ETag or Last-Modified header is
+  revalidated with If-None-Match / If-Modified-Since, and reused on 304
+- otherwise the URL is requested again
+
+The disk only shares the fresh responses between the processes : the
+expired files are removed, and the oldest ones beyond HTTP_CACHE_FILES.
+Its directory must be private to the user (see private_files).
+
+The counters of `cache_stats()` tell how many requests the cache saved.
+Like the MongoDB client, a new session is created after a fork.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import constants as c
+from private_files import private_directory
+
+VALIDATORS = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
+
+_session = None
+_pid = None
+_lock = threading.Lock()
+
+
+@dataclass
+class CacheEntry:
+    """Cached response of a URL, fresh until `expires` (epoch seconds)"""
+
+    url: str
+    status_code: int
+    headers: dict
+    content: str
+    expires: float
+
+    @classmethod
+    def from_response(cls, url: str, response: requests.Response, ttl: float) -> "CacheEntry":  # fmt: skip
+        headers = {
+            name: response.headers[name]
+            for name in ["Content-Type", *VALIDATORS]
+            if name in response.headers
+        }
+        return cls(
+            url,
+            response.status_code,
+            headers,
+            base64.b64encode(response.content).decode("ascii"),
+            time.time() + ttl,
+        )
+
+    def to_response(self) -> requests.Response:
+        """returns the cached response as a requests Response"""
+
+        response = requests.Response()
+        response.url = self.url
+        response.status_code = self.status_code
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = "utf-8"
+        response._content = base64.b64decode(self.content)
+        return response
+
+
+class ResponseCache:
+    """
+    Responses by URL, in a LRU memory cache of `size` entries backed by
+    one JSON file per URL in `path`, at most `files` of them. The
+    modification time of a file is the expiry of its entry.
+    """
+
+    def __init__(
+        self,
+        path: str = c.HTTP_CACHE_DIR,
+        size: int = c.HTTP_CACHE_SIZE,
+        files: int = c.HTTP_CACHE_FILES,
+    ) -> None:
+        self.path = path
+        self.size = size
+        self.files = files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._private = None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset all counters"""
+
+        self.hits = 0
+        self.disk_reads = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """returns a snapshot of the counters"""
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_reads": self.disk_reads,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "memory_entries": len(self._entries),
+            }
+
+    def count(self, counter: str) -> None:
+        """Increment a counter of stats()"""
+
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _file(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.path, f"{key}.json")
+
+    def _disk(self) -> bool:
+        """returns whether the directory is private, created if needed"""
+
+        if self._private is None:
+            try:
+                self._private = bool(private_directory(self.path))
+            except OSError as e:
+                logging.error(f"HTTP cache on disk disabled. {e}")
+                self._private = False
+        return self._private
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """returns the cached entry of url, None if not cached"""
+
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+
+        if not self._disk():
+            return None
+
+        path = self._file(url)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = CacheEntry(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"Invalid HTTP cache entry for {url}. {e}")
+            return None
+
+        if entry.expires <= time.time():
+            _remove(path)
+            return None
+
+        self.count("disk_reads")
+        self._remember(entry)
+        return entry
+
+    def put(self, entry: CacheEntry) -> None:
+        """Cache entry in memory and on disk"""
+
+        self._remember(entry)
+
+        if not self._disk() or entry.expires <= time.time():
+            return
+
+        # atomic replace : another process never reads a partial file
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(asdict(entry), f)
+            os.utime(tmp_path, (entry.expires, entry.expires))
+            os.replace(tmp_path, self._file(entry.url))
+        except OSError as e:
+            logging.warning(f"Cannot write HTTP cache entry. {e}")
+
+        self.prune()
+
+    def prune(self) -> None:
+        """Remove the expired files, then the oldest ones beyond `files`"""
+
+        now = time.time()
+        try:
+            with os.scandir(self.path) as scan:
+                files = [
+                    (item.stat().st_mtime, item.path)
+                    for item in scan
+                    if item.name.endswith(".json")
+                ]
+        except OSError as e:
+            logging.warning(f"Cannot list the HTTP cache. {e}")
+            return
+
+        files.sort()
+        expired = sum(expires <= now for expires, _ in files)
+        for _, path in files[: max(expired, len(files) - self.files)]:
+            _remove(path)
+
+    def _remember(self, entry: CacheEntry) -> None:
+        with self._lock:
+            self._entries[entry.url] = entry
+            self._entries.move_to_end(entry.url)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries, in memory and on disk"""
+
+        with self._lock:
+            self._entries.clear()
+        if self._disk():
+            for name in os.listdir(self.path):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.path, name))
+
+
+def _remove(path: str) -> None:
+    """Remove a file, which another process may have removed already"""
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+cache = ResponseCache()
+
+
+def get_session() -> requests.Session:
+    """returns the session of the current process, creating it if needed"""
+
+    global _session, _pid
+
+    pid = os.getpid()
+    if _session is None or _pid != pid:
+        with _lock:
+            if _session is None or _pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=c.HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+                _pid = pid
+
+    return _session
+
+
+def close_session() -> None:
+    """Close the session of the current process, if any"""
+
+    global _session, _pid
+
+    with _lock:
+        if _session is not None and _pid == os.getpid():
+            _session.close()
+        _session = None
+        _pid = None
+
+
+def get(url: str, endpoint: str, headers: Optional[dict] = None) -> requests.Response:  # fmt: skip
+    """
+    returns the response of a GET request, from the cache if possible
+
+    Parameters:
+    -----------
+        url         : requested URL
+        endpoint    : key of the time to live in HTTP_CACHE_TTL
+        headers     : headers of the request
+
+    Raises requests.RequestException when the request fails
+    """
+
+    ttl = c.HTTP_CACHE_TTL.get(endpoint, 0)
+    entry = cache.get(url)
+
+    if entry is not None and entry.expires > time.time():
+        cache.count("hits")
+        return entry.to_response()
+
+    headers = dict(headers or {})
+    if entry is not None:
+        for name, condition in VALIDATORS.items():
+            if name in entry.headers:
+                headers[condition] = entry.headers[name]
+
+    response = get_session().get(url, headers=headers, timeout=c.HTTP_TIMEOUT)
+
+    if response.status_code == requests.codes.NOT_MODIFIED and entry is not None:  # fmt: skip
+        cache.count("revalidations")
+        entry.expires = time.time() + ttl
+        cache.put(entry)
+        return entry.to_response()
+
+    cache.count("misses")
+
+    # a response without validators can't be revalidated, it is only
+    # worth caching for a time to live
+    revalidable = any(name in response.headers for name in VALIDATORS)
+    if response.status_code == requests.codes.OK and (ttl > 0 or revalidable):
+        cache.put(CacheEntry.from_response(url, response, ttl))
+
+    return response
+
+
+def cache_stats() -> dict:
+    """returns the response cache counters of the current process"""
+
+    return cache.stats()
@@ -0,0 +1,289 @@
+"""Declaration and bootstrap of the MongoDB indexes.
+
+All the indexes of the flightTracker database are declared in `INDEXES`
+and created once per process by `ensure_indexes()`, called at start up by
+the Dash app and the cron job.
+
+Usage: $ python indexes.py
+    Create the indexes then fail if a hot query falls back to a COLLSCAN
+    or to a sort in memory.
+"""
+
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+from typing import Any
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.database import Database
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+
+import constants as c
+import mongo
+
+# indexes of each collection
+INDEXES = {
+    "flights": [
+        # upsert filter of the Lufthansa flights
+        IndexModel(
+            [
+                ("OperatingCarrier.AirlineID", ASCENDING),
+                ("OperatingCarrier.FlightNumber", ASCENDING),
+            ]
+        ),
+        # airport boards, sorted by scheduled time then _id (board_pipeline)
+        IndexModel(
+            [
+                ("Arrival.AirportCode", ASCENDING),
+                ("Arrival.Scheduled.Time", ASCENDING),
+                ("_id", ASCENDING),
+            ]
+        ),
+        IndexModel(
+            [
+                ("Departure.AirportCode", ASCENDING),
+                ("Departure.Scheduled.Time", ASCENDING),
+                ("_id", ASCENDING),
+            ]
+        ),
+        # routes between two airports
+        IndexModel(
+            [
+                ("Departure.AirportCode", ASCENDING),
+                ("Arrival.AirportCode", ASCENDING),
+            ]
+        ),
+    ],
+    "flights_view": [
+        # upsert filter of the denormalized flights
+        IndexModel(
+            [("carrier_code", ASCENDING), ("flight_number", ASCENDING)]
+        ),
+        # airport boards, sorted by scheduled time
+        IndexModel([("arr_iata", ASCENDING), ("arr_scheduled", ASCENDING)]),
+        IndexModel([("dep_iata", ASCENDING), ("dep_scheduled", ASCENDING)]),
+        # routes between two airports
+        IndexModel([("dep_iata", ASCENDING), ("arr_iata", ASCENDING)]),
+    ],
+    "routes": [
+        IndexModel(
+            [
+                ("OperatingCarrier.AirlineID", ASCENDING),
+                ("OperatingCarrier.FlightNumber", ASCENDING),
+            ]
+        ),
+    ],
+    "schedules": [
+        # schedules are removed by the server once expired
+        IndexModel(
+            [("insertedDate", ASCENDING)],
+            expireAfterSeconds=c.SCHEDULES_TTL_SECONDS,
+        ),
+    ],
+    "positions": [
+        # upsert filter of the position buckets
+        IndexModel(
+            [
+                ("callsign", ASCENDING),
+                ("window", ASCENDING),
+                ("count", ASCENDING),
+            ]
+        ),
+        # trace reads by time range, sorted by last
+        IndexModel([("callsign", ASCENDING), ("last", ASCENDING)]),
+        # buckets are removed by the server once expired
+        IndexModel(
+            [("last", ASCENDING)],
+            expireAfterSeconds=c.POSITION_RETENTION_SECONDS,
+        ),
+    ],
+}
+
+# upsert filters of the ingestion : collection and filter. They must be
+# served by an index, as the reads of hot_pipelines()
+UPSERT_FILTERS = [
+    (
+        "flights",
+        {
+            "OperatingCarrier.AirlineID": "LH",
+            "OperatingCarrier.FlightNumber": "400",
+        },
+    ),
+    ("flights_view", {"carrier_code": "LH", "flight_number": "400"}),
+    (
+        "routes",
+        {
+            "OperatingCarrier.AirlineID": "LH",
+            "OperatingCarrier.FlightNumber": "400",
+        },
+    ),
+    (
+        "positions",
+        {
+            "callsign": "DLH400",
+            "window": datetime(2023, 1, 1),
+            "count": {"$lt": c.POSITION_BUCKET_SIZE},
+        },
+    ),
+]
+
+# stages of a query plan reading a whole collection or sorting in memory
+BLOCKING_STAGES = {"COLLSCAN", "SORT", "$sort"}
+
+_ensured_pid = None
+_lock = threading.Lock()
+
+
+def ensure_indexes(db: Database = None) -> None:
+    """Create the declared indexes, once per process"""
+
+    global _ensured_pid
+
+    if _ensured_pid == os.getpid():
+        return
+
+    with _lock:
+        if _ensured_pid == os.getpid():
+            return
+
+        db = mongo.get_db() if db is None else db
+        ensured = True
+        for collection, indexes in INDEXES.items():
+            try:
+                update_ttl(db[collection], indexes)
+                db[collection].create_indexes(indexes)
+            except (OperationFailure, ServerSelectionTimeoutError) as e:
+                # the other collections are still indexed, and this one
+                # is retried by the next call
+                logging.error(f"Cannot create indexes on {collection}. {e}")
+                ensured = False
+
+        if ensured:
+            _ensured_pid = os.getpid()
+
+
+def update_ttl(col: Any, indexes: list) -> None:
+    """
+    Set the declared expiry of the existing TTL indexes of col with
+    collMod, as create_indexes fails when an index option changed
+    (ex: SCHEDULES_TTL_SECONDS)
+    """
+
+    existing = col.index_information()
+    for index in indexes:
+        document = index.document
+        expiry = document.get("expireAfterSeconds")
+        info = existing.get(document["name"])
+        if (
+            expiry is not None
+            and info is not None
+            and info.get("expireAfterSeconds") != expiry
+        ):
+            col.database.command(
+                "collMod",
+                col.name,
+                index={"name": document["name"], "expireAfterSeconds": expiry},
+            )
+            logging.info(
+                f"Expiry of {col.name}.{document['name']} set to {expiry} s"
+            )
+
+
+def hot_pipelines() -> list:
+    """
+    returns the aggregation pipelines run on every board, route or trace
+    request, as (collection, pipeline), built by the functions of utils
+    """
+
+    # only the check of the plans needs the reads of utils
+    import utils
+
+    end = datetime(2023, 1, 1, 12)
+    return [
+        ("flights", utils.board_pipeline("arrivals", "FRA", page_size=10)[1]),
+        (
+            "flights",
+            utils.board_pipeline("departures", "FRA", page_size=10)[1],
+        ),
+        ("flights_view", utils.routes_pipeline("FRA", "CDG")),
+        (
+            "positions",
+            utils.position_samples_pipeline(
+                "DLH400", ["lat", "lon"], end - timedelta(hours=1), end
+            ),
+        ),
+    ]
+
+
+def blocking_stages(explain: Any) -> set:
+    """
+    returns the COLLSCAN and in memory SORT stages of the output of an
+    explain, those of the rejected plans excluded
+    """
+
+    found = set()
+    if isinstance(explain, dict):
+        found.update(BLOCKING_STAGES.intersection([explain.get("stage")]))
+        # $sort stage of a pipeline, which the query plan doesn't serve
+        found.update(BLOCKING_STAGES.intersection(explain))
+        for key, value in explain.items():
+            if key not in ("rejectedPlans", "command"):
+                found |= blocking_stages(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            found |= blocking_stages(value)
+    return found
+
+
+def find_unindexed(db: Database = None) -> list:
+    """
+    returns the hot queries which are not served by an index, as
+    (collection, query, blocking stages)
+    """
+
+    db = mongo.get_db() if db is None else db
+
+    explains = [
+        (collection, filter, db[collection].find(filter).explain())
+        for collection, filter in UPSERT_FILTERS
+    ]
+    explains += [
+        (
+            collection,
+            pipeline,
+            db.command(
+                "aggregate", collection, pipeline=pipeline, explain=True
+            ),
+        )
+        for collection, pipeline in hot_pipelines()
+    ]
+
+    unindexed = []
+    for collection, query, explain in explains:
+        stages = blocking_stages(explain)
+        if stages:
+            unindexed.append((collection, query, stages))
+
+    return unindexed
+
+
+def main():
+    """Create the indexes and check the query plans of the hot queries"""
+
+    logging.basicConfig(level=logging.INFO)
+
+    ensure_indexes()
+    unindexed = find_unindexed()
+    for collection, query, stages in unindexed:
+        logging.error(f"{sorted(stages)} on {collection} : {query}")
+
+    if unindexed:
+        sys.exit(1)
+
+    logging.info("All the hot queries are served by an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""Latency, call count and payload size metrics of the app and cron jobs.
+
+The Dash callbacks and the I/O functions (OpenSky fetch, MongoDB reads and
+writes, Lufthansa requests, SQLite loads, figure builds) are decorated
+with `timed`, which records in the process-wide `registry` :
+- `stage_duration_seconds{kind, name}` : histogram of their latency, with
+  the number of calls
+- `stage_errors_total{kind, name}` : calls raising an exception
+- `stage_items{kind, name}` : histogram of the size of their result, for
+  those decorated with a `size` function
+
+`init_app` serves them in the Prometheus text format on METRICS_PATH of
+the Flask server, with the uncompressed size of the callback responses
+and the values of collectors such as `mongo.pool_stats`. The cron jobs
+log their `summary`. The metrics are those of the current process, each
+gunicorn worker serving its own.
+"""
+
+import bisect
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from flask import Response, g, has_request_context
+
+import constants as c
+
+# upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # fmt: skip
+SIZE_BUCKETS = (10, 100, 1e3, 1e4, 1e5, 1e6, 1e7)
+
+INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _escape(value: Any) -> str:
+    """returns a label value escaped for the Prometheus text format"""
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    """returns the labels of a sample, as {name="value",...}"""
+
+    pairs = [
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Counter by label values
+
+    Parameters:
+    -----------
+        name        : metric name
+        help        : description of the metric
+        labels      : names of the labels
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def inc(self, *values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[values] = self._values.get(values, 0.0) + amount
+
+    def value(self, *values: str) -> float:
+        return self._values.get(values, 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def lines(self) -> list:
+        """returns the samples in the Prometheus text format"""
+
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_labels(self.labels, key)} {value}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class _Series:
+    """Bucket counts, sum, count and maximum of observed values"""
+
+    __slots__ = ("buckets", "sum", "count", "max")
+
+    def __init__(self, size: int) -> None:
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+class Histogram:
+    """
+    Histogram by label values
+
+    Parameters:
+    -----------
+        name        : metric name
+        help        : description of the metric
+        labels      : names of the labels
+        buckets     : upper bounds of the buckets, the last one +Inf
+                      being added
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: dict = {}
+
+    def observe(self, value: float, *values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = _Series(len(self.buckets) + 1)
+            series.buckets[index] += 1
+            series.sum += value
+            series.count += 1
+            series.max = max(series.max, value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series = {}
+
+    def summary(self) -> dict:
+        """returns the count, sum and maximum by label values"""
+
+        with self._lock:
+            return {
+                key: {"count": s.count, "sum": s.sum, "max": s.max}
+                for key, s in self._series.items()
+            }
+
+    def lines(self) -> list:
+        """returns the samples in the Prometheus text format"""
+
+        with self._lock:
+            series = {
+                key: (list(s.buckets), s.sum, s.count)
+                for key, s in self._series.items()
+            }
+
+        lines = []
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        for key, (buckets, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(bounds, buckets):
+                cumulative += n
+                labels = _labels(self.labels, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics of the process and collectors of other statistics"""
+
+    def __init__(self) -> None:
+        self._metrics: list = []
+        self._collectors: dict = {}
+
+    def register(self, metric: Any) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, prefix: str, collect: Callable[[], dict]) -> None:
+        """
+        Add the numeric values returned by collect as gauges named
+        prefix_key, read when rendering the metrics
+        """
+
+        self._collectors[prefix] = collect
+
+    def reset(self) -> None:
+        for metric in self._metrics:
+            metric.reset()
+
+    def render(self) -> str:
+        """returns the metrics in the Prometheus text format"""
+
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.lines())
+
+        for prefix, collect in self._collectors.items():
+            try:
+                values = collect()
+            except Exception as e:
+                logging.warning(f"Cannot collect {prefix} metrics. {e}")
+                continue
+            for key, value in values.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                name = INVALID_NAME_CHARS.sub("_", f"{prefix}_{key}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {float(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_duration = registry.register(
+    Histogram(
+        "stage_duration_seconds",
+        "Latency of the callbacks and I/O functions",
+        ("kind", "name"),
+    )
+)
+stage_errors = registry.register(
+    Counter(
+        "stage_errors_total",
+        "Calls of the callbacks and I/O functions raising an exception",
+        ("kind", "name"),
+    )
+)
+stage_items = registry.register(
+    Histogram(
+        "stage_items",
+        "Size of the results of the I/O functions (airplanes, rows...)",
+        ("kind", "name"),
+        SIZE_BUCKETS,
+    )
+)
+response_bytes = registry.register(
+    Histogram(
+        "callback_response_bytes",
+        "Uncompressed size of the responses of the Dash callbacks",
+        ("name",),
+        SIZE_BUCKETS,
+    )
+)
+
+
+@contextmanager
+def timer(kind: str, name: str):
+    """Record the latency of a block, and whether it raised"""
+
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(kind, name)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - start, kind, name)
+
+
+def timed(
+    kind: str,
+    name: Optional[str] = None,
+    size: Optional[Callable[[Any], int]] = None,
+) -> Callable:
+    """
+    returns a decorator recording the latency and calls of a function,
+    coroutine function included
+
+    Parameters:
+    -----------
+        kind        : kind of stage ("callback", "opensky", "mongo_read"...)
+        name        : name of the stage, the function name by default
+        size        : function of the result returning its size
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if not c.METRICS_ENABLED:
+            return func
+
+        label = name or func.__name__
+
+        def record_size(result: Any) -> None:
+            if size is not None and result is not None:
+                stage_items.observe(size(result), kind, label)
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timer(kind, label):
+                    result = await func(*args, **kwargs)
+                record_size(result)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(kind, label):
+                result = func(*args, **kwargs)
+            record_size(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def callback(func: Callable) -> Callable:
+    """
+    Decorator of the Dash callbacks : records their latency, and names
+    their response for its size to be recorded (init_app)
+    """
+
+    if not c.METRICS_ENABLED:
+        return func
+
+    timed_func = timed("callback")(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if has_request_context():
+            g.metrics_callback = func.__name__
+        return timed_func(*args, **kwargs)
+
+    return wrapper
+
+
+def record_response_size(response: Any) -> Any:
+    """Record the size of the response of a callback (after_request)"""
+
+    name = g.get("metrics_callback")
+    if name and not response.is_streamed:
+        response_bytes.observe(len(response.get_data()), name)
+    return response
+
+
+def metrics_view() -> Response:
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(server: Any, collectors: Optional[dict] = None) -> None:
+    """
+    Serve the metrics on METRICS_PATH of a Flask server
+
+    Parameters:
+    -----------
+        server      : Flask server of the Dash app
+        collectors  : functions returning statistics to serve as gauges,
+                      by metric name prefix
+    """
+
+    if not c.METRICS_ENABLED:
+        return
+
+    for prefix, collect in (collectors or {}).items():
+        registry.add_collector(prefix, collect)
+
+    # registered after flask-compress, so run before the compression
+    server.after_request(record_response_size)
+    server.add_url_rule(c.METRICS_PATH, "metrics", metrics_view)
+
+
+def summary() -> dict:
+    """
+    returns the calls, errors, total and maximum seconds of each stage,
+    by "kind.name"
+    """
+
+    return {
+        f"{kind}.{name}": {
+            "calls": stats["count"],
+            "errors": int(stage_errors.value(kind, name)),
+            "seconds": round(stats["sum"], 3),
+            "max_seconds": round(stats["max"], 3),
+        }
+        for (kind, name), stats in sorted(stage_duration.summary().items())
+    }
@@ -0,0 +1,131 @@
+"""Migrate the legacy `position` documents to the bucketed `positions`.
+
+The legacy documents hold four parallel arrays (lat, lon, altitude and
+date_time) per callsign, date_time being a "%H:%M:%S" string in the local
+time of the writer. The date of each sample is rebuilt from the creation
+date of the document, moving to the next day whenever the time goes back.
+
+The samples older than POSITION_RETENTION_SECONDS are not migrated : the
+TTL index of the positions would remove them at once. With --drop, they
+are dropped with the legacy collection.
+
+Usage: $ python migrate_positions.py [--drop] [--dry-run]
+"""
+
+import argparse
+import logging
+from datetime import datetime, time, timedelta, timezone
+
+import constants as c
+import indexes
+import mongo
+import utils
+
+
+def init_args() -> argparse.Namespace:
+    """Parse the command line arguments and returns them"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--drop",
+        action="store_true",
+        help="Drop the legacy position collection once migrated",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Count the samples to migrate without writing them",
+    )
+    return parser.parse_args()
+
+
+def legacy_samples(doc: dict) -> list:
+    """
+    returns the samples of a legacy position document
+
+    Parameters:
+    -----------
+        doc         : legacy document with lat, lon, altitude and date_time
+
+    Returns :
+    ---------
+        samples     : list of dict with t (UTC datetime), lat, lon and alt
+    """
+
+    day = doc["_id"].generation_time.astimezone().date()
+    previous = None
+    samples = []
+
+    for lat, lon, alt, date_time in zip(
+        doc.get("lat", []),
+        doc.get("lon", []),
+        doc.get("altitude", []),
+        doc.get("date_time", []),
+    ):
+        sample_time = time.fromisoformat(date_time)
+        if previous is not None and sample_time < previous:
+            day += timedelta(days=1)
+        previous = sample_time
+
+        # naive datetimes are in the local time of the writer
+        t = datetime.combine(day, sample_time).astimezone(timezone.utc)
+        samples.append({"t": t, "lat": lat, "lon": lon, "alt": alt})
+
+    return samples
+
+
+def migrate(drop: bool = False, dry_run: bool = False) -> int:
+    """
+    Copy the legacy position samples within the retention period into the
+    position buckets
+
+    Returns :
+    ---------
+        migrated    : number of samples written, or to write if dry_run
+    """
+
+    db = mongo.get_db()
+    indexes.ensure_indexes(db)
+
+    retained = datetime.now(timezone.utc) - timedelta(
+        seconds=c.POSITION_RETENTION_SECONDS
+    )
+
+    migrated = 0
+    expired = 0
+    for doc in db.position.find({}):
+        if not doc.get("callsign"):
+            continue
+
+        samples = legacy_samples(doc)
+        operations = [
+            utils.position_bucket_update(doc["callsign"], sample)
+            for sample in samples
+            if sample["t"] >= retained
+        ]
+        expired += len(samples) - len(operations)
+        if dry_run:
+            migrated += len(operations)
+        else:
+            migrated += utils.bulk_write_batches(
+                db.positions, operations, c.POSITION_BATCH_SIZE
+            )
+
+    logging.info(f"Migrated {migrated} position samples")
+    if expired:
+        logging.info(
+            f"Skipped {expired} position samples older than the retention "
+            f"period ({c.POSITION_RETENTION_SECONDS} s)"
+        )
+
+    if drop and not dry_run:
+        db.position.drop()
+        logging.info("Dropped the legacy position collection")
+
+    return migrated
+
+
+if __name__ == "__main__":
+    args = init_args()
+    logging.basicConfig(level=logging.INFO)
+    migrate(args.drop, args.dry_run)
@@ -0,0 +1,159 @@
+"""Process-wide MongoDB client shared by the Dash app and the cron jobs.
+
+The client is created lazily on first use and reused by every caller, so
+the connection pool, server discovery and monitor threads are set up once
+per process. A new client is created transparently after a fork (gunicorn
+workers), as a MongoClient must not be shared across processes.
+"""
+
+import os
+import threading
+
+from pymongo import MongoClient, monitoring
+from pymongo.database import Database
+
+import constants as c
+
+_client = None
+_pid = None
+_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collect connection pool statistics to help sizing the pool"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset all counters"""
+
+        with self._lock:
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+            self.connections_created = 0
+            self.connections_closed = 0
+
+    def stats(self) -> dict:
+        """returns a snapshot of the counters"""
+
+        with self._lock:
+            checkouts = self.checkouts
+            return {
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_time_total_s": self.wait_time_total,
+                "wait_time_avg_s": (
+                    self.wait_time_total / checkouts if checkouts else 0.0
+                ),
+                "wait_time_max_s": self.wait_time_max,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+            }
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_time_total += event.duration
+            self.wait_time_max = max(self.wait_time_max, event.duration)
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self.checkout_failures += 1
+            self.wait_time_total += event.duration
+            self.wait_time_max = max(self.wait_time_max, event.duration)
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+
+pool_listener = PoolStatsListener()
+
+
+def get_client() -> MongoClient:
+    """returns the MongoClient of the current process, creating it if needed"""
+
+    global _client, _pid
+
+    pid = os.getpid()
+    if _client is None or _pid != pid:
+        with _lock:
+            if _client is None or _pid != pid:
+                # a client inherited from the parent process is dropped
+                # without closing it, its sockets belong to the parent
+                _client = MongoClient(
+                    c.MONGO_CONNECTION_STR,
+                    maxPoolSize=c.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=c.MONGO_MIN_POOL_SIZE,
+                    connectTimeoutMS=c.MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=c.MONGO_SERVER_SELECTION_TIMEOUT_MS,  # fmt: skip
+                    waitQueueTimeoutMS=c.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    connect=False,
+                    event_listeners=[pool_listener],
+                )
+                _pid = pid
+                pool_listener.reset()
+
+    return _client
+
+
+def get_db() -> Database:
+    """returns the flightTracker database"""
+
+    return get_client()[c.MONGO_DB_NAME]
+
+
+def close_client() -> None:
+    """Close the client of the current process, if any"""
+
+    global _client, _pid
+
+    with _lock:
+        if _client is not None and _pid == os.getpid():
+            _client.close()
+        _client = None
+        _pid = None
+
+
+def pool_stats() -> dict:
+    """returns the connection pool statistics of the current process"""
+
+    stats = pool_listener.stats()
+    stats["max_pool_size"] = c.MONGO_MAX_POOL_SIZE
+    return stats
@@ -0,0 +1,193 @@
+"""Decoding of the OpenSky state vectors into column arrays.
+
+The `states/all` response of the whole world is a few MB of JSON holding
+a list of about 10k state vectors. Instead of parsing it into a list of
+lists, the state vectors are read from the response stream by blocks of
+BLOCK_SIZE rows, each block being copied into preallocated column arrays
+(one per field) before the next one is parsed. `get_opensky_df` and
+`update_position` both read these columns.
+
+The stream is parsed incrementally with ijson if it is installed, with
+json otherwise.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+import constants as c
+
+try:
+    import ijson
+except ImportError:  # optional, the whole response is parsed by json
+    ijson = None
+
+# fields of the opensky state vectors and their dtype in the dataframe
+OPENSKY_DTYPES = {
+    "icao24": "str",
+    "callsign": "str",
+    "origin_country": "category",
+    "time_position": "Int64",
+    "last_contact": "int64",
+    "long": "float32",
+    "lat": "float32",
+    "baro_altitude": "float32",
+    "on_ground": "bool",
+    "velocity": "float32",
+    "true_track": "float32",
+    "vertical_rate": "float32",
+    "sensors": "object",
+    "geo_altitude": "float32",
+    "squawk": "str",
+    "spi": "bool",
+    "position_source": "Int8",
+}
+
+# dtype of the decoded columns : numbers as float64 with NaN for missing
+# values, converted to their dataframe dtype by get_opensky_df
+COLUMN_DTYPES = {
+    name: (
+        "object"
+        if dtype in ("str", "category", "object")
+        else "bool" if dtype == "bool" else "float64"
+    )
+    for name, dtype in OPENSKY_DTYPES.items()
+}
+
+BLOCK_SIZE = 2048
+
+# OpenSky sends the time of the snapshot before the state vectors
+TIME_FIELD = re.compile(rb'"time"\s*:\s*(\d+)')
+
+
+@dataclass(frozen=True)
+class StateColumns:
+    """State vectors of an OpenSky response, one array per field"""
+
+    time: Optional[int]
+    columns: dict = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.columns["icao24"])
+
+
+class _HeadReader:
+    """Binary stream keeping a copy of its first bytes"""
+
+    def __init__(self, stream: Any, size: int = 256) -> None:
+        self._stream = stream
+        self._size = size
+        self.head = b""
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        if len(self.head) < self._size:
+            self.head += data[: self._size - len(self.head)]
+        return data
+
+
+def empty_columns(capacity: int) -> dict:
+    """returns the column arrays of capacity state vectors"""
+
+    return {
+        name: (
+            np.full(capacity, np.nan)
+            if dtype == "float64"
+            else np.empty(capacity, dtype=dtype)
+        )
+        for name, dtype in COLUMN_DTYPES.items()
+    }
+
+
+def from_rows(
+    rows: Iterable, time: Optional[int] = None, capacity: int = 0
+) -> StateColumns:
+    """
+    returns the columns of state vectors, read by blocks of BLOCK_SIZE
+
+    Parameters:
+    -----------
+        rows        : state vectors, as lists of OpenSky fields
+        time        : time of the snapshot
+        capacity    : expected number of state vectors, the arrays are
+                      enlarged if there are more
+    """
+
+    columns = empty_columns(capacity)
+    block = np.empty((BLOCK_SIZE, len(COLUMN_DTYPES)), dtype=object)
+    rows = iter(rows)
+    size = 0
+
+    while True:
+        block_rows = list(islice(rows, BLOCK_SIZE))
+        if not block_rows:
+            break
+        n = len(block_rows)
+        end = size + n
+        block[:n] = block_rows
+
+        if end > len(columns["icao24"]):
+            larger = empty_columns(max(2 * end, BLOCK_SIZE))
+            for name, values in columns.items():
+                larger[name][:size] = values[:size]
+            columns = larger
+
+        for i, (name, dtype) in enumerate(COLUMN_DTYPES.items()):
+            values = block[:n, i]
+            columns[name][size:end] = (
+                values if dtype == "object" else values.astype(dtype)
+            )
+        size = end
+
+    return StateColumns(time, {name: a[:size] for name, a in columns.items()})
+
+
+def from_stream(
+    stream: Any, capacity: int = c.OPENSKY_STATES_CAPACITY
+) -> StateColumns:
+    """
+    returns the columns of an OpenSky response read from a binary stream
+
+    Parameters:
+    -----------
+        stream      : file-like object of the response body
+        capacity    : expected number of state vectors
+
+    Raises ValueError when the body is truncated or isn't valid JSON
+    """
+
+    if ijson is None:
+        return decode(json.load(stream), capacity)
+
+    reader = _HeadReader(stream)
+    rows = ijson.items(reader, "states.item", use_float=True)
+    try:
+        states = from_rows(rows, capacity=capacity)
+    except ijson.JSONError as e:
+        # ijson errors don't derive from ValueError as those of json
+        raise ValueError(f"Invalid OpenSky response. {e}") from e
+
+    match = TIME_FIELD.search(reader.head)
+    return StateColumns(int(match.group(1)) if match else None, states.columns)  # fmt: skip
+
+
+def decode(response: Any, capacity: int = 0) -> StateColumns:
+    """
+    returns the columns of an OpenSky response
+
+    Parameters:
+    -----------
+        response    : StateColumns, returned as is, or parsed response
+                      with the `time` and `states` of the airplanes
+        capacity    : expected number of state vectors
+    """
+
+    if isinstance(response, StateColumns):
+        return response
+
+    states = response["states"] or []
+    return from_rows(states, response.get("time"), capacity or len(states))
@@ -0,0 +1,121 @@
+"""Background poller of the OpenSky API.
+
+A single thread fetches all the flying airplanes every MAP_UPDATE_INTERVAL
+and publishes them as an immutable snapshot in the snapshot store. Dash
+callbacks only read the latest snapshot, so the number of upstream
+requests doesn't depend on the number of connected users. With a shared
+store, only the worker holding the store leadership polls.
+"""
+
+import logging
+import os
+import threading
+
+import requests
+
+import constants as c
+import utils
+from snapshot_store import Snapshot, create_store
+
+store = create_store()
+
+_empty_snapshot = Snapshot.build(0, utils.get_opensky_df({"states": []}))
+_thread = None
+_pid = None
+_stop = threading.Event()
+_lock = threading.Lock()
+
+
+def get_snapshot() -> Snapshot:
+    """returns the latest published snapshot"""
+
+    snapshot = store.latest()
+    return _empty_snapshot if snapshot is None else snapshot
+
+
+def refresh() -> Snapshot:
+    """Fetch the airplanes from OpenSky and publish a new snapshot"""
+
+    previous = get_snapshot()
+
+    try:
+        response = utils.get_opensky_flights()
+        df = utils.get_opensky_df(response)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logging.error(f"Cannot get flights from OpenSky, snapshot kept. {e}")
+        return previous
+
+    snapshot = Snapshot.build(previous.version + 1, df)
+    store.publish(snapshot)
+    logging.info(
+        f"Updated positions. Number of flights : {len(df)} "
+        f"(snapshot {snapshot.version})"
+    )
+
+    return snapshot
+
+
+def _refresh_if_leader() -> None:
+    """Refresh the snapshot if this process polls, never raising"""
+
+    try:
+        if store.acquire_leadership():
+            refresh()
+    except Exception as e:
+        # the map must not freeze because of one failed poll
+        logging.error(f"OpenSky poll failed, snapshot kept. {e}")
+
+
+def _poll(interval: float) -> None:
+    """Refresh the snapshot every interval seconds until stopped"""
+
+    while not _stop.wait(interval):
+        _refresh_if_leader()
+
+
+def start_poller(
+    interval: float = c.MAP_UPDATE_INTERVAL / 1000, reloader: bool = False
+) -> None:
+    """
+    Publish a first snapshot and start the polling thread,
+    once per process
+
+    Parameters:
+    -----------
+        interval    : time between two OpenSky requests, in seconds
+        reloader    : whether the app runs with the reloader of the debug
+                      server. The app is then imported by the process
+                      watching the files and again by the serving one,
+                      which is the only one to poll
+    """
+
+    global _thread, _pid
+
+    if reloader and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        logging.debug("Reloader process, OpenSky not polled")
+        return
+
+    with _lock:
+        if _thread is not None and _pid == os.getpid():
+            return
+
+        _refresh_if_leader()
+
+        _stop.clear()
+        _thread = threading.Thread(
+            target=_poll, args=(interval,), name="opensky-poller", daemon=True
+        )
+        _thread.start()
+        _pid = os.getpid()
+
+
+def stop_poller() -> None:
+    """Stop the polling thread"""
+
+    global _thread
+
+    with _lock:
+        _stop.set()
+        if _thread is not None:
+            _thread.join()
+        _thread = None
@@ -0,0 +1,33 @@
+"""Directories of the files shared by the processes of the application.
+
+The snapshot store and the HTTP cache read back files written by other
+processes. Their directories must only be writable by the user running
+the application, otherwise another local user could plant the files
+(or create the directory first in a shared place such as /tmp).
+"""
+
+import os
+import stat
+
+
+def private_directory(path: str) -> str:
+    """
+    returns path, a directory created with mode 0700 if it doesn't exist
+
+    Raises PermissionError if path is not a directory owned by the current
+    user, or if it is accessible to other users
+    """
+
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+    # lstat : a symbolic link planted at path is refused
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(
+            f"{path} must be a directory of user {os.getuid()} with mode 0700"
+        )
+    return path
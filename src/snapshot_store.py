@@ -0,0 +1,316 @@
+"""Stores of the airplanes snapshots published by the poller.
+
+Two backends share the same interface :
+- `InProcessSnapshotStore` keeps the latest snapshot in memory, for a
+  single process server.
+- `SharedFileSnapshotStore` publishes the snapshots in a file of a shared
+  memory file system (/dev/shm), so that every gunicorn worker reads the
+  snapshots fetched by a single one of them. The file holds the columns
+  of the airplanes and the arrays of the spatial index as NumPy arrays
+  (npz) with a JSON header, loaded without pickle.
+
+A snapshot is swapped atomically : readers always get a whole snapshot,
+either the previous or the new one.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+import constants as c
+from private_files import private_directory
+from spatial_index import GridIndex, build_index, index_positions
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    Flying airplanes at a given time. Must not be modified once published.
+
+    `index` maps each callsign to its row in `df` and `columns` holds the
+    columns of `df` as arrays, so that an airplane is found without
+    scanning the dataframe. `grid` is the spatial index of the airplanes.
+    """
+
+    version: int
+    fetched_at: datetime
+    df: pd.DataFrame
+    index: dict = field(default_factory=dict)
+    columns: dict = field(default_factory=dict)
+    grid: Optional[GridIndex] = None
+
+    @classmethod
+    def build(cls, version: int, df: pd.DataFrame) -> "Snapshot":
+        """
+        returns a snapshot of df with its callsign and spatial indexes
+
+        Parameters:
+        -----------
+            version     : version of the snapshot
+            df          : airplanes from get_opensky_df
+        """
+
+        return cls.with_indexes(version, datetime.now(), df, build_index(df))
+
+    @classmethod
+    def with_indexes(
+        cls, version: int, fetched_at: datetime, df: pd.DataFrame, grid
+    ) -> "Snapshot":
+        """returns a snapshot of df with its callsign index and columns"""
+
+        # the first airplane wins when a callsign is used twice
+        index: dict = {}
+        for row, callsign in enumerate(df.callsign.tolist()):
+            index.setdefault(callsign, row)
+
+        columns = {name: df[name].to_numpy() for name in df.columns}
+
+        return cls(version, fetched_at, df, index, columns, grid)
+
+    def lookup(self, callsign: str) -> Optional[dict]:
+        """returns the values of the airplane with callsign, None if absent"""
+
+        row = self.index.get(callsign)
+        if row is None:
+            return None
+
+        values = {}
+        for name, column in self.columns.items():
+            value = column[row]
+            values[name] = value.item() if isinstance(value, np.generic) else value  # fmt: skip
+        return values
+
+
+class InProcessSnapshotStore:
+    """Latest snapshot kept in the memory of the current process"""
+
+    def __init__(self) -> None:
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def publish(self, snapshot: Snapshot) -> None:
+        """Replace the latest snapshot, unless it is newer"""
+
+        with self._lock:
+            if self._snapshot is None or snapshot.version > self._snapshot.version:  # fmt: skip
+                self._snapshot = snapshot
+
+    def latest(self) -> Optional[Snapshot]:
+        """returns the latest snapshot, None if nothing was published"""
+
+        return self._snapshot
+
+    def acquire_leadership(self) -> bool:
+        """returns True if this process must poll : always the case here"""
+
+        return True
+
+
+def encode_snapshot(snapshot: Snapshot) -> dict:
+    """
+    returns the arrays of a snapshot : its JSON header, the columns of its
+    dataframe and the arrays of its spatial index, none of them holding
+    Python objects
+    """
+
+    header = {
+        "version": snapshot.version,
+        "fetched_at": snapshot.fetched_at.isoformat(),
+        "columns": [],
+        "grid": None,
+    }
+    arrays = {}
+
+    for i, (name, series) in enumerate(snapshot.df.items()):
+        key = f"column_{i}"
+        dtype = series.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            kind = "category"
+            arrays[key] = series.cat.codes.to_numpy()
+            arrays[f"{key}_categories"] = dtype.categories.astype(str).to_numpy(dtype=str)  # fmt: skip
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype):
+            # nullable integers : values and mask of the missing ones
+            kind = "masked"
+            arrays[key] = series.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+            arrays[f"{key}_mask"] = series.isna().to_numpy()
+        elif dtype == object and pd.api.types.infer_dtype(series) in ("string", "empty"):  # fmt: skip
+            kind = "string"
+            arrays[key] = series.fillna("").to_numpy(dtype=str)
+            arrays[f"{key}_mask"] = series.isna().to_numpy()
+        elif dtype == object:
+            kind = "json"
+            arrays[key] = np.array([json.dumps(v) for v in series.tolist()], dtype=str)  # fmt: skip
+        else:
+            kind = "numpy"
+            arrays[key] = series.to_numpy()
+        header["columns"].append({"name": name, "dtype": str(dtype), "kind": kind})  # fmt: skip
+
+    if snapshot.grid is not None:
+        header["grid"] = {"cell_size": snapshot.grid.cell_size}
+        for name, values in snapshot.grid.arrays().items():
+            arrays[f"grid_{name}"] = values
+
+    arrays["header"] = np.array(json.dumps(header))
+    return arrays
+
+
+def decode_snapshot(arrays: Any) -> Snapshot:
+    """returns the snapshot of the arrays of encode_snapshot"""
+
+    header = json.loads(str(arrays["header"]))
+
+    data = {}
+    for i, column in enumerate(header["columns"]):
+        key = f"column_{i}"
+        kind, dtype = column["kind"], column["dtype"]
+        values = arrays[key]
+        if kind == "category":
+            data[column["name"]] = pd.Categorical.from_codes(
+                values, categories=arrays[f"{key}_categories"].tolist()
+            )
+        elif kind == "masked":
+            data[column["name"]] = pd.Series(values, dtype=dtype).mask(
+                arrays[f"{key}_mask"]
+            )
+        elif kind == "string":
+            data[column["name"]] = np.where(
+                arrays[f"{key}_mask"], None, values.astype(object)
+            )
+        elif kind == "json":
+            data[column["name"]] = [json.loads(v) for v in values.tolist()]
+        else:
+            data[column["name"]] = values
+    df = pd.DataFrame(data, columns=[x["name"] for x in header["columns"]])
+
+    grid = None
+    if header["grid"] is not None:
+        lon, lat = index_positions(df)
+        grid_arrays = {
+            name.removeprefix("grid_"): arrays[name]
+            for name in arrays.keys()
+            if name.startswith("grid_")
+        }
+        grid = GridIndex.restore(
+            lon, lat, grid_arrays, header["grid"]["cell_size"]
+        )
+
+    return Snapshot.with_indexes(
+        header["version"],
+        datetime.fromisoformat(header["fetched_at"]),
+        df,
+        grid,
+    )
+
+
+class SharedFileSnapshotStore:
+    """
+    Latest snapshot shared by the processes of a host through a file.
+
+    The snapshot is written in a temporary file then renamed over the
+    shared file, which is atomic. Readers only load it again when the file
+    changed. The directory of the file must be private to the user.
+
+    A lock file elects the process polling OpenSky : the first to lock it,
+    another one takes over if it dies. A process forking workers (gunicorn
+    master with --preload) releases the lock before the fork and doesn't
+    poll anymore, so that one of the workers polls.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        private_directory(os.path.dirname(self.path))
+        self._lock_file = None
+        self._cached = None
+        self._cached_stat = None
+        self._pid = None
+        self._forked = False
+        self._lock = threading.Lock()
+        os.register_at_fork(
+            before=self._release_leadership,
+            after_in_parent=self._stop_leading,
+            after_in_child=self._reset_after_fork,
+        )
+
+    def publish(self, snapshot: Snapshot) -> None:
+        """Write the snapshot in the shared file"""
+
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **encode_snapshot(snapshot))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Cannot publish snapshot in {self.path}. {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def latest(self) -> Optional[Snapshot]:
+        """returns the latest snapshot, None if nothing was published"""
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key != self._cached_stat:
+                with np.load(self.path, allow_pickle=False) as arrays:
+                    self._cached = decode_snapshot(arrays)
+                self._cached_stat = key
+
+            return self._cached
+
+    def acquire_leadership(self) -> bool:
+        """returns True if this process holds the polling lock"""
+
+        with self._lock:
+            if self._forked:
+                return False
+            if self._lock_file is not None and self._pid == os.getpid():
+                return True
+
+            lock_file = open(self.path + ".lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+
+            self._lock_file = lock_file
+            self._pid = os.getpid()
+            return True
+
+    def _release_leadership(self) -> None:
+        """Unlock before a fork, the children must not inherit the lock"""
+
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _stop_leading(self) -> None:
+        self._forked = True
+
+    def _reset_after_fork(self) -> None:
+        # a worker forked after others inherits the state of the parent
+        self._lock = threading.Lock()
+        self._pid = None
+        self._forked = False
+
+
+def create_store():
+    """returns the snapshot store selected by SNAPSHOT_STORE"""
+
+    if c.SNAPSHOT_STORE == "shared":
+        return SharedFileSnapshotStore(c.SNAPSHOT_STORE_PATH)
+    return InProcessSnapshotStore()
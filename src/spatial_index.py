@@ -0,0 +1,294 @@
+"""Spatial index of the airplanes of a snapshot.
+
+The airplanes are bucketed in a uniform lon/lat grid of SPATIAL_CELL_SIZE
+degrees. The rows of the snapshot are sorted by cell, so the airplanes of
+a cell are a contiguous slice of one array and a query only reads the
+cells it overlaps instead of scanning every airplane.
+
+Queries : bounding box, radius (haversine distance) and k nearest
+airplanes.
+"""
+
+import numpy as np
+
+import constants as c
+
+EARTH_RADIUS_KM = 6371.0088
+# length of a degree of latitude
+KM_PER_DEGREE = 2 * np.pi * EARTH_RADIUS_KM / 360
+
+
+def haversine(
+    lon1: np.ndarray, lat1: np.ndarray, lon2: float, lat2: float
+) -> np.ndarray:
+    """returns the great circle distances in km between points in degrees"""
+
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GridIndex:
+    """
+    Uniform lon/lat grid over positions given as NumPy arrays.
+
+    Queries return rows of the indexed arrays. Airplanes without a position
+    are not indexed.
+    """
+
+    def __init__(
+        self,
+        lon: np.ndarray,
+        lat: np.ndarray,
+        cell_size: float = c.SPATIAL_CELL_SIZE,
+    ) -> None:
+        """
+        Parameters:
+        -----------
+            lon, lat    : positions of the airplanes, in degrees
+            cell_size   : size of the cells, in degrees
+        """
+
+        self.cell_size = cell_size
+        self.n_cols = int(np.ceil(360 / cell_size))
+        self.n_rows = int(np.ceil(180 / cell_size))
+
+        self.lon = np.asarray(lon, dtype="float64")
+        self.lat = np.asarray(lat, dtype="float64")
+
+        rows = np.flatnonzero(np.isfinite(self.lon) & np.isfinite(self.lat))
+        cells = self._cells(self.lon[rows], self.lat[rows])
+        order = np.argsort(cells, kind="stable")
+
+        # rows of the airplanes sorted by cell, and for each cell the
+        # offset of its first airplane in _rows
+        self._rows = rows[order]
+        self._offsets = np.searchsorted(
+            cells[order], np.arange(self.n_cols * self.n_rows + 1)
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def arrays(self) -> dict:
+        """returns the arrays of the index, to rebuild it with restore"""
+
+        return {"rows": self._rows, "offsets": self._offsets}
+
+    @classmethod
+    def restore(
+        cls, lon: np.ndarray, lat: np.ndarray, arrays: dict, cell_size: float
+    ) -> "GridIndex":
+        """returns the index of positions from the arrays of arrays()"""
+
+        index = cls.__new__(cls)
+        index.cell_size = cell_size
+        index.n_cols = int(np.ceil(360 / cell_size))
+        index.n_rows = int(np.ceil(180 / cell_size))
+        index.lon = lon
+        index.lat = lat
+        index._rows = arrays["rows"]
+        index._offsets = arrays["offsets"]
+        return index
+
+    def _col(self, lon: np.ndarray) -> np.ndarray:
+        col = np.floor((lon + 180) / self.cell_size).astype("int64")
+        return np.clip(col, 0, self.n_cols - 1)
+
+    def _row(self, lat: np.ndarray) -> np.ndarray:
+        row = np.floor((lat + 90) / self.cell_size).astype("int64")
+        return np.clip(row, 0, self.n_rows - 1)
+
+    def _cells(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        return self._row(lat) * self.n_cols + self._col(lon)
+
+    def _candidates(
+        self, lon_min: float, lat_min: float, lon_max: float, lat_max: float
+    ) -> np.ndarray:
+        """returns the rows in the cells overlapping the box"""
+
+        col_min, col_max = self._col(np.array([lon_min, lon_max]))
+        row_min, row_max = self._row(np.array([lat_min, lat_max]))
+
+        # the cells of a box as wide as the world are contiguous
+        if col_min == 0 and col_max == self.n_cols - 1:
+            start = self._offsets[row_min * self.n_cols]
+            end = self._offsets[(row_max + 1) * self.n_cols]
+            return self._rows[start:end]
+
+        # the cells of a grid row are contiguous
+        slices = []
+        for row in range(row_min, row_max + 1):
+            start = self._offsets[row * self.n_cols + col_min]
+            end = self._offsets[row * self.n_cols + col_max + 1]
+            if end > start:
+                slices.append(self._rows[start:end])
+
+        if not slices:
+            return np.empty(0, dtype="int64")
+        return np.concatenate(slices)
+
+    def bbox(
+        self, lon_min: float, lat_min: float, lon_max: float, lat_max: float
+    ) -> np.ndarray:
+        """
+        returns the rows of the airplanes inside a bounding box
+
+        Parameters:
+        -----------
+            lon_min, lat_min    : south-west corner, in degrees
+            lon_max, lat_max    : north-east corner, in degrees.
+                                  lon_max < lon_min for a box crossing the
+                                  antimeridian
+        """
+
+        if lat_min > lat_max:
+            return np.empty(0, dtype="int64")
+
+        # a box crossing the antimeridian is split in two
+        if lon_min > lon_max:
+            boxes = [(lon_min, 180.0), (-180.0, lon_max)]
+        else:
+            boxes = [(lon_min, lon_max)]
+
+        found = []
+        for west, east in boxes:
+            rows = self._candidates(west, lat_min, east, lat_max)
+            lon = self.lon[rows]
+            lat = self.lat[rows]
+            inside = (
+                (lon >= west)
+                & (lon <= east)
+                & (lat >= lat_min)
+                & (lat <= lat_max)
+            )
+            found.append(rows[inside])
+
+        # the two parts of a box crossing the antimeridian are disjoint
+        return np.sort(np.concatenate(found))
+
+    def radius(
+        self, lon: float, lat: float, radius_km: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        returns the rows of the airplanes within radius_km of a point and
+        their distances in km, sorted by increasing distance
+
+        Parameters:
+        -----------
+            lon, lat    : center, in degrees
+            radius_km   : radius of the circle, in km
+        """
+
+        half_height = radius_km / KM_PER_DEGREE
+        lat_min = lat - half_height
+        lat_max = lat + half_height
+
+        # the circle spans more longitudes at high latitudes, and all of
+        # them if it contains a pole
+        max_lat = max(abs(lat_min), abs(lat_max))
+        if max_lat >= 90:
+            lon_min, lon_max = -180.0, 180.0
+        else:
+            half_width = half_height / np.cos(np.radians(max_lat))
+            if half_width >= 180:
+                lon_min, lon_max = -180.0, 180.0
+            else:
+                lon_min = (lon - half_width + 180) % 360 - 180
+                lon_max = (lon + half_width + 180) % 360 - 180
+
+        rows = self.bbox(
+            lon_min, max(lat_min, -90.0), lon_max, min(lat_max, 90.0)
+        )
+        distances = haversine(self.lon[rows], self.lat[rows], lon, lat)
+
+        inside = distances <= radius_km
+        rows = rows[inside]
+        distances = distances[inside]
+        order = np.argsort(distances, kind="stable")
+
+        return rows[order], distances[order]
+
+    def nearest(
+        self, lon: float, lat: float, k: int = 1
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        returns the rows of the k airplanes nearest to a point and their
+        distances in km, sorted by increasing distance
+
+        The search radius starts at about one cell and doubles until it
+        contains k airplanes : the airplanes outside of it are farther
+        than those found.
+
+        Parameters:
+        -----------
+            lon, lat    : point, in degrees
+            k           : number of airplanes
+        """
+
+        k = min(k, len(self))
+        radius_km = self.cell_size * KM_PER_DEGREE
+        while True:
+            rows, distances = self.radius(lon, lat, radius_km)
+            if len(rows) >= k or radius_km > np.pi * EARTH_RADIUS_KM:
+                return rows[:k], distances[:k]
+            radius_km *= 2
+
+    def thin(
+        self,
+        rows: np.ndarray,
+        box: tuple,
+        max_count: int,
+    ) -> np.ndarray:
+        """
+        returns at most max_count of rows, evenly spread over box
+
+        The box is divided in a grid of about max_count cells and only the
+        first airplane of each cell is kept, so dense areas are thinned
+        while isolated airplanes remain visible.
+
+        Parameters:
+        -----------
+            rows        : rows returned by bbox(*box)
+            box         : (lon_min, lat_min, lon_max, lat_max)
+            max_count   : maximum number of rows
+        """
+
+        if len(rows) <= max_count:
+            return rows
+
+        lon_min, lat_min, lon_max, lat_max = box
+        width = (lon_max - lon_min) % 360 or 360
+        height = max(lat_max - lat_min, 1e-9)
+
+        # grid with about the aspect ratio of the box
+        n_cols = max(int(np.sqrt(max_count * width / height)), 1)
+        n_rows = max(max_count // n_cols, 1)
+
+        x = ((self.lon[rows] - lon_min) % 360) / width * n_cols
+        y = (self.lat[rows] - lat_min) / height * n_rows
+        cells = np.clip(y.astype("int64"), 0, n_rows - 1) * n_cols + np.clip(
+            x.astype("int64"), 0, n_cols - 1
+        )
+
+        # first position of each cell, len(rows) for the empty ones
+        first = np.full(n_cols * n_rows, len(rows))
+        np.minimum.at(first, cells, np.arange(len(rows)))
+        return rows[np.sort(first[first < len(rows)])]
+
+
+def index_positions(df) -> tuple:
+    """returns the longitudes and latitudes of a dataframe, as float64"""
+
+    lon = df.long.to_numpy(dtype="float64", na_value=np.nan)
+    lat = df.lat.to_numpy(dtype="float64", na_value=np.nan)
+    return lon, lat
+
+
+def build_index(df) -> GridIndex:
+    """returns the grid index of a dataframe from get_opensky_df"""
+
+    return GridIndex(*index_positions(df))
@@ -1,7 +1,10 @@
+import os
+
 import pandas as pd
 from sqlalchemy import (
     Table,
     Column,
+    Float,
     String,
     ForeignKey,
     MetaData,
@@ -41,6 +44,8 @@ Airport = Table(
     Column("city_iata", String(3), ForeignKey("City.city_iata")),
     Column("utc_offset", String(10)),
     Column("timezone_id", String(30)),
+    Column("latitude", Float, nullable=True),
+    Column("longitude", Float, nullable=True),
 )
 
 # Table Airline
@@ -58,8 +63,17 @@ meta.create_all(engine)
 
 # LOAD TABLES
 
-# Import CSV in Airport table
+# Import CSV in Airport table, with the coordinates if available
 df = pd.read_csv(c.AIRPORTS_FILE)
+if os.path.exists(c.AIRPORT_COORDINATES_FILE):
+    df_coordinates = pd.read_csv(
+        c.AIRPORT_COORDINATES_FILE,
+        usecols=["airport_iata", "latitude", "longitude"],
+    ).drop_duplicates("airport_iata")
+    df = df.merge(df_coordinates, on="airport_iata", how="left")
+else:
+    df["latitude"] = None
+    df["longitude"] = None
 df.to_sql(
     "Airport",
     engine,
@@ -71,6 +85,8 @@ df.to_sql(
         "city_iata": String(),
         "utc_offset": String(),
         "timezone_id": String(),
+        "latitude": Float(),
+        "longitude": Float(),
     },
 )
 
@@ -1,7 +1,101 @@
+import logging
+import threading
+
 from sqlalchemy import create_engine, text
-from sqlalchemy.exc import MultipleResultsFound, NoResultFound
+from sqlalchemy.exc import OperationalError
 
 import constants as c
+import metrics
+
+# In-memory indexes of the reference tables, filled by load_reference_data()
+_airports: dict = {}
+_airport_positions: dict = {}
+_airlines_by_iata: dict = {}
+_airlines_by_icao: dict = {}
+_loaded = False
+_lock = threading.Lock()
+
+
+@metrics.timed("sqlite")
+def load_reference_data() -> None:
+    """
+    Load the Airport, City and Airline tables once in memory.
+
+    Codes that match several rows are indexed with an empty value, as the
+    lookups must return nothing in that case.
+    """
+
+    global _airports, _airport_positions, _airlines_by_iata
+    global _airlines_by_icao, _loaded
+
+    engine = create_engine(c.SQL_ALCHEMY_ENGINE, echo=False)
+
+    airports: dict = {}
+    airport_positions: dict = {}
+    airlines_by_iata: dict = {}
+    airlines_by_icao: dict = {}
+
+    with engine.connect() as conn:
+        query = text(
+            "SELECT airport_iata, airport_name, city_name, country_name "
+            "FROM Airport JOIN City ON Airport.city_iata=City.city_iata;"
+        )
+        for iata, *infos in conn.execute(query):
+            _add_unique(airports, iata, tuple(infos))
+
+        query = text(
+            "SELECT airport_iata, latitude, longitude FROM Airport "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL;"
+        )
+        try:
+            for iata, lat, lon in conn.execute(query):
+                _add_unique(airport_positions, iata, (lat, lon))
+        except OperationalError:
+            # database loaded before the coordinates were added : the
+            # airplanes near the airports are not listed
+            logging.warning(
+                "No airport coordinates in the database, run sqldb_load.py"
+            )
+
+        query = text(
+            "SELECT airline_iata, airline_icao, airline_name FROM Airline;"
+        )
+        for iata, icao, name in conn.execute(query):
+            _add_unique(airlines_by_iata, iata, name)
+            _add_unique(airlines_by_icao, icao, name)
+
+    engine.dispose()
+
+    # swap the indexes at once so that readers never see a partial load
+    _airports = airports
+    _airport_positions = airport_positions
+    _airlines_by_iata = airlines_by_iata
+    _airlines_by_icao = airlines_by_icao
+    _loaded = True
+
+
+def reload_reference_data() -> None:
+    """Reload the reference tables, e.g. after running sqldb_load.py"""
+
+    with _lock:
+        load_reference_data()
+
+
+def _add_unique(index: dict, key: str, value) -> None:
+    """Add value to index under key, or blank it if key is already used"""
+
+    if key is None:
+        return
+    index[key] = "" if key in index else value
+
+
+def _ensure_loaded() -> None:
+    """Load the reference tables on first use"""
+
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                load_reference_data()
 
 
 def get_airport_infos(airport_iata):
@@ -17,26 +111,27 @@ def get_airport_infos(airport_iata):
     result      : tuple with airport_name, city_name, country_name
     """
 
-    engine = create_engine(c.SQL_ALCHEMY_ENGINE, echo=False)
+    _ensure_loaded()
 
-    with engine.connect() as conn:
-        query = text(
-            "SELECT airport_name,city_name, country_name "
-            "FROM Airport JOIN City ON Airport.city_iata=City.city_iata "
-            f'WHERE airport_iata = "{airport_iata.upper()}";'
-        )
+    return _airports.get(airport_iata.upper(), "")
 
-        try:
-            results = conn.execute(query)
-            result = results.one() if results is not None else ""
-        except MultipleResultsFound:
-            print("Many results returned. Should be only one")
-            result = ""
-        except NoResultFound:
-            print("No results returned")
-            result = ""
 
-        return result
+def get_airport_position(airport_iata):
+    """
+    Get the coordinates for given airport IATA code
+
+    Parameters:
+    -----------
+    airport_iata: airport IATA code (3-letters)
+
+    Returns :
+    ---------
+    result      : tuple with latitude, longitude in degrees
+    """
+
+    _ensure_loaded()
+
+    return _airport_positions.get(airport_iata.upper(), "")
 
 
 def get_airline_from_iata(airline_iata):
@@ -52,26 +147,9 @@ def get_airline_from_iata(airline_iata):
     result      : airline_name
     """
 
-    engine = create_engine(c.SQL_ALCHEMY_ENGINE, echo=False)
-
-    with engine.connect() as conn:
-        query = text(
-            "SELECT airline_name "
-            "FROM Airline "
-            f'WHERE airline_iata = "{airline_iata.upper()}";'
-        )
+    _ensure_loaded()
 
-        try:
-            results = conn.execute(query)
-            result = results.one()[0] if results is not None else ""
-        except MultipleResultsFound:
-            print("Many results returned. Should be only one")
-            result = ""
-        except NoResultFound:
-            print("No results returned")
-            result = ""
-
-        return result
+    return _airlines_by_iata.get(airline_iata.upper(), "")
 
 
 def get_airline_from_icao(airline_icao):
@@ -87,23 +165,6 @@ def get_airline_from_icao(airline_icao):
     result      : airline_name
     """
 
-    engine = create_engine(c.SQL_ALCHEMY_ENGINE, echo=False)
+    _ensure_loaded()
 
-    with engine.connect() as conn:
-        query = text(
-            "SELECT airline_name "
-            "FROM Airline "
-            f'WHERE airline_icao = "{airline_icao.upper()}";'
-        )
-
-        try:
-            results = conn.execute(query)
-            result = results.one()[0] if results is not None else ""
-        except MultipleResultsFound:
-            print("Many results returned. Should be only one")
-            result = ""
-        except NoResultFound:
-            print("No results returned")
-            result = ""
-
-        return result
+    return _airlines_by_icao.get(airline_icao.upper(), "")
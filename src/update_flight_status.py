@@ -1,7 +1,14 @@
+import json
 import logging
+import time
 
+import cfi_fetcher
 import utils
 import constants as c
+import http_client
+import indexes
+import metrics
+import mongo
 
 
 def main():
@@ -17,11 +24,32 @@ def main():
     utils.init_log_conf(args.loglevel, c.CRON_LOG_PATH)
 
     # Update flight status
+    start = time.perf_counter()
+    status = "ok"
+    flights = 0
     try:
-        utils.update_flight_status()
+        indexes.ensure_indexes()
+        flights = cfi_fetcher.update_flight_status()
         logging.info("Update flight status")
     except Exception as e:
+        status = "error"
         logging.error(f"Error Update flight status. {e}")
+    finally:
+        # one JSON line per run, with the time spent in each stage
+        logging.info(
+            json.dumps(
+                {
+                    "job": "update_flight_status",
+                    "status": status,
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "flights": flights,
+                    "stages": metrics.summary(),
+                    "mongo_pool": mongo.pool_stats(),
+                    "http_cache": http_client.cache_stats(),
+                }
+            )
+        )
+        mongo.close_client()
 
 
 if __name__ == "__main__":
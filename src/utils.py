@@ -1,19 +1,88 @@
 import argparse
+import base64
+import json
 import logging
 import os
+import re
+import threading
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from logging.handlers import RotatingFileHandler
-from typing import Any
+from typing import Any, Optional
 
+import numpy as np
 import requests
 import pandas as pd
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+import urllib3
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import (
+    BulkWriteError,
+    OperationFailure,
+    ServerSelectionTimeoutError,
+)
 import plotly.graph_objs as go
+from dash import Patch
+from plotly.utils import PlotlyJSONEncoder
 
 import constants as c
-from sqldb_requests import get_airline_from_iata, get_airport_infos
+import http_client
+import metrics
+import mongo
+import opensky_states
+from sqldb_requests import (
+    get_airline_from_iata,
+    get_airport_infos,
+    get_airport_position,
+)
+
+# columns of the airport boards and their field in the flights documents.
+# The flight number is the concatenation of two fields.
+BOARD_FIELDS = {
+    "arrivals": {
+        "Scheduled": "Arrival.Scheduled.Time",
+        "Actual": "Arrival.Actual.Time",
+        "Carrier": "OperatingCarrier.AirlineID",
+        "Flight": [
+            "OperatingCarrier.AirlineID",
+            "OperatingCarrier.FlightNumber",
+        ],
+        "Status": "Status.Description",
+        "Origin": "Departure.AirportCode",
+    },
+    "departures": {
+        "Scheduled": "Departure.Scheduled.Time",
+        "Actual": "Departure.Actual.Time",
+        "Carrier": "OperatingCarrier.AirlineID",
+        "Flight": [
+            "OperatingCarrier.AirlineID",
+            "OperatingCarrier.FlightNumber",
+        ],
+        "Status": "Status.Description",
+        "Destination": "Arrival.AirportCode",
+    },
+}
+
+# a term of a DataTable filter_query : {column} operator value
+FILTER_TERM = re.compile(
+    r"^\{(?P<column>[^}]+)\}\s+"
+    r"(?P<operator>[si]?(?:contains|datestartswith|eq|ne|lt|le|gt|ge|!=|<=|>=|=|<|>))"
+    r"\s+(?P<value>.+)$"
+)
+FILTER_OPERATORS = {
+    "eq": "$eq", "=": "$eq", "ne": "$ne", "!=": "$ne",
+    "lt": "$lt", "<": "$lt", "le": "$lte", "<=": "$lte",
+    "gt": "$gt", ">": "$gt", "ge": "$gte", ">=": "$gte",
+}  # fmt: skip
+
+# background writer of the airplane positions
+_position_executor = None
+_position_future = None
+_position_pid = None
+_position_lock = threading.Lock()
+# time of the last sample written, by callsign : a position OpenSky didn't
+# update since the previous snapshot is not written again
+_position_times: dict = {}
 
 
 def init_args() -> argparse.Namespace:
@@ -60,85 +129,280 @@ def get_headers(api: str) -> dict:
 
 
 # UPDATE FUNCTIONS
-def update_arrival(airport: str, date_time: str) -> None:
+def flight_filter(flight: dict) -> dict:
+    """returns the filter identifying a flight of the Lufthansa API"""
+
+    return {
+        "OperatingCarrier.AirlineID": flight["OperatingCarrier"]["AirlineID"],
+        "OperatingCarrier.FlightNumber": flight["OperatingCarrier"][
+            "FlightNumber"
+        ],
+    }
+
+
+def normalize_flights(flights: Any) -> list:
     """
-    Insert all arrivals from API in the database
+    returns the `Flight` field of a Lufthansa API response as a list.
+    The API returns a single dict instead of a list when only one flight
+    is found.
+    """
+
+    if flights is None:
+        return []
+    if isinstance(flights, dict):
+        return [flights]
+    return list(flights)
+
+
+def cfi_url(direction: str, airport: str, date_time: str, offset: int = 0) -> str:  # fmt: skip
+    """returns the URL of a page of arrivals or departures of the CFI API"""
+
+    return (
+        f"{c.BASE_URL_CFI}{direction}/{airport}/{date_time}"
+        f"?offset={offset}&limit={c.CFI_PAGE_SIZE}"
+    )
+
+
+def cfi_page(payload: dict) -> tuple:
+    """
+    returns the flights and pagination of a CFI flights response
+
+    Returns :
+    ---------
+        flights     : flights of the page, as a list
+        total       : number of flights of all pages, None if not given
+        next_url    : URL of the next page, "" on the last page
+    """
+
+    information = payload["FlightInformation"]
+    flights = normalize_flights(information["Flights"]["Flight"])
+
+    meta = information.get("Meta") or {}
+    total = meta.get("TotalCount")
+    total = int(total) if total is not None else None
+
+    next_url = ""
+    links = meta.get("Link") or []
+    for link in [links] if isinstance(links, dict) else links:
+        if link.get("@Rel") == "next":
+            next_url = link.get("@Href", "")
+
+    return flights, total, next_url
+
+
+def nested_get(doc: dict, *keys: str, default: Any = "") -> Any:
+    """returns doc[key1][key2]..., or default if a key is missing"""
+
+    for key in keys:
+        try:
+            doc = doc[key]
+        except (KeyError, TypeError):
+            return default
+    return doc
+
+
+def flight_view(flight: dict) -> dict:
+    """
+    returns the document of a flight in the flights_view collection : the
+    displayed fields of a Lufthansa flight, flattened and enriched with
+    the airport and airline names
 
     Parameters:
     -----------
-        airport     : airport for the arrivals
-        date_time   : date and time required by the API. format : %Y-%m-%dT%H:%M
+        flight      : flight from the Lufthansa API
     """
 
-    # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.flights
+    view = {
+        "carrier_code": flight["OperatingCarrier"]["AirlineID"],
+        "flight_number": flight["OperatingCarrier"]["FlightNumber"],
+        "status": nested_get(flight, "Status", "Description"),
+    }
+    view["flight"] = view["carrier_code"] + view["flight_number"]
+    view["carrier"] = get_airline_from_iata(view["carrier_code"])
+
+    for prefix, leg in [("dep", "Departure"), ("arr", "Arrival")]:
+        iata = flight[leg]["AirportCode"]
+        infos = get_airport_infos(iata)
+        terminal = nested_get(flight, leg, "Terminal", default={})
+
+        view[f"{prefix}_iata"] = iata
+        view[f"{prefix}_airport"] = infos[0] if infos else ""
+        view[f"{prefix}_city"] = infos[1] if infos else ""
+        view[f"{prefix}_date"] = nested_get(flight, leg, "Scheduled", "Date")
+        view[f"{prefix}_scheduled"] = nested_get(
+            flight, leg, "Scheduled", "Time"
+        )
+        view[f"{prefix}_actual"] = nested_get(flight, leg, "Actual", "Time")
+        view[f"{prefix}_terminal_gate"] = (
+            f'{terminal["Name"]}/{terminal["Gate"]}'
+            if "Name" in terminal and "Gate" in terminal
+            else ""
+        )
 
-    # request
-    url = f"{c.BASE_URL_CFI}arrivals/{airport}/{date_time}?offset=0&limit=100"
-    response = requests.request("GET", url, headers=get_headers("lufthansa"))
+    return view
 
-    # replace or insert all in given collection
-    if response.status_code == requests.codes.OK:
-        flights = response.json()["FlightInformation"]["Flights"]["Flight"]
 
-        if isinstance(flights, (list)):
-            for flight in flights:
-                try:
-                    query = {
-                        "$and": [
-                            {
-                                "OperatingCarrier.AirlineID": {
-                                    "$eq": flight["OperatingCarrier"][
-                                        "AirlineID"
-                                    ]
-                                }
-                            },
-                            {
-                                "OperatingCarrier.FlightNumber": {
-                                    "$eq": flight["OperatingCarrier"][
-                                        "FlightNumber"
-                                    ]
-                                }
-                            },
-                        ]
-                    }
-                    col.replace_one(query, flight, upsert=True)
-                except (IndexError, TypeError) as e:
-                    logging.error(f" URL : {url}\n{e}")
-                    continue
-        else:
-            try:
-                query = {
-                    "$and": [
-                        {
-                            "OperatingCarrier.AirlineID": {
-                                "$eq": flights["OperatingCarrier"]["AirlineID"]
-                            }
-                        },
-                        {
-                            "OperatingCarrier.FlightNumber": {
-                                "$eq": flights["OperatingCarrier"][
-                                    "FlightNumber"
-                                ]
-                            }
-                        },
-                    ]
-                }
-                col.replace_one(filter=query, replacement=flights, upsert=True)
-            except (IndexError, TypeError) as e:
-                logging.error(f" URL : {url}\n{e}")
+def flight_view_replace(flight: dict) -> ReplaceOne:
+    """returns the upsert of a flight in the flights_view collection"""
 
-    else:
-        logging.error(
-            f"Error for arrivals at {airport}\n"
-            f"request status is : {response.status_code}\n"
-            f"URL : {url}\n"
-            f"{response.text}"
+    view = flight_view(flight)
+    query = {
+        "carrier_code": view["carrier_code"],
+        "flight_number": view["flight_number"],
+    }
+
+    return ReplaceOne(query, view, upsert=True)
+
+
+@metrics.timed("mongo_write", size=int)
+def bulk_upsert_flights(
+    col: Any,
+    flights: list,
+    batch_size: int = c.BULK_WRITE_BATCH_SIZE,
+    view_col: Optional[Any] = None,
+) -> int:
+    """
+    Replace or insert flights in col with unordered bulk writes
+
+    Parameters:
+    -----------
+        col         : collection in which the flights are written
+        flights     : flights from the Lufthansa API
+        batch_size  : maximum number of flights sent in one bulk write
+        view_col    : collection of the denormalized flights (flight_view)
+                      kept up to date with col, if any
+
+    Returns :
+    ---------
+        written     : number of flights inserted or replaced
+    """
+
+    # keep the last version of each flight, as unordered upserts of the
+    # same flight in one batch could insert it twice
+    operations = {}
+    views = {}
+    for flight in flights:
+        try:
+            query = flight_filter(flight)
+            if view_col is not None:
+                view = flight_view_replace(flight)
+        except (KeyError, TypeError) as e:
+            logging.error(f"Invalid flight, missing {e} : {flight}")
+            continue
+        key = tuple(query.values())
+        operations[key] = ReplaceOne(query, flight, upsert=True)
+        if view_col is not None:
+            views[key] = view
+
+    written = bulk_write_batches(col, list(operations.values()), batch_size)
+    if view_col is not None:
+        bulk_write_batches(view_col, list(views.values()), batch_size)
+
+    return written
+
+
+def bulk_write_batches(col: Any, operations: list, batch_size: int) -> int:
+    """
+    Send write operations to col by unordered bulk writes of batch_size
+
+    Parameters:
+    -----------
+        col         : collection in which the documents are written
+        operations  : pymongo write operations (ReplaceOne, UpdateOne...)
+        batch_size  : maximum number of operations sent in one bulk write
+
+    Returns :
+    ---------
+        written     : number of documents matched or upserted
+    """
+
+    written = 0
+    for start in range(0, len(operations), batch_size):
+        end = start + batch_size
+        batch = operations[start:end]
+        try:
+            result = col.bulk_write(batch, ordered=False)
+            written += result.matched_count + result.upserted_count
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            written += e.details["nMatched"] + e.details["nUpserted"]
+            logging.error(
+                f"Bulk write on {col.name} failed for {len(errors)}/"
+                f"{len(batch)} documents of batch starting at {start}. "
+                f"First error : {errors[0]['errmsg'] if errors else e}"
+            )
+        except (OperationFailure, ServerSelectionTimeoutError) as e:
+            logging.error(
+                f"Bulk write on {col.name} failed for batch "
+                f"starting at {start} ({len(batch)} documents). {e}"
+            )
+
+    return written
+
+
+@metrics.timed("lufthansa")
+def update_airport_flights(
+    direction: str, airport: str, date_time: str
+) -> None:
+    """
+    Insert all arrivals or departures at an airport from API in the database
+
+    Parameters:
+    -----------
+        direction   : "arrivals" or "departures"
+        airport     : airport for the flights
+        date_time   : date and time required by the API. format : %Y-%m-%dT%H:%M
+    """
+
+    # connecting collections
+    db = mongo.get_db()
+
+    # request the pages, writing each one before requesting the next. A
+    # link to a page already fetched, or past the count of the flights,
+    # ends the loop
+    url = cfi_url(direction, airport, date_time)
+    fetched = set()
+    while url:
+        if url in fetched:
+            logging.warning(
+                f"Link to a page already fetched for {direction} at "
+                f"{airport} : {url}"
+            )
+            return
+        fetched.add(url)
+
+        response = http_client.get(url, "flightstatus", get_headers("lufthansa"))  # fmt: skip
+
+        if response.status_code != requests.codes.OK:
+            logging.error(
+                f"Error for {direction} at {airport}\n"
+                f"request status is : {response.status_code}\n"
+                f"URL : {url}\n"
+                f"{response.text}"
+            )
+            return
+
+        flights, total, url = cfi_page(response.json())
+        written = bulk_upsert_flights(
+            db.flights, flights, view_col=db.flights_view
         )
+        logging.debug(f"{written}/{len(flights)} {direction} at {airport}")
+
+        if total is not None and len(fetched) * c.CFI_PAGE_SIZE >= total:
+            return
+
+
+def update_arrival(airport: str, date_time: str) -> None:
+    """
+    Insert all arrivals from API in the database
+
+    Parameters:
+    -----------
+        airport     : airport for the arrivals
+        date_time   : date and time required by the API. format : %Y-%m-%dT%H:%M
+    """
 
-    # close connection
-    client.close()
+    update_airport_flights("arrivals", airport, date_time)
 
 
 def update_arrivals() -> None:
@@ -163,75 +427,8 @@ def update_departure(airport: str, date_time: str) -> None:
         airport     : airport for the departures
         date_time   : date and time required by the API. format : %Y-%m-%dT%H:%M
     """
-    # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.flights
-
-    # request
-    url = f"{c.BASE_URL_CFI}departures/{airport}/{date_time}?offset=0&limit=100"  # fmt: skip
-    response = requests.request("GET", url, headers=get_headers("lufthansa"))
-
-    # replace or insert all in given collection
-    if response.status_code == requests.codes.OK:
-        flights = response.json()["FlightInformation"]["Flights"]["Flight"]
-
-        if isinstance(flights, (list)):
-            for flight in flights:
-                try:
-                    query = {
-                        "$and": [
-                            {
-                                "OperatingCarrier.AirlineID": {
-                                    "$eq": flight["OperatingCarrier"][
-                                        "AirlineID"
-                                    ]
-                                }
-                            },
-                            {
-                                "OperatingCarrier.FlightNumber": {
-                                    "$eq": flight["OperatingCarrier"][
-                                        "FlightNumber"
-                                    ]
-                                }
-                            },
-                        ]
-                    }
-                    col.replace_one(filter=query, replacement=flight, upsert=True)  # fmt: skip
-                except (IndexError, TypeError) as e:
-                    logging.error(f" URL : {url}\n{e}")
-                    continue
-        else:
-            try:
-                query = {
-                    "$and": [
-                        {
-                            "OperatingCarrier.AirlineID": {
-                                "$eq": flights["OperatingCarrier"]["AirlineID"]
-                            }
-                        },
-                        {
-                            "OperatingCarrier.FlightNumber": {
-                                "$eq": flights["OperatingCarrier"][
-                                    "FlightNumber"
-                                ]
-                            }
-                        },
-                    ]
-                }
-                col.replace_one(filter=query, replacement=flights, upsert=True)
-            except (IndexError, TypeError) as e:
-                logging.error(f" URL : {url}\n{e}")
-
-    else:
-        logging.error(
-            f"Error for departures at {airport}\n"
-            f"request status is : {response.status_code}\n"
-            f"URL : {url}\n"
-            f"{response.text}"
-        )
 
-    # close connection
-    client.close()
+    update_airport_flights("departures", airport, date_time)
 
 
 def update_departures() -> None:
@@ -247,19 +444,7 @@ def update_departures() -> None:
         time.sleep(1)
 
 
-def remove_old_schedules(days: int = 1) -> None:
-    """Remove schedules older than (today - days) days from col"""
-
-    # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.schedules
-
-    date = datetime.now() - timedelta(days)
-    col.delete_many({"insertedDate": {"$lt": date}})
-
-    client.close()
-
-
+@metrics.timed("lufthansa")
 def update_schedule(airline: str, start: str, end: str) -> None:
     """
     Update schedule from a given airline in col
@@ -272,12 +457,11 @@ def update_schedule(airline: str, start: str, end: str) -> None:
     """
 
     # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.schedules
+    col = mongo.get_db().schedules
 
     # request
     url = f"{c.BASE_URL_SCHEDULES}airlines={airline}&startDate={start}&endDate={end}&daysOfOperation=1234567&timeMode=UTC"
-    response = requests.request("GET", url, headers=get_headers("lufthansa"))
+    response = http_client.get(url, "schedules", get_headers("lufthansa"))
 
     if response.status_code in [200, 206]:
         # insert schedule in col
@@ -307,9 +491,6 @@ def update_schedule(airline: str, start: str, end: str) -> None:
             f"Reason : {response.reason}\n{response.text}"
         )
 
-    # close connection
-    client.close()
-
 
 def update_schedules() -> None:
     """Update schedules from all compagnies"""
@@ -335,6 +516,7 @@ def update_schedules() -> None:
         time.sleep(5)
 
 
+@metrics.timed("lufthansa")
 def update_flight(flightnumber: str) -> None:
     """
     Insert a flight from a given flightnumber in col
@@ -344,36 +526,20 @@ def update_flight(flightnumber: str) -> None:
         col         : collection in which we want to insert data
         flightnumber: airline for which we want to get schedules
     """
-    # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.flights
+    # connecting collections
+    db = mongo.get_db()
 
     # request
     date = datetime.now().strftime("%Y-%m-%d")
-    url = f"{c.BASE_URL_CFI}flightnumber/{date}"
-    response = requests.request("GET", url, headers=get_headers("lufthansa"))
+    url = f"{c.BASE_URL_CFI}{flightnumber}/{date}"
+    response = http_client.get(url, "flightnumber", get_headers("lufthansa"))
 
     # replace or insert all in given collection
     if response.status_code == requests.codes.OK:
-        flight = response.json()["FlightInformation"]["Flights"]["Flight"]
-        try:
-            query = {
-                "$and": [
-                    {
-                        "OperatingCarrier.AirlineID": {
-                            "$eq": flight["OperatingCarrier"]["AirlineID"]
-                        }
-                    },
-                    {
-                        "OperatingCarrier.FlightNumber": {
-                            "$eq": flight["OperatingCarrier"]["FlightNumber"]
-                        }
-                    },
-                ]
-            }
-            col.replace_one(filter=query, replacement=flight, upsert=True)
-        except (IndexError, TypeError) as e:
-            logging.error(f" URL : {url}\n{e}")
+        flights = response.json()["FlightInformation"]["Flights"]["Flight"]
+        bulk_upsert_flights(
+            db.flights, normalize_flights(flights), view_col=db.flights_view
+        )
 
     else:
         logging.error(
@@ -383,9 +549,6 @@ def update_flight(flightnumber: str) -> None:
             f"{response.text}"
         )
 
-    # close connection
-    client.close()
-
 
 def update_flights() -> None:
     """Insert all flights from CSV in col"""
@@ -399,6 +562,7 @@ def update_flights() -> None:
         time.sleep(1)
 
 
+@metrics.timed("lufthansa")
 def update_route(dep: str, arr: str) -> None:
     """
     Update route given by dep and arr from the API in DB
@@ -409,39 +573,17 @@ def update_route(dep: str, arr: str) -> None:
         arr : arrival iata airport code
     """
     # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.routes
+    col = mongo.get_db().routes
 
     # request
     date = datetime.now().strftime("%Y-%m-%d")
     url = f"{c.BASE_URL_CFI}route/{dep}/{arr}/{date}"
-    response = requests.request("GET", url, headers=get_headers("lufthansa"))
+    response = http_client.get(url, "route", get_headers("lufthansa"))
 
     # replace or insert all in given collection
     if response.status_code == requests.codes.OK:
         routes = response.json()["FlightInformation"]["Flights"]["Flight"]
-        for route in routes:
-            try:
-                query = {
-                    "$and": [
-                        {
-                            "OperatingCarrier.AirlineID": {
-                                "$eq": route["OperatingCarrier"]["AirlineID"]
-                            }
-                        },
-                        {
-                            "OperatingCarrier.FlightNumber": {
-                                "$eq": route["OperatingCarrier"][
-                                    "FlightNumber"
-                                ]
-                            }
-                        },
-                    ]
-                }
-                col.replace_one(filter=query, replacement=route, upsert=True)
-            except (IndexError, TypeError) as e:
-                logging.error(f" URL : {url}\n{e}")
-                continue
+        bulk_upsert_flights(col, normalize_flights(routes))
     else:
         logging.error(
             f"Error for route {dep}/{arr}\n"
@@ -450,9 +592,6 @@ def update_route(dep: str, arr: str) -> None:
             f"{response.text}"
         )
 
-    # close connection
-    client.close()
-
 
 def update_routes() -> None:
     """Updates all routes from API in the database"""
@@ -466,339 +605,452 @@ def update_routes() -> None:
         time.sleep(1)
 
 
-def update_flight_status() -> None:
-    """Update flight status on all airports"""
+def position_bucket_update(callsign: str, sample: dict) -> UpdateOne:
+    """
+    returns the upsert adding a sample to the position bucket of callsign.
 
-    airports = pd.read_csv(c.VALID_AIRPORTS_FILE)
-    airport_shortlist = airports["airport"]
+    A bucket holds at most POSITION_BUCKET_SIZE samples of one callsign
+    within a time window of POSITION_BUCKET_SECONDS. When the bucket of
+    the window is full, the upsert creates a new one.
 
-    date_time = datetime.now().strftime("%Y-%m-%dT08:00")
+    Parameters:
+    -----------
+        callsign    : airplane callsign
+        sample      : dict with t (UTC datetime), lat, lon and alt
+    """
 
-    for airport in airport_shortlist:
-        logging.debug(airport)
+    timestamp = sample["t"].timestamp()
+    window = datetime.fromtimestamp(
+        timestamp - timestamp % c.POSITION_BUCKET_SECONDS, timezone.utc
+    )
 
-        update_departure(airport, date_time)
-        update_arrival(airport, date_time)
+    return UpdateOne(
+        {
+            "callsign": callsign,
+            "window": window,
+            "count": {"$lt": c.POSITION_BUCKET_SIZE},
+        },
+        {
+            "$push": {"samples": sample},
+            "$inc": {"count": 1},
+            "$min": {"first": sample["t"]},
+            "$max": {"last": sample["t"]},
+        },
+        upsert=True,
+    )
 
-        time.sleep(1)
 
+@metrics.timed("mongo_write")
+def update_position(response: Any) -> float:
+    """
+    update airplane GPS position and altitude from opensky API
 
-def update_position(response: Any) -> None:
-    """update airplane GPS position and altitude from opensky API"""
+    The airplanes whose time_position didn't change since the previous
+    call are skipped, their sample being written already.
 
-    # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.position
+    Parameters:
+    -----------
+        response    : opensky API response with the `states` of the airplanes,
+                      or its StateColumns
 
-    # set index on 'callsign' in position collection if it doesn't exist
-    indexes = []
-    for idx in col.list_indexes():
-        indexes.append(idx["name"])
+    Returns :
+    ---------
+        elapsed     : time spent writing the snapshot, in seconds
+    """
 
-    if "callsign_1" not in indexes:
-        col.create_index([("callsign", ASCENDING)])
+    global _position_times
 
-    # update flight position and altitude or insert if not found
-    for flight in response["states"]:
-        filter = {"callsign": flight[1]}
-        update = {
-            "$push": {
-                "lat": flight[6],
-                "lon": flight[5],
-                "altitude": flight[13],
-                "date_time": datetime.now().strftime("%H:%M:%S"),
-            }
-        }
+    start = time.perf_counter()
 
-        try:
-            col.update_one(filter=filter, update=update, upsert=True)
-        except OperationFailure as e:
-            logging.error(f"Error updating position of Flight : {flight}. {e}")
+    # connecting collection
+    col = mongo.get_db().positions
+
+    # one sample per callsign, the last state vector wins.
+    # The sample time is the time of the position report if known.
+    states = opensky_states.decode(response)
+    columns = states.columns
+    snapshot_time = states.time or time.time()
+    times = np.nan_to_num(columns["time_position"], nan=0)
+    times = np.where(times == 0, snapshot_time, times).tolist()
+    lats, lons, alts = (
+        np.where(np.isnan(columns[name]), None, columns[name]).tolist()
+        for name in ["lat", "long", "geo_altitude"]
+    )
+
+    operations = {}
+    sample_times = {}
+    for i, callsign in enumerate(columns["callsign"].tolist()):
+        if not callsign:
             continue
-        except ServerSelectionTimeoutError as e:
-            logging.error(f"Cannot connect to server. {e}")
+        sample_times[callsign] = times[i]
+        if _position_times.get(callsign) == times[i]:
+            operations.pop(callsign, None)
             continue
+        sample = {
+            "t": datetime.fromtimestamp(times[i], timezone.utc),
+            "lat": lats[i],
+            "lon": lons[i],
+            "alt": alts[i],
+        }
+        operations[callsign] = position_bucket_update(callsign, sample)
 
-    # close connection
-    client.close()
+    # update flight position and altitude or insert if not found
+    written = bulk_write_batches(
+        col, list(operations.values()), c.POSITION_BATCH_SIZE
+    )
 
+    # after a failed write, the samples are written again if unchanged
+    if written == len(operations):
+        _position_times = sample_times
+    else:
+        _position_times = {}
 
-# DB REQUESTS
-def get_arrivals(airport: str) -> pd.DataFrame:
-    """Get list of arrivals at given Airport"""
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Updated {written}/{len(operations)} positions "
+        f"in {elapsed * 1000:.0f} ms"
+    )
 
-    # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.flights
+    return elapsed
+
+
+def submit_position_update(response: Any) -> Optional[Future]:
+    """
+    Write the positions of an opensky response in a background thread,
+    so that the caller doesn't wait for MongoDB.
+    The snapshot is dropped if the previous one is still being written.
+
+    Returns :
+    ---------
+        future      : future of update_position, None if dropped
+    """
+
+    global _position_executor, _position_future, _position_pid
+
+    with _position_lock:
+        # threads of a parent process don't exist after a fork
+        if _position_pid != os.getpid():
+            _position_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="position"
+            )
+            _position_future = None
+            _position_pid = os.getpid()
 
-    arr_found = list(
-        col.find(
-            filter={"Arrival.AirportCode": airport.upper()},
-            sort=[("Arrival.Scheduled.Time", 1)],
+        if _position_future is not None and not _position_future.done():
+            logging.warning(
+                "Previous positions still being written, snapshot dropped"
+            )
+            return None
+
+        _position_future = _position_executor.submit(
+            update_position, response
         )
-    )
+        return _position_future
 
-    columns = ["Scheduled", "Actual", "Carrier", "Flight", "Status", "Origin"]
-    data = []
 
-    for x in arr_found:
-        cols = []
-        cols.append(x["Arrival"]["Scheduled"]["Time"])
-        try:
-            cols.append(x["Arrival"]["Actual"]["Time"])
-        except KeyError:
-            cols.append("")
-        cols.append(x["OperatingCarrier"]["AirlineID"])
-        cols.append(x['OperatingCarrier']['AirlineID'] + x['OperatingCarrier']['FlightNumber'])  # fmt: skip
-        cols.append(x["Status"]["Description"])
-        cols.append(x["Departure"]["AirportCode"])
+# DB REQUESTS
+def board_paths(field: Any) -> list:
+    """returns the paths of the fields of a board column"""
 
-        data.append(cols)
+    return field if isinstance(field, list) else [field]
 
-    df = pd.DataFrame(data, columns=columns)
 
-    # close connection
-    client.close()
+def board_projection(fields: dict) -> dict:
+    """
+    returns the $project stage of the board columns : one flat string per
+    column, missing fields (ex: Actual time) as empty strings
+    """
 
-    return df
+    projection = {"_id": 0}
+    for column, field in fields.items():
+        values = [{"$ifNull": ["$" + path, ""]} for path in board_paths(field)]
+        projection[column] = values[0] if len(values) == 1 else {"$concat": values}  # fmt: skip
 
+    return projection
 
-def get_departures(airport: str) -> pd.DataFrame:
-    """Get list of departures at given Airport"""
 
-    # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.flights
+def board_condition(field: Any, operator: str, value: str) -> dict:
+    """
+    returns the query condition of a DataTable filter term on a board field
+
+    Parameters:
+    -----------
+        field       : path of the field, or list of paths of the fields
+                      concatenated in the column
+        operator    : DataTable operator, ex: "contains", "icontains", ">="
+        value       : filtered value
+    """
+
+    # s (sensitive) and i (insensitive) prefixes set the case sensitivity
+    options = ""
+    if operator[0] in "si":
+        options = "i" if operator[0] == "i" else ""
+        operator = operator[1:]
+
+    if operator == "contains":
+        regex = re.escape(value)
+    elif operator == "datestartswith":
+        regex = "^" + re.escape(value)
+    elif options and FILTER_OPERATORS.get(operator) == "$eq":
+        regex = "^" + re.escape(value) + "$"
+    else:
+        regex = None
+
+    # concatenated fields are compared through an expression
+    if isinstance(field, list):
+        expression = {"$concat": ["$" + path for path in field]}
+        if regex is not None:
+            match = {"input": expression, "regex": regex, "options": options}
+            return {"$expr": {"$regexMatch": match}}
+        return {"$expr": {FILTER_OPERATORS[operator]: [expression, value]}}
+
+    if regex is not None:
+        return {field: {"$regex": regex, "$options": options}}
+    return {field: {FILTER_OPERATORS[operator]: value}}
+
+
+def board_query(direction: str, filter_query: str) -> list:
+    """
+    returns the query conditions of a DataTable filter_query on a board
 
-    dep_found = list(
-        col.find(
-            filter={"Departure.AirportCode": airport.upper()},
-            sort=[("Departure.Scheduled.Time", 1)],
+    Parameters:
+    -----------
+        direction       : "arrivals" or "departures"
+        filter_query    : DataTable filter, ex: {Carrier} contains LH && ...
+    """
+
+    fields = BOARD_FIELDS[direction]
+    conditions = []
+
+    for term in filter(None, (filter_query or "").split(" && ")):
+        match = FILTER_TERM.match(term.strip())
+        if match is None or match["column"] not in fields:
+            logging.debug(f"Unsupported board filter : {term}")
+            continue
+        value = match["value"].strip()
+        if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'`":
+            value = value[1:-1]
+        conditions.append(
+            board_condition(fields[match["column"]], match["operator"], value)
         )
-    )
 
-    columns = [
-        "Scheduled",
-        "Actual",
-        "Carrier",
-        "Flight",
-        "Status",
-        "Destination",
-    ]
-    data = []
-    for x in dep_found:
-        cols = []
-        cols.append(x["Departure"]["Scheduled"]["Time"])
-        try:
-            cols.append(x["Departure"]["Actual"]["Time"])
-        except KeyError:
-            cols.append("")
-        cols.append(x["OperatingCarrier"]["AirlineID"])
-        cols.append(x['OperatingCarrier']['AirlineID'] + x['OperatingCarrier']['FlightNumber'])  # fmt: skip
-        cols.append(x["Status"]["Description"])
-        cols.append(x["Arrival"]["AirportCode"])
+    return conditions
 
-        data.append(cols)
 
-    df = pd.DataFrame(data, columns=columns)
+def board_pipeline(
+    direction: str,
+    airport: str,
+    page: int = 0,
+    page_size: int = 0,
+    sort_by: Optional[list] = None,
+    filter_query: str = "",
+) -> tuple:
+    """
+    returns the query and the aggregation pipeline of a page of an airport
+    board, the parameters being those of get_airport_board
+
+    Returns :
+    ---------
+        query           : flights matching the filter
+        pipeline        : page of these flights, one field per board column
+    """
 
-    # close connection
-    client.close()
+    fields = BOARD_FIELDS[direction]
+    leg = "Arrival" if direction == "arrivals" else "Departure"
 
-    return df
+    query = {"$and": [{f"{leg}.AirportCode": airport.upper()}]}
+    query["$and"] += board_query(direction, filter_query)
 
+    sort = []
+    for column in sort_by or [{"column_id": "Scheduled", "direction": "asc"}]:
+        field = fields.get(column["column_id"])
+        if field is None:
+            continue
+        order = ASCENDING if column["direction"] == "asc" else DESCENDING
+        sort += [(path, order) for path in board_paths(field)]
+    # stable order of the flights between pages
+    sort.append(("_id", ASCENDING))
+
+    pipeline = [
+        {"$match": query},
+        {"$sort": dict(sort)},
+        {"$skip": page * page_size},
+    ]
+    if page_size:
+        pipeline.append({"$limit": page_size})
+    # flat rows of the displayed fields, built by the server
+    pipeline.append({"$project": board_projection(fields)})
+
+    return query, pipeline
+
+
+@metrics.timed("mongo_read", size=lambda board: len(board[0]))
+def get_airport_board(
+    direction: str,
+    airport: str,
+    page: int = 0,
+    page_size: int = 0,
+    sort_by: Optional[list] = None,
+    filter_query: str = "",
+) -> tuple:
+    """
+    Get a page of the arrivals or departures at given Airport
 
-def get_routes(dep: str, arr: str) -> pd.DataFrame:
-    """Get list of routes between given departure and arrival airport"""
+    Parameters:
+    -----------
+        direction       : "arrivals" or "departures"
+        airport         : airport IATA code
+        page            : index of the page
+        page_size       : number of flights per page, 0 for all of them
+        sort_by         : DataTable sort_by, list of {column_id, direction}.
+                          Scheduled time by default
+        filter_query    : DataTable filter_query
+
+    Returns :
+    ---------
+        df              : flights of the page, one column per board field
+        count           : number of flights matching the filter
+    """
 
     # connecting collection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.flights
+    col = mongo.get_db().flights
 
-    # get routes from mongo collection
-    filter = {
-        "Departure.AirportCode": dep.upper(),
-        "Arrival.AirportCode": arr.upper(),
-    }
-    routes = list(col.find(filter=filter))
-
-    # format df columns
-    columns = [
-        "airline_name",
-        "airline_iata",
-        "flight",
-        "dep_iata",
-        "dep_airport",
-        "dep_city",
-        "dep_scheduled",
-        "dep_actual",
-        "arr_iata",
-        "arr_airport",
-        "arr_city",
-        "arr_scheduled",
-        "arr_ctual",
-        "status",
-    ]
+    query, pipeline = board_pipeline(
+        direction, airport, page, page_size, sort_by, filter_query
+    )
+    data = list(col.aggregate(pipeline))
 
-    # create df
-    data = []
-    for x in routes:
-        cols = []
-
-        # flight
-        airline_iata = x["OperatingCarrier"]["AirlineID"]
-        airline_name = get_airline_from_iata(airline_iata)
-        cols.append(airline_name)
-        cols.append(airline_iata)
-        cols.append(airline_iata + x["OperatingCarrier"]["FlightNumber"])
-
-        # departure
-        dep_iata = x["Departure"]["AirportCode"]
-        dep_airport = get_airport_infos(dep_iata)[0]
-        dep_city = get_airport_infos(dep_iata)[1]
-        cols.append(dep_iata)
-        cols.append(dep_airport)
-        cols.append(dep_city)
-        cols.append(x["Departure"]["Scheduled"]["Time"])
-        try:
-            cols.append(x["Departure"]["Actual"]["Time"])
-        except KeyError:
-            cols.append("")
-
-        # arrival
-        arr_iata = x["Arrival"]["AirportCode"]
-        arr_airport = get_airport_infos(arr_iata)[0]
-        arr_city = get_airport_infos(arr_iata)[1]
-        cols.append(arr_iata)
-        cols.append(arr_airport)
-        cols.append(arr_city)
-        cols.append(x["Arrival"]["Scheduled"]["Time"])
-        try:
-            cols.append(x["Arrival"]["Actual"]["Time"])
-        except KeyError:
-            cols.append("")
+    df = pd.DataFrame(data, columns=list(BOARD_FIELDS[direction]))
+    count = col.count_documents(query) if page_size else len(df)
 
-        # flight status
-        cols.append(x["Status"]["Description"])
+    return df, count
 
-        # add line in df
-        data.append(cols)
 
-    df = pd.DataFrame(data=data, columns=columns)
+def get_arrivals(airport: str) -> pd.DataFrame:
+    """Get list of arrivals at given Airport"""
 
-    # close connection
-    client.close()
+    return get_airport_board("arrivals", airport)[0]
 
-    return df
 
+def get_departures(airport: str) -> pd.DataFrame:
+    """Get list of departures at given Airport"""
 
-def get_all_flights() -> pd.DataFrame:
-    """get all flights in flights collection"""
-
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.flights
-
-    flights = list(col.find({}))
-
-    columns = [
-        "departure",
-        "dep_iata",
-        "dep_scheduled",
-        "dep_actual",
-        "terminal_gate",
-        "arrival",
-        "arr_iata",
-        "arr_scheduled",
-        "dep_actual",
-        "terminal_gate",
-        "carrier_code",
-        "carrier",
-        "flight",
-        "status",
+    return get_airport_board("departures", airport)[0]
+
+
+# columns of the routes : column -> field of the flights_view
+ROUTE_COLUMNS = {
+    "airline_name": "carrier",
+    "airline_iata": "carrier_code",
+    "flight": "flight",
+    "dep_iata": "dep_iata",
+    "dep_airport": "dep_airport",
+    "dep_city": "dep_city",
+    "dep_scheduled": "dep_scheduled",
+    "dep_actual": "dep_actual",
+    "arr_iata": "arr_iata",
+    "arr_airport": "arr_airport",
+    "arr_city": "arr_city",
+    "arr_scheduled": "arr_scheduled",
+    "arr_ctual": "arr_actual",
+    "status": "status",
+}
+
+
+def routes_pipeline(dep: str, arr: str) -> list:
+    """returns the aggregation pipeline of the routes, as flat rows"""
+
+    return [
+        {"$match": {"dep_iata": dep.upper(), "arr_iata": arr.upper()}},
+        {"$project": view_projection(ROUTE_COLUMNS)},
     ]
-    data = []
 
-    for x in flights:
-        cols = []
 
-        # departure
-        try:
-            cols.append(get_airport_infos(x["Departure"]["AirportCode"])[0])
-        except IndexError:
-            cols.append("")
+@metrics.timed("mongo_read", size=len)
+def get_routes(dep: str, arr: str) -> pd.DataFrame:
+    """Get list of routes between given departure and arrival airport"""
 
-        cols.append(x["Departure"]["AirportCode"])
-        cols.append(x["Departure"]["Scheduled"]["Time"])
+    # connecting collection, the flights with the airport and airline names
+    col = mongo.get_db().flights_view
 
-        try:
-            cols.append(x["Departure"]["Actual"]["Time"])
-        except KeyError:
-            cols.append("")
+    routes = list(col.aggregate(routes_pipeline(dep, arr)))
 
-        try:
-            cols.append(
-                f'{x["Departure"]["Terminal"]["Name"]}/{x["Departure"]["Terminal"]["Gate"]}'
-            )
-        except KeyError:
-            cols.append("")
+    df = pd.DataFrame(data=routes, columns=list(ROUTE_COLUMNS))
 
-        # arrival
-        try:
-            cols.append(get_airport_infos(x["Arrival"]["AirportCode"])[0])
-        except IndexError:
-            cols.append("")
-        cols.append(x["Arrival"]["AirportCode"])
-        cols.append(x["Arrival"]["Scheduled"]["Time"])
-        try:
-            cols.append(x["Arrival"]["Actual"]["Time"])
-        except KeyError:
-            cols.append("")
-        try:
-            cols.append(
-                x["Arrival"]["Terminal"]["Name"]
-                + "/"
-                + x["Arrival"]["Terminal"]["Gate"]
-            )
-        except KeyError:
-            cols.append("")
-
-        # general
-        cols.append(x["OperatingCarrier"]["AirlineID"])
-        cols.append(get_airline_from_iata(x["OperatingCarrier"]["AirlineID"]))
-        cols.append(
-            f'{x["OperatingCarrier"]["AirlineID"]}{x["OperatingCarrier"]["FlightNumber"]}'
-        )
-        cols.append(x["Status"]["Description"])
+    return df
 
-        data.append(cols)
 
-    df = pd.DataFrame(data, columns=columns)
-    df.to_csv(c.FLIGHTS_IN_DB_FILE, index=False)
+def view_projection(columns: dict) -> dict:
+    """
+    returns the $project stage renaming the fields of the flights_view,
+    given as column -> field. Missing fields are empty strings.
+    """
 
-    # close connection
-    client.close()
+    projection = {"_id": 0}
+    for column, field in columns.items():
+        projection[column] = {"$ifNull": ["$" + field, ""]}
 
-    return df
+    return projection
+
+
+@metrics.timed("mongo_read", size=len)
+def get_all_flights() -> pd.DataFrame:
+    """get all flights in flights collection, from the flights_view"""
+
+    col = mongo.get_db().flights_view
+
+    # column -> field of the view
+    columns = {
+        "departure": "dep_airport",
+        "dep_iata": "dep_iata",
+        "dep_scheduled": "dep_scheduled",
+        "dep_actual": "dep_actual",
+        "dep_terminal_gate": "dep_terminal_gate",
+        "arrival": "arr_airport",
+        "arr_iata": "arr_iata",
+        "arr_scheduled": "arr_scheduled",
+        "arr_actual": "arr_actual",
+        "arr_terminal_gate": "arr_terminal_gate",
+        "carrier_code": "carrier_code",
+        "carrier": "carrier",
+        "flight": "flight",
+        "status": "status",
+    }
+
+    flights = col.aggregate([{"$project": view_projection(columns)}])
 
+    return pd.DataFrame(list(flights), columns=list(columns))
 
+
+@metrics.timed("mongo_read", size=len)
 def list_available_airports() -> pd.DataFrame:
     """get all airports available in the flights collection"""
 
-    df = pd.read_csv(c.FLIGHTS_IN_DB_FILE)
-    df1 = df[["dep_iata", "departure"]]
-    df1.columns = ["iata", "airport"]
-    df2 = df[["arr_iata", "arrival"]]
-    df2.columns = ["iata", "airport"]
-    df3 = pd.concat([df1, df2])
+    col = mongo.get_db().flights_view
+
+    # departure and arrival airports, read from the indexes starting with
+    # dep_iata and arr_iata. Their names come from the reference tables,
+    # as those of the view.
+    codes = set(col.distinct("dep_iata")) | set(col.distinct("arr_iata"))
+    codes.discard(None)
 
-    airports = df3.drop_duplicates()
-    airports.to_csv(c.AIRPORTS_IN_DB_FILE, index=False)
+    airports = []
+    for iata in sorted(codes):
+        infos = get_airport_infos(iata)
+        airports.append((iata, infos[0] if infos else ""))
 
-    return airports
+    return pd.DataFrame(airports, columns=["iata", "airport"])
 
 
-def get_opensky_flights() -> Any:
-    """get currently flying airplanes from opensky API"""
+@metrics.timed("opensky", size=len)
+def get_opensky_flights() -> opensky_states.StateColumns:
+    """
+    get currently flying airplanes from opensky API, decoded while the
+    response is received
+
+    Raises requests.RequestException when the request fails, also while
+    the response is read, and ValueError when the response is invalid
+    """
 
     # defining the spatial field
     lon_min, lat_min = -180.0, -90.0
@@ -806,45 +1058,79 @@ def get_opensky_flights() -> Any:
 
     # send request to get the current airplane data
     url_data = f"{c.OPENSKY_BASE_URL}?lamin={lat_min}&lomin={lon_min}&lamax={lat_max}&lomax={lon_max}"
-    response = requests.get(url_data).json()
+    start = time.perf_counter()
+    with http_client.get_session().get(
+        url_data, stream=True, timeout=c.HTTP_TIMEOUT
+    ) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        try:
+            states = opensky_states.from_stream(response.raw)
+        except urllib3.exceptions.HTTPError as e:
+            # the raw stream raises urllib3 errors, not those of requests
+            raise requests.ConnectionError(
+                f"OpenSky response interrupted. {e}"
+            ) from e
+
+    logging.debug(
+        f"Decoded {len(states)} states "
+        f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+    )
 
-    update_position(response)
+    submit_position_update(states)
 
-    return response
+    return states
 
 
 def get_opensky_df(response: Any) -> pd.DataFrame:
-    """creates and returns dataframe from opensky response"""
-
-    # load the data as a pandas dataframe
-    columns = [
-        "icao24",
-        "callsign",
-        "origin_country",
-        "time_position",
-        "last_contact",
-        "long",
-        "lat",
-        "baro_altitude",
-        "on_ground",
-        "velocity",
-        "true_track",
-        "vertical_rate",
-        "sensors",
-        "geo_altitude",
-        "squawk",
-        "spi",
-        "position_source",
-    ]
-    df = pd.DataFrame(response["states"], columns=columns)
+    """
+    creates and returns dataframe from opensky response.
 
-    # filling missing data
-    df.true_track = df.true_track.fillna(0)
-    df = df.fillna("NaN")
+    Each field of the state vectors is decoded straight to a typed column,
+    missing values are kept as NaN (or <NA>) and formatted for display by
+    format_value.
+
+    Parameters:
+    -----------
+        response    : opensky API response with the `states` of the airplanes,
+                      or its StateColumns
+    """
+
+    columns = opensky_states.decode(response).columns
+
+    data = {}
+    for name, dtype in opensky_states.OPENSKY_DTYPES.items():
+        values = columns[name]
+        if dtype == "str":
+            data[name] = np.where(pd.isna(values), "", values)
+        elif dtype in ("object", "bool"):
+            data[name] = values
+        elif dtype == "category":
+            data[name] = pd.Categorical(values)
+        elif dtype in ("Int64", "Int8"):
+            data[name] = pd.array(values, dtype=dtype)
+        else:
+            data[name] = values.astype(dtype)
+
+    return pd.DataFrame(data)
 
-    return df
 
+def format_value(value: Any) -> Any:
+    """returns a value of the opensky dataframe ready to be displayed"""
 
+    if isinstance(value, (list, tuple)):
+        return value
+    if value is None or pd.isna(value):
+        return "NaN"
+    if isinstance(value, (float, np.floating)):
+        # float32 columns hold 7 significant digits
+        return float(f"{value:.7g}")
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+@metrics.timed("figure")
 def add_flights_on_map(fig, df) -> go.Figure:
     """returns a map with all airplanes from opensky"""
 
@@ -855,19 +1141,14 @@ def add_flights_on_map(fig, df) -> go.Figure:
     # Define figure and its characteristics
     fig = go.Figure(
         go.Scattermapbox(
-            lon=df.long,
-            lat=df.lat,
-            text=df.callsign,
+            **flights_marker_data(df),
             mode="markers",
             hoverinfo="none",
-            marker={
-                "size": 14,
-                "symbol": "airport",
-                "allowoverlap": True,
-                "angle": df.true_track,
-            },
         )
     )
+    fig.update_traces(
+        marker={"size": 14, "symbol": "airport", "allowoverlap": True}
+    )
 
     fig.update_layout(
         height=900,
@@ -880,6 +1161,245 @@ def add_flights_on_map(fig, df) -> go.Figure:
     return fig
 
 
+def typed_array(values: Any, dtype: str) -> dict:
+    """
+    returns values as a base64 encoded typed array, the compact array
+    format decoded by plotly.js
+
+    Parameters:
+    -----------
+        values  : array of numbers
+        dtype   : typed array type : "f4" (float32) or "i2" (int16)
+    """
+
+    array = np.ascontiguousarray(values, dtype="<" + dtype)
+
+    return {
+        "dtype": dtype,
+        "bdata": base64.b64encode(array.tobytes()).decode("ascii"),
+    }
+
+
+def flights_marker_data(df: pd.DataFrame, compact: bool = False) -> dict:
+    """
+    returns the data of the airplanes trace of the map
+
+    Parameters:
+    -----------
+        df      : airplanes from get_opensky_df
+        compact : quantize the coordinates to MAP_COORDINATE_DECIMALS and
+                  encode the numeric arrays as base64 typed arrays
+    """
+
+    if not compact:
+        return {
+            # float32 coordinates would be serialized with float64 digits
+            "lon": df.long.astype("float64").round(5).to_numpy(),
+            "lat": df.lat.astype("float64").round(5).to_numpy(),
+            "text": df.callsign.to_numpy(),
+            "marker": {"angle": df.true_track.fillna(0).round(1).to_numpy()},
+        }
+
+    decimals = c.MAP_COORDINATE_DECIMALS
+    return {
+        "lon": typed_array(df.long.round(decimals), "f4"),
+        "lat": typed_array(df.lat.round(decimals), "f4"),
+        "text": df.callsign.to_numpy(),
+        "marker": {
+            "angle": typed_array(df.true_track.fillna(0).round(), "i2")
+        },
+    }
+
+
+@metrics.timed("figure")
+def patch_flights_on_map(patch: Patch, df: pd.DataFrame) -> Patch:
+    """
+    Update the airplanes of a map figure patch, without sending again the
+    layout and the marker settings of the figure.
+    The arrays are compact encoded if MAP_COMPACT_ENCODING is set.
+    """
+
+    data = flights_marker_data(df, compact=c.MAP_COMPACT_ENCODING)
+    patch["data"][0]["lon"] = data["lon"]
+    patch["data"][0]["lat"] = data["lat"]
+    patch["data"][0]["text"] = data["text"]
+    patch["data"][0]["marker"]["angle"] = data["marker"]["angle"]
+
+    return patch
+
+
+@metrics.timed("figure")
+def patch_flight_trace_on_map(patch: Patch, trace_df: pd.DataFrame) -> Patch:
+    """
+    Replace the trace of the selected airplane, the second trace of the
+    map, in a figure patch. An empty trace_df removes it from the map.
+    """
+
+    patch["data"][1]["lon"] = trace_df.lon.tolist()
+    patch["data"][1]["lat"] = trace_df.lat.tolist()
+
+    return patch
+
+
+def get_viewport(relayout_data: Optional[dict], previous=None) -> dict:
+    """
+    returns the bounds and zoom of the map viewport from its relayoutData,
+    or previous if relayoutData doesn't move the map (ex: autosize)
+
+    Parameters:
+    -----------
+        relayout_data   : relayoutData of the map graph
+        previous        : last viewport of the session
+
+    Returns :
+    ---------
+        viewport        : dict with lon_min, lat_min, lon_max, lat_max and
+                          zoom. lon_max < lon_min if the view crosses the
+                          antimeridian. None for the whole world
+    """
+
+    if not relayout_data or "mapbox.zoom" not in relayout_data:
+        return previous
+
+    zoom = relayout_data["mapbox.zoom"]
+    derived = relayout_data.get("mapbox._derived", {})
+
+    if "coordinates" in derived:
+        # corners of the view, longitudes are not wrapped to [-180, 180]
+        lons = [lon for lon, _ in derived["coordinates"]]
+        lats = [lat for _, lat in derived["coordinates"]]
+        lon_min, lon_max = min(lons), max(lons)
+        lat_min, lat_max = min(lats), max(lats)
+    else:
+        # estimate from the center, for a view of about 1600 x 900 px
+        # with 512 px tiles
+        center = relayout_data["mapbox.center"]
+        half_width = 360 * 1600 / (512 * 2**zoom) / 2
+        half_height = half_width * 900 / 1600
+        lon_min = center["lon"] - half_width
+        lon_max = center["lon"] + half_width
+        lat_min = center["lat"] - half_height
+        lat_max = center["lat"] + half_height
+
+    margin_lon = (lon_max - lon_min) * c.MAP_VIEWPORT_MARGIN
+    margin_lat = (lat_max - lat_min) * c.MAP_VIEWPORT_MARGIN
+    lon_min -= margin_lon
+    lon_max += margin_lon
+
+    if lon_max - lon_min >= 360:
+        lon_min, lon_max = -180.0, 180.0
+    else:
+        lon_min = (lon_min + 180) % 360 - 180
+        lon_max = (lon_max + 180) % 360 - 180
+
+    return {
+        "lon_min": lon_min,
+        "lat_min": max(lat_min - margin_lat, -90.0),
+        "lon_max": lon_max,
+        "lat_max": min(lat_max + margin_lat, 90.0),
+        "zoom": zoom,
+    }
+
+
+def get_viewport_rows(grid, viewport: Optional[dict]) -> np.ndarray:
+    """
+    returns the rows of the airplanes to show in a viewport : those inside
+    it, thinned down to MAP_MAX_MARKERS airplanes
+
+    Parameters:
+    -----------
+        grid        : spatial index of the snapshot
+        viewport    : viewport from get_viewport, None for the whole world
+    """
+
+    if viewport is None:
+        box = (-180.0, -90.0, 180.0, 90.0)
+    else:
+        box = (
+            viewport["lon_min"],
+            viewport["lat_min"],
+            viewport["lon_max"],
+            viewport["lat_max"],
+        )
+
+    rows = grid.bbox(*box)
+    return grid.thin(rows, box, c.MAP_MAX_MARKERS)
+
+
+def get_airplanes_near_airport(
+    snapshot,
+    airport: str,
+    radius_km: float = c.AIRPORT_RADIUS_KM,
+    max_altitude: float = c.AIRPORT_MAX_ALTITUDE,
+) -> pd.DataFrame:
+    """
+    Get the airplanes arriving at or departing from given airport : those
+    within radius_km of it and below max_altitude, nearest first
+
+    Parameters:
+    -----------
+        snapshot        : latest airplanes snapshot, with its spatial index
+        airport         : airport IATA code
+        radius_km       : distance from the airport, in km
+        max_altitude    : altitude in meters
+
+    Returns :
+    ---------
+        df              : Callsign, Distance (km), Altitude (m),
+                          Vertical (m/s), Phase. Empty if the airport
+                          coordinates are unknown
+    """
+
+    names = ["Callsign", "Distance (km)", "Altitude (m)", "Vertical (m/s)", "Phase"]  # fmt: skip
+
+    position = get_airport_position(airport)
+    if not position:
+        return pd.DataFrame(columns=names)
+
+    lat, lon = position
+    rows, distances = snapshot.grid.radius(lon, lat, radius_km)
+
+    # columns arrays of the snapshot, cheaper than a dataframe selection
+    columns = snapshot.columns
+    on_ground = columns["on_ground"][rows].astype("bool")
+    altitude = columns["baro_altitude"][rows].astype("float64")
+    geo_altitude = columns["geo_altitude"][rows].astype("float64")
+    altitude = np.where(np.isnan(altitude), geo_altitude, altitude)
+    altitude[on_ground] = 0
+    vertical = np.nan_to_num(columns["vertical_rate"][rows].astype("float64"))
+
+    # unknown altitudes are not below max_altitude
+    near = altitude <= max_altitude
+    phase = np.select(
+        [on_ground, vertical > 1, vertical < -1],
+        ["On ground", "Departing", "Arriving"],
+        default="Level",
+    )
+
+    return pd.DataFrame(
+        {
+            "Callsign": [
+                callsign.strip()
+                for callsign in columns["callsign"][rows][near]
+            ],
+            "Distance (km)": distances[near].round(1),
+            "Altitude (m)": altitude[near].round(),
+            "Vertical (m/s)": vertical[near].round(1),
+            "Phase": phase[near],
+        },
+        columns=names,
+    )
+
+
+def payload_size(payload: Any) -> int:
+    """returns the size in bytes of a callback output sent as JSON"""
+
+    if isinstance(payload, Patch):
+        payload = payload.to_plotly_json()
+    return len(json.dumps(payload, cls=PlotlyJSONEncoder))
+
+
+@metrics.timed("figure")
 def add_flight_trace_on_map(fig, trace_df) -> go.Figure:
     """
     Add the given trace to the map and center the map on the flight position.
@@ -910,46 +1430,92 @@ def add_flight_trace_on_map(fig, trace_df) -> go.Figure:
     return fig
 
 
-def get_altitudes(callsign: str) -> pd.DataFrame:
-    """Get the list of altitudes for given airplane callsign"""
+def position_samples_pipeline(
+    callsign: str, fields: list, start: datetime, end: datetime
+) -> list:
+    """
+    returns the aggregation pipeline of the position samples of an
+    airplane, the parameters being those of get_position_samples
+    """
+
+    # only the buckets and samples overlapping the range are read. The
+    # buckets of a callsign don't overlap : sorted by last as the index
+    projection = {"_id": 0, "time": "$samples.t"}
+    projection.update({field: f"$samples.{field}" for field in fields})
+    return [
+        {
+            "$match": {
+                "callsign": callsign,
+                "last": {"$gte": start},
+                "first": {"$lte": end},
+            }
+        },
+        {"$sort": {"last": 1}},
+        {"$unwind": "$samples"},
+        {"$match": {"samples.t": {"$gte": start, "$lte": end}}},
+        {"$project": projection},
+    ]
+
+
+@metrics.timed("mongo_read", size=len)
+def get_position_samples(
+    callsign: str,
+    fields: list,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> list:
+    """
+    Get the position samples of an airplane within a time range
+
+    Parameters:
+    -----------
+        callsign    : airplane callsign
+        fields      : sample fields to return, among lat, lon and alt
+        start       : start of the range (UTC), default to
+                      POSITION_TRACE_SECONDS before end
+        end         : end of the range (UTC), default to now
+
+    Returns :
+    ---------
+        samples     : list of dict with the time and the requested fields
+    """
+
+    end = datetime.now(timezone.utc) if end is None else end
+    if start is None:
+        start = end - timedelta(seconds=c.POSITION_TRACE_SECONDS)
 
     # db connection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.position
-
-    # get the right callsign in collection
-    filter = {"callsign": callsign}
-    projection = {"_id": 0, "altitude": 1, "date_time": 1}
-    result = col.find_one(filter=filter, projection=projection)
-    altitude = result["altitude"] if result is not None else ""
-    date_time = result["date_time"] if result is not None else ""
-
-    df = pd.DataFrame(
-        data=list(zip(date_time, altitude)),
-        columns=["time", "altitude"],
-    )
+    col = mongo.get_db().positions
+
+    pipeline = position_samples_pipeline(callsign, fields, start, end)
+
+    return list(col.aggregate(pipeline))
+
+
+def get_altitudes(
+    callsign: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """Get the list of altitudes for given airplane callsign"""
+
+    samples = get_position_samples(callsign, ["alt"], start, end)
+
+    df = pd.DataFrame(data=samples, columns=["time", "alt"])
+    df.columns = ["time", "altitude"]
 
     return df
 
 
-def get_trace(callsign: str) -> pd.DataFrame:
+def get_trace(
+    callsign: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> pd.DataFrame:
     """Get the trace of GPS coordinates for given airplane callsign"""
 
-    # db connection
-    client = MongoClient(c.MONGO_CONNECTION_STR)
-    col = client.flightTracker.position
-
-    # get the right callsign in collection
-    filter = {"callsign": callsign}
-    projection = {"_id": 0, "lat": 1, "lon": 1, "date_time": 1}
-    result = col.find_one(filter=filter, projection=projection)
-    lat = result["lat"] if result is not None else ""
-    lon = result["lon"] if result is not None else ""
-    date_time = result["date_time"] if result is not None else ""
-
-    df = pd.DataFrame(
-        data=list(zip(date_time, lat, lon)),
-        columns=["time", "lat", "lon"],
-    )
+    samples = get_position_samples(callsign, ["lat", "lon"], start, end)
+
+    df = pd.DataFrame(data=samples, columns=["time", "lat", "lon"])
 
     return df
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src.cfi_fetcher import *
+
+TOTAL_COUNT = 250
+
+
+def make_flight(number):
+    return {
+        "Departure": {"AirportCode": "FRA"},
+        "Arrival": {"AirportCode": "CDG"},
+        "OperatingCarrier": {"AirlineID": "LH", "FlightNumber": str(number)},
+    }
+
+
+class CfiHandler(BaseHTTPRequestHandler):
+    """
+    Serves TOTAL_COUNT flights by pages, failing the first request of
+    each page with 503. /busy answers 429 with a Retry-After of one hour,
+    /loop a page without count linking to itself
+    """
+
+    requests = {}
+
+    def do_GET(self):
+        count = self.requests.get(self.path, 0)
+        self.requests[self.path] = count + 1
+
+        if self.path.startswith("/busy"):
+            self.send_response(429)
+            self.send_header("Retry-After", "3600")
+            self.end_headers()
+            return
+
+        if self.path.startswith("/loop"):
+            link = {"@Rel": "next", "@Href": f"http://{self.headers['Host']}{self.path}"}
+            body = {"FlightInformation": {"Flights": {"Flight": make_flight(0)}, "Meta": {"Link": [link]}}}
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps(body).encode())
+            return
+
+        if self.path.startswith("/down") or count == 0:
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        offset, limit = int(query["offset"][0]), int(query["limit"][0])
+        flights = [make_flight(i) for i in range(offset, min(offset + limit, TOTAL_COUNT))]  # fmt: skip
+        body = {
+            "FlightInformation": {
+                "Flights": {"Flight": flights[0] if len(flights) == 1 else flights},
+                "Meta": {"TotalCount": TOTAL_COUNT},
+            }
+        }
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), CfiHandler)
+    CfiHandler.requests = {}
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+
+
+def test_token_bucket():
+    """ Must not exceed the rate after the burst """
+
+    async def acquire(n):
+        bucket = TokenBucket(rate=50, capacity=2)
+        for _ in range(n):
+            await bucket.acquire()
+
+    start = time.perf_counter()
+    asyncio.run(acquire(7))
+    assert time.perf_counter() - start >= 5 / 50 * 0.9
+
+
+def test_get_page(server):
+    """ Must retry the failed requests and return the flights and count """
+
+    async def fetch():
+        async with CfiFetcher(backoff=0) as fetcher:
+            return await asyncio.gather(
+                fetcher.get_page(f"{server}arrivals/FRA?offset=0&limit=100"),
+                fetcher.get_page(f"{server}down/FRA?offset=0&limit=100"),
+            )
+
+    (flights, total, next_url), down = asyncio.run(fetch())
+    assert len(flights) == 100 and total == TOTAL_COUNT and next_url == ""
+    assert down is None
+    assert CfiHandler.requests["/arrivals/FRA?offset=0&limit=100"] == 2
+    assert CfiHandler.requests["/down/FRA?offset=0&limit=100"] == c.HTTP_RETRIES + 1
+
+
+def test_retry_after(server):
+    """ Must give up instead of waiting for a Retry-After above max_delay """
+
+    async def fetch():
+        async with CfiFetcher(max_delay=60) as fetcher:
+            return await fetcher.get(f"{server}busy/FRA")
+
+    start = time.perf_counter()
+    assert asyncio.run(fetch()).status_code == 429
+    assert time.perf_counter() - start < 5
+    assert CfiHandler.requests["/busy/FRA"] == 1
+
+
+def test_update_airport_flights(server, monkeypatch):
+    """ Must write every page of the flights """
+
+    module = sys.modules[CfiFetcher.__module__]
+    monkeypatch.setattr(module.c, "BASE_URL_CFI", server)
+
+    pages = []
+
+    async def write_flights(flights):
+        pages.append(flights)
+        return len(flights)
+
+    monkeypatch.setattr(module, "write_flights", write_flights)
+
+    async def update():
+        async with CfiFetcher(backoff=0) as fetcher:
+            return await update_airport_flights(fetcher, "arrivals", "FRA", "2024-01-01T08:00")  # fmt: skip
+
+    assert asyncio.run(update()) == TOTAL_COUNT
+    numbers = [flight["OperatingCarrier"]["FlightNumber"] for page in pages for flight in page]  # fmt: skip
+    assert sorted(numbers, key=int) == [str(i) for i in range(TOTAL_COUNT)]
+
+
+def test_update_airport_flights_loop(server, monkeypatch):
+    """ Must stop at a link to a page already fetched """
+
+    module = sys.modules[CfiFetcher.__module__]
+    monkeypatch.setattr(module.c, "BASE_URL_CFI", server)
+
+    async def write_flights(flights):
+        return len(flights)
+
+    monkeypatch.setattr(module, "write_flights", write_flights)
+
+    async def update():
+        async with CfiFetcher(backoff=0) as fetcher:
+            return await update_airport_flights(fetcher, "loop", "FRA", "2024-01-01T08:00")  # fmt: skip
+
+    assert asyncio.run(update()) == 1
+    assert sum(CfiHandler.requests.values()) == 1
@@ -0,0 +1,113 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.http_client import *
+
+
+class EtagHandler(BaseHTTPRequestHandler):
+    """ Answers with an ETag and 304 when the ETag matches """
+
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(b'{"states": []}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    module = sys.modules[ResponseCache.__module__]
+    monkeypatch.setattr(module, "cache", ResponseCache(str(tmp_path)))
+    monkeypatch.setitem(module.c.HTTP_CACHE_TTL, "route", 300)
+    monkeypatch.setitem(module.c.HTTP_CACHE_TTL, "flightstatus", 0)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), EtagHandler)
+    EtagHandler.requests = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+
+
+def test_fresh_response(server, tmp_path):
+    """ A fresh response must be reused without request, from memory or disk """
+
+    url = f"{server}route/FRA/CDG"
+    assert get(url, "route").json() == {"states": []}
+    assert get(url, "route").json() == {"states": []}
+    assert len(EtagHandler.requests) == 1
+    assert cache_stats()["hits"] == 1
+
+    # another process reads the entry written on disk
+    entry = ResponseCache(str(tmp_path)).get(url)
+    assert entry is not None and entry.to_response().json() == {"states": []}
+
+
+def test_revalidation(server):
+    """ A stale response must be revalidated with its ETag """
+
+    url = f"{server}arrivals/FRA"
+    first = get(url, "flightstatus")
+    second = get(url, "flightstatus")
+
+    assert second.status_code == 200 and second.content == first.content
+    assert EtagHandler.requests == [("/arrivals/FRA", None), ("/arrivals/FRA", '"v1"')]
+    assert cache_stats()["revalidations"] == 1 and cache_stats()["misses"] == 1
+
+
+def test_private_directory(tmp_path):
+    """ Entries planted in a directory other users can write must be ignored """
+
+    url = "http://example.com/route/FRA/CDG"
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"{}"
+    entry = CacheEntry.from_response(url, response, 300)
+    ResponseCache(str(tmp_path / "cache")).put(entry)
+
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    planted = ResponseCache(str(tmp_path / "cache"))._file(url)
+    os.replace(planted, ResponseCache(str(shared))._file(url))
+
+    assert ResponseCache(str(shared)).get(url) is None
+    assert len(os.listdir(shared)) == 1
+
+
+def test_prune(tmp_path, monkeypatch):
+    """ Expired files must be removed, then the oldest beyond the limit """
+
+    module = sys.modules[ResponseCache.__module__]
+    cache = ResponseCache(str(tmp_path), files=2)
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"{}"
+
+    for n, ttl in enumerate([100, 300, 200, 400]):
+        cache.put(CacheEntry.from_response(f"http://example.com/{n}", response, ttl))  # fmt: skip
+
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(cache._file(f"http://example.com/{n}")) for n in [1, 3])  # fmt: skip
+
+    # another process reads an entry expired on disk
+    now = module.time.time()
+    monkeypatch.setattr(module.time, "time", lambda: now + 350)
+    assert ResponseCache(str(tmp_path)).get("http://example.com/1") is None
+    assert len(os.listdir(tmp_path)) == 1
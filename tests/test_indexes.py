@@ -0,0 +1,102 @@
+import sys
+
+from src.indexes import *
+
+
+def test_blocking_stages():
+    """ Must find the COLLSCAN and in memory sorts of the winning plan """
+
+    ixscan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+    collscan = {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}
+    union = {"stage": "OR", "inputStages": [ixscan, collscan]}
+
+    assert blocking_stages({"queryPlanner": {"winningPlan": ixscan, "rejectedPlans": [collscan]}}) == set()
+    assert blocking_stages(collscan) == {"SORT", "COLLSCAN"}
+    assert blocking_stages(union) == {"SORT", "COLLSCAN"}
+
+    # a $sort of the pipeline left to the aggregation
+    pipeline = [{"$match": {"a": 1}}, {"$sort": {"b": 1}}]
+    explain = {
+        "stages": [{"$cursor": {"queryPlanner": {"winningPlan": ixscan}}}, {"$sort": {"sortKey": {"b": 1}}}],
+        "command": {"aggregate": "flights", "pipeline": pipeline},
+    }
+    assert blocking_stages(explain) == {"$sort"}
+    explain["stages"].pop()
+    assert blocking_stages(explain) == set()
+
+
+def equality_and_sort(pipeline: list) -> tuple:
+    """ returns the equality fields of the first $match, and the $sort """
+
+    match = pipeline[0]["$match"]
+    conditions = match.pop("$and", []) + [match]
+    equality = {key for condition in conditions for key, value in condition.items() if not isinstance(value, dict)}
+    sort = next((list(stage["$sort"]) for stage in pipeline if "$sort" in stage), [])
+    return equality, sort
+
+
+def test_hot_queries_are_indexed():
+    """ An index must start with the equality fields of each hot query, then its sort """
+
+    queries = [(collection, [{"$match": filter}]) for collection, filter in UPSERT_FILTERS]
+    for collection, pipeline in queries + hot_pipelines():
+        equality, sort = equality_and_sort(pipeline)
+        keys = [list(index.document["key"]) for index in INDEXES[collection]]
+        assert any(
+            set(key[: len(equality)]) == equality and key[len(equality) : len(equality) + len(sort)] == sort
+            for key in keys
+        ), (collection, pipeline)
+
+
+class FailingCollection:
+    """ Collection whose indexes cannot be created """
+
+    def index_information(self):
+        return {}
+
+    def create_indexes(self, indexes):
+        raise OperationFailure("IndexOptionsConflict")
+
+
+def test_ensure_indexes_continues(monkeypatch):
+    """ A failing collection must not prevent indexing the next ones """
+
+    import mongomock
+
+    module = sys.modules[update_ttl.__module__]
+    monkeypatch.setattr(module, "_ensured_pid", None)
+    db = mongomock.MongoClient().db
+    failing = FailingCollection()
+
+    class Database(dict):
+        def __missing__(self, name):
+            return failing if name == "schedules" else db[name]
+
+    ensure_indexes(Database())
+
+    assert "last_1" in db.positions.index_information()
+    # retried by the next call
+    assert module._ensured_pid is None
+
+
+def test_update_ttl():
+    """ A changed expiry must be set with collMod """
+
+    commands = []
+
+    class Collection:
+        name = "schedules"
+
+        class database:
+            def command(*args, **kwargs):
+                commands.append((args, kwargs))
+
+        def index_information(self):
+            return {"insertedDate_1": {"expireAfterSeconds": 86400}}
+
+    update_ttl(Collection(), [IndexModel([("insertedDate", ASCENDING)], expireAfterSeconds=3600)])
+    update_ttl(Collection(), [IndexModel([("insertedDate", ASCENDING)], expireAfterSeconds=86400)])
+
+    assert commands == [
+        (("collMod", "schedules"), {"index": {"name": "insertedDate_1", "expireAfterSeconds": 3600}})
+    ]
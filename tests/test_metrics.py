@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from flask import Flask, jsonify
+
+from src.metrics import *
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    registry.reset()
+    yield
+    registry.reset()
+
+
+def test_histogram_lines():
+    """ Buckets must be cumulative, with the sum and count of the values """
+
+    histogram = Histogram("latency_seconds", "latency", ("name",), (0.1, 1))
+    for value in [0.05, 0.5, 0.5, 5]:
+        histogram.observe(value, 'a"b')
+
+    assert histogram.lines() == [
+        'latency_seconds_bucket{name="a\\"b",le="0.1"} 1',
+        'latency_seconds_bucket{name="a\\"b",le="1"} 3',
+        'latency_seconds_bucket{name="a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{name="a\\"b"} 6.05',
+        'latency_seconds_count{name="a\\"b"} 4',
+    ]
+
+
+def test_timed():
+    """ Calls, errors and result sizes must be recorded, coroutines included """
+
+    @timed("mongo_read", size=len)
+    def read(n):
+        if n < 0:
+            raise ValueError(n)
+        return list(range(n))
+
+    @timed("lufthansa", "page")
+    async def fetch():
+        return 1
+
+    assert read(3) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        read(-1)
+    assert asyncio.run(fetch()) == 1
+
+    assert summary()["mongo_read.read"]["calls"] == 2
+    assert summary()["mongo_read.read"]["errors"] == 1
+    assert summary()["lufthansa.page"]["calls"] == 1
+    assert stage_items.summary()[("mongo_read", "read")]["sum"] == 3
+
+
+def test_metrics_endpoint():
+    """ The endpoint must serve the callbacks metrics and the collectors """
+
+    server = Flask(__name__)
+
+    @server.route("/callback")
+    @callback
+    def update_map():
+        return jsonify({"map": [0] * 10})
+
+    init_app(server, collectors={"mongo_pool": lambda: {"checked_out": 2, "name": "x"}})  # fmt: skip
+    client = server.test_client()
+    size = len(client.get("/callback").data)
+
+    response = client.get(c.METRICS_PATH)
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'stage_duration_seconds_count{kind="callback",name="update_map"} 1' in text  # fmt: skip
+    assert f'callback_response_bytes_sum{{name="update_map"}} {float(size)}' in text  # fmt: skip
+    assert "mongo_pool_checked_out 2.0" in text
+    assert "mongo_pool_name" not in text
@@ -0,0 +1,45 @@
+import sys
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from src.migrate_positions import *
+
+
+def legacy_document(created: datetime, callsign: str) -> dict:
+    return {
+        "_id": ObjectId.from_datetime(created),
+        "callsign": callsign,
+        "lat": [48.1, 48.2],
+        "lon": [2.1, 2.2],
+        "altitude": [1000, 1100],
+        "date_time": ["12:00:00", "12:01:00"],
+    }
+
+
+def test_migrate(monkeypatch):
+    """ Must count the samples written, without those past the retention """
+
+    import mongomock
+
+    module = sys.modules[migrate.__module__]
+    db = mongomock.MongoClient().db
+    monkeypatch.setattr(module.mongo, "get_db", lambda: db)
+    monkeypatch.setattr(module.indexes, "ensure_indexes", lambda db: None)
+
+    now = datetime.now(timezone.utc)
+    db.position.insert_many([
+        legacy_document(now - timedelta(days=1), "DLH400"),
+        legacy_document(now - timedelta(days=5), "AFR1"),
+    ])
+
+    assert migrate(dry_run=True) == 2
+    assert db.positions.count_documents({}) == 0
+
+    assert migrate() == 2
+    assert db.positions.find_one({"callsign": "DLH400"})["count"] == 2
+    assert db.positions.find_one({"callsign": "AFR1"}) is None
+
+    # the samples of a failed write are not counted
+    monkeypatch.setattr(module.utils, "bulk_write_batches", lambda col, operations, size: 0)
+    assert migrate() == 0
@@ -0,0 +1,57 @@
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from src.opensky_states import *
+
+
+def load_response():
+    TEST_RESPONSES_FILE = os.path.realpath(os.path.join(os.path.dirname(__file__), 'opensky_responses.json'))
+    with open(TEST_RESPONSES_FILE,'r') as f:
+        return json.load(f)["responses"][1]
+
+
+@pytest.mark.parametrize("parser", ["ijson", "json"])
+def test_from_stream(parser, monkeypatch):
+    """ Must decode the streamed states as the parsed response """
+
+    if parser == "json":
+        monkeypatch.setattr(sys.modules[StateColumns.__module__], "ijson", None)
+
+    response = load_response()
+    # more state vectors than a block and than the capacity
+    response["states"] = response["states"] * (BLOCK_SIZE + 1)
+    body = json.dumps(response).encode()
+
+    states = from_stream(io.BytesIO(body), capacity=10)
+    expected = decode(response)
+
+    assert states.time == response["time"]
+    assert len(states) == len(response["states"])
+    assert states.columns["lat"].dtype == "float64"
+    for name, values in expected.columns.items():
+        assert np.array_equal(states.columns[name], values, equal_nan=values.dtype != object)
+
+
+def test_decode_empty():
+    """ Must return empty columns without state vectors """
+
+    states = decode({"time": 1, "states": None})
+    assert len(states) == 0
+    assert set(states.columns) == set(OPENSKY_DTYPES)
+
+
+@pytest.mark.parametrize("parser", ["ijson", "json"])
+def test_from_stream_truncated(parser, monkeypatch):
+    """ A truncated body must raise ValueError with both parsers """
+
+    if parser == "json":
+        monkeypatch.setattr(sys.modules[StateColumns.__module__], "ijson", None)
+
+    body = json.dumps(load_response()).encode()
+    with pytest.raises(ValueError):
+        from_stream(io.BytesIO(body[: len(body) // 2]))
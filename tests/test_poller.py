@@ -0,0 +1,98 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.poller import *
+
+
+class TruncatedHandler(BaseHTTPRequestHandler):
+    """ Answers half of an OpenSky response, announcing its whole length """
+
+    announce_full_length = False
+
+    def do_GET(self):
+        body = json.dumps({"time": 1, "states": [["abc", "AFR1"] + [None] * 15] * 100}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body) if self.announce_full_length else len(body) // 2))
+        self.end_headers()
+        self.wfile.write(body[: len(body) // 2])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def truncated_server(monkeypatch):
+    module = sys.modules[refresh.__module__]
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), TruncatedHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(module.c, "OPENSKY_BASE_URL", f"http://127.0.0.1:{httpd.server_address[1]}/")
+    monkeypatch.setattr(module.utils, "submit_position_update", lambda states: None)
+    yield module
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("announce_full_length", [False, True])
+def test_refresh_truncated(truncated_server, monkeypatch, announce_full_length):
+    """ A truncated or interrupted response must keep the snapshot """
+
+    monkeypatch.setattr(TruncatedHandler, "announce_full_length", announce_full_length)
+    previous = get_snapshot()
+
+    assert refresh() is previous
+    assert get_snapshot() is previous
+
+
+def test_poll_survives_errors(monkeypatch):
+    """ An unexpected error of a refresh must not stop the polling """
+
+    module = sys.modules[refresh.__module__]
+    calls = []
+
+    def failing_refresh():
+        calls.append(1)
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(module, "refresh", failing_refresh)
+    monkeypatch.setattr(module.store, "acquire_leadership", lambda: True)
+
+    thread = threading.Thread(target=module._poll, args=(0.01,), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while len(calls) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    module._stop.set()
+    thread.join()
+    module._stop.clear()
+
+    assert len(calls) >= 3
+
+
+def test_start_poller_reloader(monkeypatch):
+    """ With the reloader, only the serving process must poll """
+
+    module = sys.modules[refresh.__module__]
+    monkeypatch.setattr(module, "_refresh_if_leader", lambda: None)
+    monkeypatch.setattr(module, "_poll", lambda interval: module._stop.wait())
+    monkeypatch.setattr(module, "_thread", None)
+    monkeypatch.delenv("WERKZEUG_RUN_MAIN", raising=False)
+
+    # imported by the process watching the files
+    start_poller(reloader=True)
+    assert module._thread is None
+
+    # then by the serving process
+    monkeypatch.setenv("WERKZEUG_RUN_MAIN", "true")
+    start_poller(reloader=True)
+    thread = module._thread
+    start_poller(reloader=True)
+    assert module._thread is thread and thread.is_alive()
+
+    stop_poller()
+    module._stop.clear()
@@ -0,0 +1,107 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.snapshot_store import *
+
+
+def make_snapshot(version):
+    return Snapshot(version, datetime.now(), pd.DataFrame({"callsign": ["AFR1"]}))
+
+
+def test_in_process_store():
+    """ Must keep the newest published snapshot """
+
+    store = InProcessSnapshotStore()
+    assert store.latest() is None
+
+    store.publish(make_snapshot(2))
+    store.publish(make_snapshot(1))
+    assert store.latest().version == 2
+    assert store.acquire_leadership()
+
+
+def test_shared_file_store(tmp_path):
+    """ Snapshots published by a store must be read by another one """
+
+    path = os.path.join(tmp_path, "shared", "snapshot.npz")
+    writer = SharedFileSnapshotStore(path)
+    reader = SharedFileSnapshotStore(path)
+    assert reader.latest() is None
+
+    writer.publish(make_snapshot(1))
+    assert reader.latest().version == 1
+    writer.publish(make_snapshot(2))
+    assert reader.latest().version == 2
+    assert list(reader.latest().df.callsign) == ["AFR1"]
+
+    # only one store can poll
+    assert writer.acquire_leadership()
+    assert not reader.acquire_leadership()
+
+
+def test_snapshot_lookup():
+    """ Must return the scalar values of an airplane by callsign """
+
+    df = pd.DataFrame({"callsign": ["AFR1", "DLH2", "AFR1"], "lat": [1.5, 2.5, 3.5], "long": [0.5, 1.0, 1.5]})
+    snapshot = Snapshot.build(1, df)
+
+    assert snapshot.lookup("DLH2") == {"callsign": "DLH2", "lat": 2.5, "long": 1.0}
+    assert snapshot.lookup("AFR1")["lat"] == 1.5
+    assert isinstance(snapshot.lookup("AFR1")["lat"], float)
+    assert snapshot.lookup("XXX") is None
+
+
+def test_encode_snapshot():
+    """ A snapshot must be decoded as published, without pickle """
+
+    df = pd.DataFrame({
+        "callsign": ["AFR1", None, "DLH2"],
+        "origin_country": pd.Categorical(["France", "Germany", "France"]),
+        "time_position": pd.array([1, None, 3], dtype="Int64"),
+        "long": np.array([2.35, np.nan, 13.4], dtype="float32"),
+        "lat": np.array([48.85, 10.0, 52.5], dtype="float32"),
+        "on_ground": [False, True, False],
+        "sensors": [None, [1, 2], None],
+    })
+    snapshot = Snapshot.build(3, df)
+
+    arrays = encode_snapshot(snapshot)
+    assert all(values.dtype != object for values in arrays.values())
+    decoded = decode_snapshot(arrays)
+
+    assert decoded.version == 3 and decoded.fetched_at == snapshot.fetched_at
+    pd.testing.assert_frame_equal(decoded.df, df)
+    assert decoded.lookup("DLH2") == snapshot.lookup("DLH2")
+    assert list(decoded.grid.bbox(0, 40, 20, 60)) == list(snapshot.grid.bbox(0, 40, 20, 60))
+
+
+def test_shared_file_store_private(tmp_path):
+    """ The directory of the shared file must not be accessible to others """
+
+    directory = os.path.join(tmp_path, "shared")
+    os.makedirs(directory, mode=0o777)
+    os.chmod(directory, 0o777)
+
+    with pytest.raises(PermissionError):
+        SharedFileSnapshotStore(os.path.join(directory, "snapshot.npz"))
+
+
+def test_leadership_after_fork(tmp_path):
+    """ A worker must poll when its parent held the lock before forking """
+
+    path = os.path.join(tmp_path, "shared", "snapshot.npz")
+    store = SharedFileSnapshotStore(path)
+    assert store.acquire_leadership()
+
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if store.acquire_leadership() else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.WEXITSTATUS(status) == 0
+    # the parent forking workers doesn't poll anymore
+    assert not store.acquire_leadership()
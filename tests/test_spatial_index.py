@@ -0,0 +1,52 @@
+import numpy as np
+
+from src.spatial_index import *
+
+
+def make_positions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-180, 180, n)
+    lat = rng.uniform(-90, 90, n)
+    lon[::50] = np.nan
+    return lon, lat
+
+
+def test_bbox():
+    """ Must return the same airplanes as a full scan """
+
+    lon, lat = make_positions(5000)
+    grid = GridIndex(lon, lat, cell_size=2)
+
+    for box in [(-10, 40, 20, 55), (-180, -90, 180, 90), (170, -30, -165, 30)]:
+        lon_min, lat_min, lon_max, lat_max = box
+        if lon_min > lon_max:
+            in_lon = (lon >= lon_min) | (lon <= lon_max)
+        else:
+            in_lon = (lon >= lon_min) & (lon <= lon_max)
+        expected = np.flatnonzero(in_lon & (lat >= lat_min) & (lat <= lat_max))
+
+        assert np.array_equal(grid.bbox(*box), expected)
+
+    rows = grid.bbox(-180, -90, 180, 90)
+    assert len(grid.thin(rows, (-180, -90, 180, 90), 100)) <= 100
+
+
+def test_radius_and_nearest():
+    """ Must return the airplanes by haversine distance, as a full scan """
+
+    lon, lat = make_positions(5000)
+    grid = GridIndex(lon, lat)
+    distances = haversine(lon, lat, 179.5, 60)
+
+    rows, found = grid.radius(179.5, 60, 800)
+    expected = np.flatnonzero(distances <= 800)
+    assert np.array_equal(np.sort(rows), expected)
+    assert np.all(np.diff(found) >= 0)
+
+    rows, found = grid.nearest(179.5, 60, k=10)
+    assert np.array_equal(rows, np.argsort(np.nan_to_num(distances, nan=np.inf))[:10])
+    assert np.allclose(found, distances[rows])
+
+    # a circle around the pole contains every longitude
+    rows, _ = grid.radius(0, 89, 500)
+    assert np.array_equal(np.sort(rows), np.flatnonzero(haversine(lon, lat, 0, 89) <= 500))
@@ -31,3 +31,12 @@ def test_get_airline_from_icao():
     assert get_airline_from_icao('LH') == ""
     assert get_airline_from_icao('') == ""
        
+
+def test_reload_reference_data():
+    """ Lookups must give the same results after a reload """
+
+    reload_reference_data()
+
+    assert get_airport_infos('FRA') == ('Frankfurt','Frankfurt','Germany')
+    assert get_airline_from_iata('LH') == 'Lufthansa'
+    assert get_airline_from_icao('DLH') == 'Lufthansa'
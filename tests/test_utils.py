@@ -1,5 +1,8 @@
 from src.utils import *
 import json
+import sys
+
+import pytest
 
 def test_get_key():
     """ Function must return the right key """
@@ -7,21 +10,23 @@ def test_get_key():
     assert get_key(API_KEY_FILE,'lufthansa') == 'vck7t48tns3fwmbnvvuy9dk4'
 
 
-def test_update_position():
+def test_update_position(monkeypatch):
     """ Function must update present flight infos or create them """
 
+    # no sample written by a previous test
+    monkeypatch.setattr(sys.modules[update_position.__module__], "_position_times", {})
+
     # db connection
-    client = get_mongo_client()
-    db = client.flightTracker
+    db = mongo.get_db()
 
     # remove collection if exist for clean test
-    db.position.drop()
-    col = db.position
+    db.positions.drop()
+    col = db.positions
 
     # get test responses from file
     TEST_RESPONSES_FILE = os.path.realpath(os.path.join(os.path.dirname(__file__), 'opensky_responses.json'))
     with open(TEST_RESPONSES_FILE,'r') as f:
-        responses = json.load(f)["responses"]    
+        responses = json.load(f)["responses"]
 
     # test 1 : check first insertion
     update_position(responses[0])
@@ -30,9 +35,10 @@ def test_update_position():
     filter = {"callsign":res[1]}
     flight = col.find_one(filter=filter)
     assert flight["callsign"] == res[1]
-    assert flight["position"][0]["lat"] == res[6]
-    assert flight["position"][0]["lon"] == res[5]
-    assert flight["altitude"][0] == res[13]
+    assert flight["count"] == 1
+    assert flight["samples"][0]["lat"] == res[6]
+    assert flight["samples"][0]["lon"] == res[5]
+    assert flight["samples"][0]["alt"] == res[13]
 
     # test 2 : check that flight has second position and altitude
     # and another flight is appended
@@ -43,18 +49,265 @@ def test_update_position():
     filter = {"callsign":res[1]}
     flight = col.find_one(filter=filter)
     assert flight["callsign"] == res[1]
-    assert flight["position"][1]["lat"] == res[6]
-    assert flight["position"][1]["lon"] == res[5]
-    assert flight["altitude"][1] == res[13]
+    assert flight["count"] == 2
+    assert flight["samples"][1]["lat"] == res[6]
+    assert flight["samples"][1]["lon"] == res[5]
+    assert flight["samples"][1]["alt"] == res[13]
+    assert flight["first"] <= flight["last"]
 
     # check insertion when new flight and db already filled
     res = responses[1]["states"][1]
     filter = {"callsign":res[1]}
     flight = col.find_one(filter=filter)
     assert flight["callsign"] == res[1]
-    assert flight["position"][0]["lat"] == res[6]
-    assert flight["position"][0]["lon"] == res[5]
-    assert flight["altitude"][0] == res[13]
+    assert flight["samples"][0]["lat"] == res[6]
+    assert flight["samples"][0]["lon"] == res[5]
+    assert flight["samples"][0]["alt"] == res[13]
+
+    # test 3 : check that the positions OpenSky didn't update are skipped
+    update_position(responses[1])
+
+    assert col.find_one(filter={"callsign": "SWR1251"})["count"] == 2
+    assert col.find_one(filter={"callsign": "AFR7777"})["count"] == 1
+
+    db.positions.drop()
+
+
+def test_update_position_unchanged(monkeypatch):
+    """ A position not updated by OpenSky must not be written twice """
+
+    import copy
+
+    import mongomock
+
+    module = sys.modules[update_position.__module__]
+    db = mongomock.MongoClient().db
+    monkeypatch.setattr(module.mongo, "get_db", lambda: db)
+    monkeypatch.setattr(module, "_position_times", {})
+
+    TEST_RESPONSES_FILE = os.path.realpath(os.path.join(os.path.dirname(__file__), 'opensky_responses.json'))
+    with open(TEST_RESPONSES_FILE,'r') as f:
+        response = json.load(f)["responses"][0]
+    callsign = response["states"][0][1]
+
+    update_position(response)
+    update_position(response)
+    assert db.positions.find_one({"callsign": callsign})["count"] == 1
+
+    moved = copy.deepcopy(response)
+    moved["states"][0][3] += 10
+    update_position(moved)
+    assert db.positions.find_one({"callsign": callsign})["count"] == 2
+
+
+def test_normalize_flights():
+    """ Function must always return a list of flights """
+
+    flight = {"OperatingCarrier": {"AirlineID": "LH", "FlightNumber": "400"}}
+
+    assert normalize_flights([flight, flight]) == [flight, flight]
+    assert normalize_flights(flight) == [flight]
+    assert normalize_flights(None) == []
+    assert flight_filter(flight) == {
+        "OperatingCarrier.AirlineID": "LH",
+        "OperatingCarrier.FlightNumber": "400",
+    }
+
+
+def test_cfi_page():
+    """ Function must return the flights, count and next page of a response """
+
+    flight = {"OperatingCarrier": {"AirlineID": "LH", "FlightNumber": "400"}}
+    next_url = "https://api.lufthansa.com/v1/operations/customerflightinformation/arrivals/FRA/2024-01-01T08:00?limit=100&offset=100"
+    payload = {
+        "FlightInformation": {
+            "Flights": {"Flight": flight},
+            "Meta": {
+                "TotalCount": "150",
+                "Link": [{"@Rel": "self", "@Href": ""}, {"@Rel": "next", "@Href": next_url}],
+            },
+        }
+    }
+
+    assert cfi_page(payload) == ([flight], 150, next_url)
+
+    payload["FlightInformation"].pop("Meta")
+    assert cfi_page(payload) == ([flight], None, "")
+
+
+def test_get_opensky_df():
+    """ Function must decode the state vectors in typed columns """
+
+    TEST_RESPONSES_FILE = os.path.realpath(os.path.join(os.path.dirname(__file__), 'opensky_responses.json'))
+    with open(TEST_RESPONSES_FILE,'r') as f:
+        response = json.load(f)["responses"][1]
+
+    df = get_opensky_df(response)
+
+    assert len(df) == 2
+    assert df.lat.dtype == "float32"
+    assert df.origin_country.dtype == "category"
+    assert df.last_contact.dtype == "int64"
+    assert df.on_ground.dtype == "bool"
+    assert df.baro_altitude.isna().all()
+    assert format_value(df.baro_altitude[0]) == "NaN"
+    assert format_value(df.lat[0]) == response["states"][0][6]
+
+    assert get_opensky_df({"states": None}).empty
+
+
+def test_typed_array():
+    """ Function must encode the values as little-endian base64 typed arrays """
+
+    encoded = typed_array([1.5, -2.25], "f4")
+
+    assert encoded["dtype"] == "f4"
+    assert base64.b64decode(encoded["bdata"]) == np.array([1.5, -2.25], "<f4").tobytes()
+    assert typed_array([], "i2") == {"dtype": "i2", "bdata": ""}
+
+
+def test_get_viewport():
+    """ Function must return the bounds of the map view with a margin """
+
+    relayout = {
+        "mapbox.center": {"lon": 2, "lat": 48},
+        "mapbox.zoom": 5,
+        "mapbox._derived": {"coordinates": [[-6, 52], [10, 52], [10, 44], [-6, 44]]},
+    }
+    viewport = get_viewport(relayout)
+
+    assert viewport["lon_min"] < -6 and viewport["lon_max"] > 10
+    assert viewport["lat_min"] < 44 and viewport["lat_max"] > 52
+    assert viewport["zoom"] == 5
+
+    # the view crosses the antimeridian
+    relayout["mapbox._derived"]["coordinates"] = [[170, 10], [190, 10], [190, 0], [170, 0]]
+    viewport = get_viewport(relayout)
+    assert viewport["lon_min"] > viewport["lon_max"]
+
+    # an autosize doesn't move the map
+    assert get_viewport({"autosize": True}, viewport) is viewport
+
+
+def test_get_airplanes_near_airport(monkeypatch):
+    """ Function must return the low airplanes around the airport, nearest first """
+
+    from src.snapshot_store import Snapshot
+
+    monkeypatch.setattr(sys.modules[get_viewport.__module__], "get_airport_position", lambda airport: (49.0, 2.55))
+
+    state = ['39de4f', 'AFR1234 ', 'France', 1664900694, 1664900956, 2.6, 49.1, 1200.0, False, 80.0, 90.0, -5.0, None, 1250.0, '1000', False, 0]
+    states = [
+        state,
+        state[:1] + ['AFR5678 '] + state[2:5] + [2.56, 49.01, None, True, 0.0, 90.0, None] + state[12:],
+        state[:1] + ['DLH1 '] + state[2:7] + [10000.0] + state[8:],
+        state[:1] + ['BAW2 '] + state[2:5] + [0.1, 51.5] + state[7:],
+    ]
+    snapshot = Snapshot.build(1, get_opensky_df({"time": 1664900956, "states": states}))
+
+    df = get_airplanes_near_airport(snapshot, "CDG", radius_km=50, max_altitude=3000)
+
+    assert list(df.Callsign) == ["AFR5678", "AFR1234"]
+    assert list(df.Phase) == ["On ground", "Arriving"]
+    assert df["Distance (km)"].iloc[0] < df["Distance (km)"].iloc[1] < 50
+
+    monkeypatch.setattr(sys.modules[get_viewport.__module__], "get_airport_position", lambda airport: "")
+    assert get_airplanes_near_airport(snapshot, "XXX").empty
+
+
+def test_flight_view():
+    """ Function must flatten the flight and add the airport and airline names """
+
+    flight = {
+        "OperatingCarrier": {"AirlineID": "LH", "FlightNumber": "400"},
+        "Departure": {
+            "AirportCode": "FRA",
+            "Scheduled": {"Date": "2023-01-01", "Time": "10:00"},
+            "Actual": {"Date": "2023-01-01", "Time": "10:12"},
+            "Terminal": {"Name": "1", "Gate": "B20"},
+        },
+        "Arrival": {
+            "AirportCode": "JFK",
+            "Scheduled": {"Date": "2023-01-01", "Time": "12:45"},
+        },
+        "Status": {"Code": "DP", "Description": "Flight Departed"},
+    }
+
+    view = flight_view(flight)
+
+    assert view["flight"] == "LH400"
+    assert view["carrier"] == "Lufthansa"
+    assert view["dep_airport"] == "Frankfurt"
+    assert view["dep_actual"] == "10:12"
+    assert view["dep_terminal_gate"] == "1/B20"
+    assert view["arr_actual"] == ""
+    assert view["arr_terminal_gate"] == ""
+    assert view["status"] == "Flight Departed"
+    assert flight_view_replace(flight)._filter == {"carrier_code": "LH", "flight_number": "400"}
+
+
+def test_board_query():
+    """ Function must translate the DataTable filters of a board in query conditions """
+
+    conditions = board_query("arrivals", '{Carrier} icontains "lh" && {Scheduled} >= 10:00 && {Unknown} = 1')
+
+    assert conditions == [
+        {"OperatingCarrier.AirlineID": {"$regex": "lh", "$options": "i"}},
+        {"Arrival.Scheduled.Time": {"$gte": "10:00"}},
+    ]
+    assert board_query("departures", '{Flight} s= LH400') == [
+        {"$expr": {"$eq": [{"$concat": ["$OperatingCarrier.AirlineID", "$OperatingCarrier.FlightNumber"]}, "LH400"]}}
+    ]
+    assert board_query("departures", "") == []
+
+
+def test_list_available_airports(monkeypatch):
+    """ Function must list each airport of the flights_view once, with its name """
+
+    import mongomock
+
+    db = mongomock.MongoClient().db
+    monkeypatch.setattr(sys.modules[list_available_airports.__module__].mongo, "get_db", lambda: db)
+    db.flights_view.insert_many([
+        {"dep_iata": "FRA", "arr_iata": "CDG"},
+        {"dep_iata": "MUC", "arr_iata": "FRA"},
+    ])
+
+    airports = list_available_airports()
+
+    assert airports.iata.tolist() == ["CDG", "FRA", "MUC"]
+    assert airports.airport[1] == "Frankfurt"
+
+
+@pytest.mark.parametrize("total", [None, "150"])
+def test_update_airport_flights_links(monkeypatch, total):
+    """ Function must stop at a link to a page already fetched or past the count """
+
+    import mongomock
+
+    module = sys.modules[update_airport_flights.__module__]
+    monkeypatch.setattr(module.mongo, "get_db", lambda: mongomock.MongoClient().db)
+    monkeypatch.setattr(module, "bulk_upsert_flights", lambda col, flights, view_col: len(flights))
+    monkeypatch.setattr(module.c, "CFI_PAGE_SIZE", 100)
+    requested = []
+
+    def get(url, endpoint, headers=None):
+        requested.append(url)
+        # without count, the second page links back to the first one
+        next_url = url + "&next" if total or len(requested) == 1 else requested[0]
+        payload = {
+            "FlightInformation": {
+                "Flights": {"Flight": {"OperatingCarrier": {"AirlineID": "LH", "FlightNumber": "400"}}},
+                "Meta": {"TotalCount": total, "Link": [{"@Rel": "next", "@Href": next_url}]},
+            }
+        }
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(payload).encode()
+        return response
+
+    monkeypatch.setattr(module.http_client, "get", get)
 
-    client.close()
+    update_airport_flights("arrivals", "FRA", "2024-01-01T08:00")
 
+    assert len(requested) == 2